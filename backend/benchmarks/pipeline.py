@@ -0,0 +1,391 @@
+"""
+End-to-end benchmark of the create scenario -> analyze -> poll job flow.
+
+Starts fake_openai_server.py and the app (create_app under a threaded
+Werkzeug WSGI server) as subprocesses, drives them with concurrent clients
+and writes a JSON report: p50/p95/p99 per endpoint, jobs/sec, job
+completion times, database queries per request and peak RSS.
+
+    python benchmarks/pipeline.py --clients 20 --jobs 200 --output results.json
+    python benchmarks/pipeline.py --database-url postgresql://localhost/impactlens_bench --output pg.json
+    python benchmarks/pipeline.py compare baseline.json results.json
+
+Any other app setting (ANALYSIS_ENGINE, JOB_QUEUE_MODE, ...) is taken from
+the environment as usual. Without --database-url a throwaway SQLite file is used.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CREATE_SCENARIO = "POST /api/scenarios"
+ANALYZE = "POST /api/scenarios/<int:scenario_id>/analyze"
+JOB_STATUS = "GET /api/jobs/<job_id>"
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50": _ms(percentile(values, 0.50)),
+        "p95": _ms(percentile(values, 0.95)),
+        "p99": _ms(percentile(values, 0.99)),
+        "mean": _ms(sum(values) / len(values)) if values else None,
+        "max": _ms(max(values)) if values else None,
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# --- App process -------------------------------------------------------------
+
+def serve(port):
+    """Run create_app() under a threaded WSGI server, counting database queries per endpoint."""
+    import resource
+    from flask import jsonify, request
+    from sqlalchemy import event
+    from werkzeug.serving import make_server
+
+    sys.path.insert(0, BACKEND_DIR)
+    from project import create_app
+    from project.models import db
+
+    app = create_app()
+    # demo-login issues integer subjects, which newer PyJWT rejects on decode
+    app.config["JWT_VERIFY_SUB"] = False
+
+    lock = threading.Lock()
+    endpoints = {}
+    background = {"queries": 0}
+    in_request = threading.local()
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(conn, cursor, statement, parameters, context, executemany):
+        counter = getattr(in_request, "counter", None)
+        if counter is not None:
+            counter[0] += 1
+        else:
+            # Job threads run outside any request
+            with lock:
+                background["queries"] += 1
+
+    @app.before_request
+    def start_counting():
+        in_request.counter = [0]
+
+    @app.teardown_request
+    def stop_counting(error=None):
+        counter = getattr(in_request, "counter", None)
+        in_request.counter = None
+        if counter is None or request.url_rule is None:
+            return
+        label = f"{request.method} {request.url_rule.rule}"
+        with lock:
+            stats = endpoints.setdefault(label, {"requests": 0, "queries": 0})
+            stats["requests"] += 1
+            stats["queries"] += counter[0]
+
+    def bench_stats():
+        with lock:
+            return jsonify({
+                "endpoints": endpoints,
+                "background_queries": background["queries"],
+                # KiB on Linux
+                "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                "database": engine.dialect.name,
+            })
+
+    app.add_url_rule("/__bench/stats", "bench_stats", bench_stats)
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    print(f"📈 Benchmark app listening on {port}", flush=True)
+    server.serve_forever()
+
+
+# --- Load generator ----------------------------------------------------------
+
+class LoadRun:
+    def __init__(self, base_url, clients, jobs, poll_interval, job_timeout, repeat_scenarios):
+        self.base_url = base_url
+        self.clients = clients
+        self.jobs = jobs
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.repeat_scenarios = repeat_scenarios
+        self.latencies = {}
+        self.errors = {}
+        self.job_times = []
+        self.outcomes = {}
+        self.service_used = {}
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def _take(self):
+        with self._lock:
+            if self._next >= self.jobs:
+                return None
+            self._next += 1
+            return self._next
+
+    def _record(self, label, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(label, []).append(seconds)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+    def _count(self, bucket, key):
+        with self._lock:
+            bucket[key] = bucket.get(key, 0) + 1
+
+    def _call(self, session, label, method, path, **kwargs):
+        start = time.perf_counter()
+        response = session.request(method, self.base_url + path, timeout=60, **kwargs)
+        self._record(label, time.perf_counter() - start, response.status_code < 400)
+        return response
+
+    def _client(self, token):
+        session = requests.Session()
+        session.headers["Authorization"] = f"Bearer {token}"
+        while True:
+            n = self._take()
+            if n is None:
+                return
+            brand = f"Bench {n % 10}" if self.repeat_scenarios else f"Bench {n}"
+            response = self._call(session, CREATE_SCENARIO, "POST", "/api/scenarios", json={
+                "brand_a": brand, "brand_b": "Maison Test", "partnership_type": "Collaboration",
+                "target_audience": "Luxury buyers 25-40", "budget_range": "$1M-$5M"
+            })
+            if response.status_code != 201:
+                self._count(self.outcomes, f"create_{response.status_code}")
+                continue
+
+            started = time.perf_counter()
+            response = self._call(session, ANALYZE, "POST", f"/api/scenarios/{response.json()['id']}/analyze")
+            if response.status_code != 202:
+                self._count(self.outcomes, f"analyze_{response.status_code}")
+                continue
+            job_id = response.json()["job_id"]
+
+            while True:
+                status = self._call(session, JOB_STATUS, "GET", f"/api/jobs/{job_id}").json()
+                if status.get("status") in ("completed", "failed"):
+                    with self._lock:
+                        self.job_times.append(time.perf_counter() - started)
+                    self._count(self.outcomes, status["status"])
+                    if status["status"] == "completed":
+                        self._count(self.service_used, status["analysis"].get("service_used"))
+                    break
+                if time.perf_counter() - started > self.job_timeout:
+                    self._count(self.outcomes, "timed_out")
+                    break
+                time.sleep(self.poll_interval)
+
+    def run(self):
+        token = requests.post(self.base_url + "/api/auth/demo-login", timeout=30).json()["access_token"]
+        threads = [threading.Thread(target=self._client, args=(token,)) for _ in range(self.clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
+
+
+def wait_until_up(url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"{url} process exited with code {process.returncode}")
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def run_benchmark(args):
+    fake_port, app_port = free_port(), free_port()
+    database_url = args.database_url
+    scratch = None
+    if not database_url:
+        scratch = tempfile.mkdtemp(prefix="impactlens-bench-")
+        database_url = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+
+    fake_cmd = [sys.executable, os.path.join(BACKEND_DIR, "fake_openai_server.py"), "--port", str(fake_port),
+                "--seed", str(args.seed), "--latency", args.latency, "--latency-seconds", str(args.latency_seconds),
+                "--error-rate", str(args.error_rate), "--rate-limit-rate", str(args.rate_limit_rate)]
+    if args.trace:
+        fake_cmd += ["--trace", args.trace]
+
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": database_url,
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "sk-benchmark-key"),
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "ANALYSIS_CACHE_ENABLED": env.get("ANALYSIS_CACHE_ENABLED", "false"),
+    })
+    log = open(args.app_log, "w") if args.app_log else subprocess.DEVNULL
+
+    fake = subprocess.Popen(fake_cmd, stdout=subprocess.DEVNULL)
+    app = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--port", str(app_port)],
+                           env=env, cwd=BACKEND_DIR, stdout=log, stderr=log)
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        wait_until_up(f"http://127.0.0.1:{fake_port}/stats", fake)
+        wait_until_up(base_url + "/api/health", app)
+
+        load = LoadRun(base_url, args.clients, args.jobs, args.poll_interval, args.job_timeout, args.repeat_scenarios)
+        elapsed = load.run()
+        server = requests.get(base_url + "/__bench/stats", timeout=10).json()
+        upstream = requests.get(f"http://127.0.0.1:{fake_port}/stats", timeout=10).json()
+    finally:
+        app.terminate()
+        fake.terminate()
+        app.wait(30)
+        fake.wait(30)
+
+    endpoints = {}
+    for label, values in sorted(load.latencies.items()):
+        endpoints[label] = dict(summarize(values), errors=load.errors.get(label, 0))
+        counted = server["endpoints"].get(label)
+        if counted and counted["requests"]:
+            endpoints[label]["queries_per_request"] = round(counted["queries"] / counted["requests"], 2)
+
+    finished = len(load.job_times)
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "database": server["database"],
+            "clients": args.clients,
+            "jobs": args.jobs,
+            "latency_profile": {"kind": args.latency, "seconds": args.latency_seconds, "seed": args.seed},
+            "engine": os.getenv("ANALYSIS_ENGINE", "threads"),
+            "queue_mode": os.getenv("JOB_QUEUE_MODE", "local"),
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "jobs": {
+            "finished": finished,
+            "jobs_per_sec": round(finished / elapsed, 3) if elapsed else None,
+            "completion_ms": summarize(load.job_times),
+            "outcomes": load.outcomes,
+            "service_used": load.service_used,
+            "background_queries_per_job": round(server["background_queries"] / finished, 2) if finished else None,
+        },
+        "endpoints": endpoints,
+        "peak_rss_mb": round(server["peak_rss_kb"] / 1024, 1),
+        "upstream": upstream,
+    }
+
+
+def compare(baseline_path, current_path):
+    """Print relative change of the headline numbers between two reports."""
+    with open(baseline_path) as baseline_file, open(current_path) as current_file:
+        baseline, current = json.load(baseline_file), json.load(current_file)
+
+    def change(old, new):
+        if not old or new is None:
+            return "n/a"
+        return f"{(new - old) / old:+.1%}"
+
+    rows = [("jobs/sec", baseline["jobs"]["jobs_per_sec"], current["jobs"]["jobs_per_sec"]),
+            ("job p95 ms", baseline["jobs"]["completion_ms"]["p95"], current["jobs"]["completion_ms"]["p95"]),
+            ("peak RSS MB", baseline["peak_rss_mb"], current["peak_rss_mb"])]
+    for label, stats in current["endpoints"].items():
+        old = baseline["endpoints"].get(label, {})
+        rows.append((f"{label} p95 ms", old.get("p95"), stats["p95"]))
+        rows.append((f"{label} queries", old.get("queries_per_request"), stats.get("queries_per_request")))
+
+    print(f"{baseline['meta']['commit']} -> {current['meta']['commit']}")
+    for label, old, new in rows:
+        print(f"  {label:<60} {str(old):>10} {str(new):>10} {change(old, new):>8}")
+
+
+def print_summary(report):
+    jobs = report["jobs"]
+    print(f"\n{report['meta']['database']} | {jobs['finished']} jobs in {report['elapsed_seconds']}s "
+          f"= {jobs['jobs_per_sec']} jobs/sec | peak RSS {report['peak_rss_mb']} MB")
+    print(f"  job completion ms: p50 {jobs['completion_ms']['p50']} p95 {jobs['completion_ms']['p95']} "
+          f"p99 {jobs['completion_ms']['p99']} | outcomes {jobs['outcomes']}")
+    for label, stats in report["endpoints"].items():
+        print(f"  {label:<48} n={stats['count']:<6} p50 {stats['p50']:>8} p95 {stats['p95']:>8} "
+              f"p99 {stats['p99']:>8} ms  queries/req {stats.get('queries_per_request')}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["serve"]:
+        parser = argparse.ArgumentParser(prog="pipeline.py serve")
+        parser.add_argument("--port", type=int, required=True)
+        serve(parser.parse_args(argv[1:]).port)
+        return
+    if argv[:1] == ["compare"]:
+        parser = argparse.ArgumentParser(prog="pipeline.py compare")
+        parser.add_argument("baseline")
+        parser.add_argument("current")
+        options = parser.parse_args(argv[1:])
+        compare(options.baseline, options.current)
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline end to end")
+    parser.add_argument("--clients", type=int, default=10, help="concurrent simulated clients")
+    parser.add_argument("--jobs", type=int, default=100, help="total scenarios to create and analyze")
+    parser.add_argument("--database-url", help="PostgreSQL URL; a temporary SQLite file by default")
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--job-timeout", type=float, default=120)
+    parser.add_argument("--repeat-scenarios", action="store_true", help="reuse 10 scenario shapes to exercise cache/coalescing")
+    parser.add_argument("--latency", choices=("fixed", "lognormal", "trace"), default="lognormal")
+    parser.add_argument("--latency-seconds", type=float, default=0.8)
+    parser.add_argument("--trace")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--app-log", help="file for the app's log output")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args)
+    print_summary(report)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
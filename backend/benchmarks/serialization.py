@@ -0,0 +1,125 @@
+"""
+Micro-benchmark of API response serialization.
+
+Encodes representative payloads (a completed job status, a page of job
+group results) with the stdlib-backed Flask JSON provider and the orjson
+provider, for both the old result shape (key_risks etc. as JSON-encoded
+strings) and native JSON lists, and reports response size and encode time.
+
+    python benchmarks/serialization.py --iterations 2000 --output serialization.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from project.json_provider import OrjsonProvider, orjson  # noqa: E402
+
+LIST_FIELDS = ("key_risks", "recommendations", "market_insights")
+
+
+def analysis_result(result_id, native=True):
+    rng = random.Random(result_id)
+    result = {
+        "id": result_id,
+        "scenario_id": result_id,
+        "job_id": f"{result_id:08d}-0000-4000-8000-000000000000",
+        "brand_alignment_score": rng.randint(40, 95),
+        "audience_overlap_percentage": rng.randint(20, 90),
+        "roi_projection": rng.randint(60, 250),
+        "risk_level": rng.choice(["Low", "Medium", "High"]),
+        "key_risks": [f"Risk {i}: brand dilution in a core luxury segment" for i in range(4)],
+        "recommendations": [f"Recommendation {i}: phase the launch by region" for i in range(5)],
+        "market_insights": [f"Insight {i}: collaborations drive Gen Z demand" for i in range(4)],
+        "tokens_used": rng.randint(600, 1400),
+        "analysis_duration": rng.uniform(2, 12),
+        "service_used": "openai",
+        "service_reason": "openai_available",
+    }
+    if not native:
+        # Shape before native JSON columns: lists stored and returned as JSON strings
+        for field in LIST_FIELDS:
+            result[field] = json.dumps(result[field])
+    return result
+
+
+def payloads(native):
+    job_status = {"job_id": "job-1", "status": "completed", "progress": 100, "analysis": analysis_result(1, native)}
+    group_status = {
+        "group_id": "group-1",
+        "status": "completed",
+        "created_at": datetime(2025, 1, 1).isoformat(),
+        "jobs": [
+            {"job_id": f"job-{i}", "status": "completed", "progress": 100, "analysis": analysis_result(i, native)}
+            for i in range(200)
+        ],
+    }
+    return {"job_status": job_status, "job_group_200": group_status}
+
+
+def time_encode(provider, payload, iterations):
+    # Encode once outside the timing to warm up caches
+    body = provider.dumps(payload)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        provider.dumps(payload)
+    elapsed = time.perf_counter() - start
+    return len(body.encode()), elapsed / iterations * 1e6
+
+
+def run(iterations):
+    app = Flask(__name__)
+    providers = {"stdlib": DefaultJSONProvider(app)}
+    if orjson is not None:
+        providers["orjson"] = OrjsonProvider(app)
+
+    results = []
+    for shape, native in (("string_lists", False), ("native_lists", True)):
+        for name, payload in payloads(native).items():
+            for provider_name, provider in providers.items():
+                size, micros = time_encode(provider, payload, iterations)
+                results.append({
+                    "payload": name,
+                    "shape": shape,
+                    "encoder": provider_name,
+                    "bytes": size,
+                    "encode_us": round(micros, 2),
+                })
+    return {
+        "started_at": datetime.utcnow().isoformat(),
+        "iterations": iterations,
+        "orjson_available": orjson is not None,
+        "results": results,
+    }
+
+
+def print_table(report):
+    print(f"{'payload':<16}{'shape':<15}{'encoder':<9}{'bytes':>10}{'encode us':>12}")
+    for row in report["results"]:
+        print(f"{row['payload']:<16}{row['shape']:<15}{row['encoder']:<9}{row['bytes']:>10}{row['encode_us']:>12.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark API response serialization")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = run(args.iterations)
+    print_table(report)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
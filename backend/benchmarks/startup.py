@@ -0,0 +1,172 @@
+"""
+Cold start report: import cost per module and package, create_app time and
+the first request, each measured in a fresh interpreter.
+
+    python benchmarks/startup.py --runs 5 --output startup.json
+    python benchmarks/startup.py --max-import-ms 900 --max-create-app-ms 150 --forbid openai,numpy
+
+Each run starts `python -X importtime`, imports the project, calls
+create_app against a throwaway SQLite file (AUTO_MIGRATE=false, as in a
+deployment) and serves GET /api/health through the test client. The report
+keeps the median of each phase, the slowest modules by cumulative import
+time, self time summed per top-level package, and which --forbid modules
+were loaded by the time create_app returned. With any of the --max-* or
+--forbid options it exits non-zero when a budget is broken, for CI.
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+# Runs in the child interpreter; prints one JSON line of phase timings
+CHILD = """
+import sys, json, time
+started = time.perf_counter()
+sys.path.insert(0, {backend!r})
+from project import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+loaded = sorted(name for name in {forbid!r} if name in sys.modules)
+response = app.test_client().get("/api/health")
+served = time.perf_counter()
+print("STARTUP " + json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_request_ms": (served - created) * 1000,
+    "first_request_status": response.status_code,
+    "loaded_at_startup": loaded,
+}}))
+"""
+
+
+def parse_importtime(stderr):
+    """(module, self us, cumulative us, depth) for each `import time:` line."""
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return modules
+
+
+def run_once(forbid):
+    with tempfile.TemporaryDirectory() as workdir:
+        env = dict(os.environ)
+        env.update({
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+            "AUTO_MIGRATE": "false",
+            "OPENAI_API_KEY": env.get("OPENAI_API_KEY") or "sk-startup-report",
+            "PYTHONDONTWRITEBYTECODE": "1",
+        })
+        child = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", CHILD.format(backend=BACKEND_DIR, forbid=forbid)],
+            capture_output=True, text=True, env=env, cwd=workdir, timeout=120,
+        )
+    lines = [line for line in child.stdout.splitlines() if line.startswith("STARTUP ")]
+    if child.returncode != 0 or not lines:
+        raise SystemExit(f"Startup run failed (exit {child.returncode}):\n{child.stderr[-2000:]}")
+    return json.loads(lines[-1][len("STARTUP "):]), parse_importtime(child.stderr)
+
+
+def run(runs, forbid, top):
+    phases, imports = [], []
+    for _ in range(runs):
+        timings, modules = run_once(forbid)
+        phases.append(timings)
+        imports.append({name: (self_us, cumulative_us) for name, self_us, cumulative_us, _ in modules})
+
+    modules = {}
+    for run_imports in imports:
+        for name, (self_us, cumulative_us) in run_imports.items():
+            modules.setdefault(name, []).append((self_us, cumulative_us))
+    per_module = {
+        name: {
+            "self_ms": round(statistics.median(sample[0] for sample in samples) / 1000, 2),
+            "cumulative_ms": round(statistics.median(sample[1] for sample in samples) / 1000, 2),
+        }
+        for name, samples in modules.items()
+    }
+    packages = {}
+    for name, cost in per_module.items():
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0.0) + cost["self_ms"]
+
+    return {
+        "runs": runs,
+        "python": sys.version.split()[0],
+        "import_ms": round(statistics.median(p["import_ms"] for p in phases), 1),
+        "create_app_ms": round(statistics.median(p["create_app_ms"] for p in phases), 1),
+        "first_request_ms": round(statistics.median(p["first_request_ms"] for p in phases), 1),
+        "first_request_status": phases[-1]["first_request_status"],
+        "loaded_at_startup": phases[-1]["loaded_at_startup"],
+        "modules_imported": len(per_module),
+        "slowest_modules": sorted(
+            ({"module": name, **cost} for name, cost in per_module.items()),
+            key=lambda row: row["cumulative_ms"], reverse=True
+        )[:top],
+        "packages": dict(sorted(((name, round(ms, 1)) for name, ms in packages.items()),
+                                key=lambda item: item[1], reverse=True)[:top]),
+    }
+
+
+def check_budgets(report, args):
+    failures = []
+    for phase, limit in (("import_ms", args.max_import_ms), ("create_app_ms", args.max_create_app_ms),
+                         ("first_request_ms", args.max_first_request_ms)):
+        if limit is not None and report[phase] > limit:
+            failures.append(f"{phase} {report[phase]:.1f} > {limit:.1f}")
+    if report["loaded_at_startup"]:
+        failures.append(f"loaded at startup: {', '.join(report['loaded_at_startup'])}")
+    if report["first_request_status"] != 200:
+        failures.append(f"GET /api/health returned {report['first_request_status']}")
+    return failures
+
+
+def print_report(report):
+    print(f"import {report['import_ms']:.1f} ms, create_app {report['create_app_ms']:.1f} ms, "
+          f"first request {report['first_request_ms']:.1f} ms (median of {report['runs']} runs, "
+          f"{report['modules_imported']} modules)")
+    print(f"\n{'module':<50}{'cumulative ms':>15}{'self ms':>10}")
+    for row in report["slowest_modules"]:
+        print(f"{row['module']:<50}{row['cumulative_ms']:>15.1f}{row['self_ms']:>10.1f}")
+    print(f"\n{'package':<50}{'self ms':>15}")
+    for package, ms in report["packages"].items():
+        print(f"{package:<50}{ms:>15.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report import and startup cost")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=20, help="modules and packages to list")
+    parser.add_argument("--forbid", default="", help="comma-separated modules that must not load at startup")
+    parser.add_argument("--max-import-ms", type=float)
+    parser.add_argument("--max-create-app-ms", type=float)
+    parser.add_argument("--max-first-request-ms", type=float)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    forbid = [name.strip() for name in args.forbid.split(",") if name.strip()]
+    report = run(args.runs, forbid, args.top)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+    failures = check_budgets(report, args)
+    if failures:
+        print("\nStartup budget exceeded:\n  " + "\n  ".join(failures))
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+OpenAI-compatible stand-in server for exercising the real OpenAIService
+code path (HTTP client, connection pool, timeouts, response parsing) offline.
+
+    python fake_openai_server.py --port 8089 --latency lognormal --latency-seconds 0.8 --seed 7
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=fake python run.py
+
+Serves POST /v1/chat/completions, plain and streamed, with scenario-shaped
+analysis JSON, GET /v1/models, and GET /stats with request counts per
+outcome. Latency and injected failures come from a seeded generator, so a
+run with the same seed and request order is reproducible.
+"""
+import re
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+OUTCOMES = ("ok", "server_error", "rate_limited", "truncated", "non_json", "bad_content")
+
+
+class LatencyProfile:
+    """Seeded response latency: fixed, lognormal around a median, or replayed from a trace."""
+
+    def __init__(self, kind="fixed", seconds=0.8, sigma=0.5, trace=None, seed=0):
+        self.kind = kind
+        self.seconds = seconds
+        self.sigma = sigma
+        self.trace = trace or []
+        self._rng = random.Random(seed)
+        self._position = 0
+        self._lock = threading.Lock()
+        if kind == "trace" and not self.trace:
+            raise ValueError("trace latency profile needs a non-empty trace")
+
+    @classmethod
+    def load_trace(cls, path):
+        """Latencies in seconds, one per line, either bare numbers or JSON objects with "latency" or "analysis_duration"."""
+        latencies = []
+        with open(path) as trace_file:
+            for line in trace_file:
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith("{"):
+                    record = json.loads(line)
+                    latencies.append(float(record.get("latency", record.get("analysis_duration", 0))))
+                else:
+                    latencies.append(float(line))
+        return latencies
+
+    def sample(self):
+        with self._lock:
+            if self.kind == "lognormal":
+                return self._rng.lognormvariate(math.log(self.seconds), self.sigma)
+            if self.kind == "trace":
+                latency = self.trace[self._position % len(self.trace)]
+                self._position += 1
+                return latency
+            return self.seconds
+
+
+class FailureProfile:
+    """Seeded choice of outcome per request from the configured injection rates."""
+
+    def __init__(self, rates=None, seed=0):
+        self.rates = rates or {}
+        if sum(self.rates.values()) > 1:
+            raise ValueError("failure rates add up to more than 1")
+        self._rng = random.Random(seed + 1)
+        self._lock = threading.Lock()
+
+    def choose(self):
+        with self._lock:
+            roll = self._rng.random()
+        for outcome in OUTCOMES[1:]:
+            rate = self.rates.get(outcome, 0)
+            if roll < rate:
+                return outcome
+            roll -= rate
+        return "ok"
+
+
+def build_analysis(prompt, seed=0):
+    """Analysis JSON for the scenario in prompt, stable for the same prompt and seed."""
+    fields = dict(re.findall(r"- (Brand A|Brand B|Partnership Type|Target Audience): (.*)", prompt))
+    brand_a = fields.get("Brand A", "Brand A").strip()
+    brand_b = fields.get("Brand B", "Brand B").strip()
+    partnership_type = fields.get("Partnership Type", "collaboration").strip()
+    digest = hashlib.sha256(f"{seed}:{prompt}".encode()).digest()
+    return {
+        "brand_alignment_score": 60 + digest[0] % 36,
+        "audience_overlap_percentage": 40 + digest[1] % 46,
+        "roi_projection": 100 + digest[2] % 151,
+        "risk_level": ("Low", "Medium", "High")[digest[3] % 3],
+        "key_risks": [
+            f"Brand dilution risk for {brand_a} in a {partnership_type.lower()}",
+            f"Audience mismatch between {brand_a} and {brand_b} customers",
+            "Execution and timeline risk"
+        ],
+        "recommendations": [
+            f"Pilot the {partnership_type.lower()} in a limited market first",
+            f"Align {brand_a} and {brand_b} creative direction early",
+            "Define success metrics before launch"
+        ],
+        "market_insights": [
+            f"Collaborations like {brand_a} x {brand_b} drive strong social engagement",
+            "Limited editions sustain demand in the luxury segment",
+            "Younger luxury buyers respond to cross-category partnerships"
+        ]
+    }
+
+
+def build_content(prompt, seed=0):
+    """A single analysis, or {"analyses": [...]} for a packed prompt with **Scenario N:** blocks."""
+    blocks = re.split(r"\*\*Scenario (\d+):\*\*", prompt)
+    if len(blocks) < 3:
+        return build_analysis(prompt, seed)
+    return {"analyses": [
+        dict(scenario=int(number), **build_analysis(block, seed))
+        for number, block in zip(blocks[1::2], blocks[2::2])
+    ]}
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency, failures, model="gpt-4.1-nano", seed=0, retry_after=1):
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency = latency
+        self.failures = failures
+        self.model = model
+        self.seed = seed
+        self.retry_after = retry_after
+        self.counts = {outcome: 0 for outcome in OUTCOMES}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def begin(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def end(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": sum(self.counts.values()),
+                "outcomes": dict(self.counts),
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight
+            }
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeOpenAIServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.stats())
+        elif self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": self.server.model, "object": "model", "owned_by": "fake"}]})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        try:
+            request = json.loads(body)
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Request body is not JSON", "type": "invalid_request_error"}})
+            return
+
+        outcome = self.server.failures.choose()
+        self.server.begin(outcome)
+        try:
+            self._complete(request, outcome)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (e.g. its timeout fired); nothing left to answer
+            self.close_connection = True
+        finally:
+            self.server.end()
+
+    def _complete(self, request, outcome):
+        latency = self.server.latency.sample()
+        if outcome == "rate_limited":
+            self.send_response(429)
+            self.send_header("Retry-After", str(self.server.retry_after))
+            self._write_json({"error": {"message": "Rate limit reached (injected)", "type": "requests", "code": "rate_limit_exceeded"}})
+            return
+        if outcome == "server_error":
+            time.sleep(latency)
+            self._send_json(500, {"error": {"message": "Internal server error (injected)", "type": "server_error"}})
+            return
+
+        prompt = " ".join(message.get("content") or "" for message in request.get("messages", []))
+        content = json.dumps(build_content(prompt, self.server.seed))
+        if outcome == "bad_content":
+            content = "I'm sorry, I can't produce JSON for this partnership right now."
+        model = request.get("model", self.server.model)
+        usage = {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": len(prompt) // 4 + len(content) // 4
+        }
+
+        if request.get("stream"):
+            self._stream(content, model, usage, latency, outcome, request.get("stream_options") or {})
+            return
+
+        time.sleep(latency)
+        if outcome == "non_json":
+            self._send_raw(200, b"<html><body>502 Bad Gateway</body></html>", "application/json")
+            return
+        payload = json.dumps({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": usage
+        }).encode()
+        if outcome == "truncated":
+            # Promise the full body but hang up halfway through it
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload[:len(payload) // 2])
+            self.close_connection = True
+            return
+        self._send_raw(200, payload, "application/json")
+
+    def _stream(self, content, model, usage, latency, outcome, stream_options):
+        """Server-sent chunks: ~30% of the latency before the first token, the rest spread over the chunks."""
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+        gap = latency * 0.7 / max(len(pieces), 1)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        time.sleep(latency * 0.3)
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+
+        if outcome == "non_json":
+            self._event("upstream connection reset")
+            return
+        for position, piece in enumerate(pieces):
+            if outcome == "truncated" and position == len(pieces) // 2:
+                return
+            self._event(json.dumps(chunk({"content": piece} if position else {"role": "assistant", "content": piece})))
+            time.sleep(gap)
+        self._event(json.dumps(chunk({}, "stop")))
+        if stream_options.get("include_usage"):
+            self._event(json.dumps(dict(chunk({}), choices=[], usage=usage)))
+        self._event("[DONE]")
+
+    def _event(self, data):
+        self.wfile.write(f"data: {data}\n\n".encode())
+        self.wfile.flush()
+
+    def _send_json(self, status, payload):
+        self.send_response(status)
+        self._write_json(payload)
+
+    def _write_json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_raw(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def build_server(args):
+    trace = LatencyProfile.load_trace(args.trace) if args.trace else None
+    latency = LatencyProfile(args.latency, args.latency_seconds, args.latency_sigma, trace, args.seed)
+    failures = FailureProfile({
+        "server_error": args.error_rate,
+        "rate_limited": args.rate_limit_rate,
+        "truncated": args.truncate_rate,
+        "non_json": args.non_json_rate,
+        "bad_content": args.bad_content_rate
+    }, args.seed)
+    return FakeOpenAIServer((args.host, args.port), latency, failures, args.model, args.seed, args.retry_after)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stand-in for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", default="gpt-4.1-nano")
+    parser.add_argument("--latency", choices=("fixed", "lognormal", "trace"), default="fixed")
+    parser.add_argument("--latency-seconds", type=float, default=0.8, help="fixed latency, or lognormal median")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal shape")
+    parser.add_argument("--trace", help="file of recorded latencies for --latency trace")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="share of bodies cut off halfway")
+    parser.add_argument("--non-json-rate", type=float, default=0.0, help="share of bodies that aren't JSON")
+    parser.add_argument("--bad-content-rate", type=float, default=0.0, help="share of completions whose content isn't JSON")
+    args = parser.parse_args(argv)
+    if args.latency == "trace" and not args.trace:
+        parser.error("--latency trace needs --trace")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = build_server(args)
+    print(f"🧪 Fake OpenAI server on http://{args.host}:{args.port}/v1 ({args.latency} latency, seed {args.seed})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
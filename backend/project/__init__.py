@@ -1,23 +1,36 @@
 import os
+import time
 import logging
 from datetime import timedelta
 
-from flask import Flask, send_from_directory, jsonify
+from flask import Flask, Response, g, request, send_from_directory, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
 
 # Import database instance
 from .models import db
-
-# Load environment variables
-load_dotenv()
+from .json_provider import create_json_provider
+from .database import POOL_STATS, configure_engine, engine_options
+from .lazy import LazyService
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(levelname)s in %(module)s: %(message)s")
 
+def _similarity_index():
+    from .services.similarity_index import SimilarityIndex
+    return SimilarityIndex()
+
+def _openai_service(analysis_cache, similarity_index):
+    # Use hybrid service that tries OpenAI first, falls back to mock
+    from .services.hybrid_openai_service import HybridOpenAIService
+    return HybridOpenAIService(cache=analysis_cache, similarity_index=similarity_index)
+
 def create_app():
+    # Here rather than at import so importing the package has no side effects
+    load_dotenv()
     app = Flask(__name__, static_folder="static")
+    app.json = create_json_provider(app)
 
     # --- Configuration ---
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "impactlens_secret_key_2024")
@@ -40,6 +53,7 @@ def create_app():
         logging.info("Using SQLite database (local)")
     
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 
     # --- Initialize Extensions ---
     # Fix CORS to include the specific Vercel domain
@@ -53,11 +67,14 @@ def create_app():
     ]
     CORS(app, origins=cors_origins, supports_credentials=True, 
          methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'],
-         allow_headers=['Content-Type', 'Authorization'])
+         allow_headers=['Content-Type', 'Authorization'],
+         expose_headers=['X-Next-Cursor', 'Link'])
     logging.info(f"CORS configured for origins: {cors_origins}")
     
     jwt = JWTManager(app)
     db.init_app(app)
+    with app.app_context():
+        configure_engine(db.engine)
 
     # --- JWT Error Handlers ---
     @jwt.expired_token_loader
@@ -72,41 +89,111 @@ def create_app():
     def missing_token_callback(error):
         return jsonify({"error": "Authorization token required"}), 401
 
+    # Event-stream tokens travel in URLs, so they open that stream and nothing else
+    @jwt.token_verification_loader
+    def stream_token_scope_callback(jwt_header, jwt_payload):
+        from .services.job_events import STREAM_TOKEN_SCOPE
+        return jwt_payload.get("scope") != STREAM_TOKEN_SCOPE or request.endpoint == "analysis.stream_job_events"
+
+    @jwt.token_verification_failed_loader
+    def token_verification_failed_callback(jwt_header, jwt_payload):
+        return jsonify({"error": "Invalid token"}), 401
+
     # --- Import and Initialize Services ---
-    # Use hybrid service that tries OpenAI first, falls back to mock
-    from .services.hybrid_openai_service import HybridOpenAIService
-    openai_service = HybridOpenAIService()
+    from .services.analysis_cache import AnalysisCache
+    analysis_cache = AnalysisCache()
+    # NumPy and the on-disk index are only loaded when similar-scenario search or routing first needs them
+    similarity_index = LazyService(_similarity_index)
+    # The analysis service (breaker, rate scheduler, router, mock fallback) is built by the first
+    # request or job that uses it
+    openai_service = LazyService(lambda: _openai_service(analysis_cache, similarity_index))
     
     from .services import JobService
+    from .services.job_events import create_event_bus
     with app.app_context():
         app.config["openai_service"] = openai_service
-        app.config["job_service"] = JobService(app, app.config["openai_service"])
+        app.config["analysis_cache"] = analysis_cache
+        app.config["job_events"] = create_event_bus(db.engine)
+        app.config["job_service"] = JobService(app, app.config["openai_service"], events=app.config["job_events"])
+        app.config["similarity_index"] = similarity_index
 
     # --- Import and Register Blueprints ---
-    from .routes import user_bp, analysis_bp
+    from .routes import user_bp, analysis_bp, admin_bp, analytics_bp
     app.register_blueprint(user_bp, url_prefix="/api")
     app.register_blueprint(analysis_bp, url_prefix="/api")
-
-    # --- Create Database Tables ---
-    with app.app_context():
-        try:
-            db.create_all()
-            logging.info("Database tables created successfully")
-        except Exception as e:
-            logging.error(f"Database initialization failed: {str(e)}")
+    app.register_blueprint(admin_bp, url_prefix="/api")
+    app.register_blueprint(analytics_bp, url_prefix="/api")
+
+    from .cli import analytics_cli, db_cli, similarity_cli
+    app.cli.add_command(analytics_cli)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(similarity_cli)
+
+    # --- Schema Migrations ---
+    # Deployments run `flask --app run db upgrade` once per release (Procfile release phase) instead
+    # of every boot paying for it; local SQLite keeps upgrading at startup unless AUTO_MIGRATE=false
+    sqlite = app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite")
+    auto_migrate = os.getenv("AUTO_MIGRATE", "true" if sqlite else "false").lower() == "true"
+    if auto_migrate:
+        with app.app_context():
+            try:
+                from .migrations import upgrade
+                upgrade()
+                logging.info("Database tables created successfully")
+            except Exception as e:
+                logging.error(f"Database initialization failed: {str(e)}")
 
     # --- Define Root and Health Check Routes ---
     @app.route("/api/health", methods=["GET"])
     def health_check():
+        # A probe must not build the OpenAI service; until the first analysis needs it these read null
+        built = openai_service.built
         return {
             "status": "healthy", 
             "service": "ImpactLens API", 
             "version": "2.5.0",
             "database": "PostgreSQL" if os.getenv("DATABASE_URL") else "SQLite",
-            "openai_available": hasattr(openai_service, 'openai_service') and openai_service.openai_service is not None,
+            "openai_available": openai_service.openai_service is not None if built else None,
+            "openai_circuit": openai_service.breaker.stats() if built else None,
+            "openai_rate": openai_service.rate_scheduler.stats() if built else None,
+            "analysis_packing": openai_service.packer.stats() if built and openai_service.packer else None,
+            "model_routing": openai_service.router.stats() if built else None,
+            "analysis_queue": app.config["job_service"].queue_stats(),
+            "analysis_cache": analysis_cache.stats(),
+            "database_pool": POOL_STATS.snapshot(db.engine),
             "cors_origins": cors_origins
         }
 
+    # --- Metrics ---
+    from .metrics import REGISTRY, HTTP_REQUEST_DURATION, collect_app_metrics
+    REGISTRY.start_flushing()
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_latency(response):
+        # Blueprint routes only; static files and the SPA fallback would drown them out
+        if request.blueprint and "request_started" in g:
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - g.request_started, method=request.method,
+                                          endpoint=request.endpoint, status=response.status_code)
+        return response
+
+    from .profiling import profiling_enabled, install_request_profiling
+    if profiling_enabled():
+        with app.app_context():
+            install_request_profiling(app, db.engine)
+        logging.info("Request profiling enabled")
+
+    @app.route("/api/metrics", methods=["GET"])
+    def metrics():
+        token = os.getenv("METRICS_TOKEN")
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            return jsonify({"error": "Authorization token required"}), 401
+        body = REGISTRY.render(collectors=[lambda: collect_app_metrics(app)])
+        return Response(body, mimetype="text/plain; version=0.0.4")
+
     @app.route("/", defaults={"path": ""})
     @app.route("/<path:path>")
     def serve(path):
@@ -0,0 +1,32 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from .services.portfolio_analytics import rebuild_aggregates
+
+analytics_cli = AppGroup("analytics", help="Portfolio analytics maintenance.")
+db_cli = AppGroup("db", help="Database schema.")
+similarity_cli = AppGroup("similarity", help="Similar-scenario search index.")
+
+
+@db_cli.command("upgrade")
+def upgrade_command():
+    """Create missing tables, columns and indexes."""
+    from .migrations import upgrade
+    upgrade()
+    click.echo("Database schema is up to date")
+
+
+@analytics_cli.command("rebuild")
+@click.option("--chunk-size", default=10000, show_default=True, help="Results read per batch.")
+def rebuild_command(chunk_size):
+    """Recompute portfolio aggregates from all analysis results."""
+    counts = rebuild_aggregates(chunk_size=chunk_size)
+    click.echo(f"Rebuilt {counts['rows']} aggregate rows from {counts['results']} analysis results")
+
+
+@similarity_cli.command("rebuild")
+def rebuild_similarity_command():
+    """Re-embed every analyzed scenario (and save it when SIMILARITY_INDEX_DIR is set)."""
+    count = current_app.config["similarity_index"].rebuild()
+    click.echo(f"Indexed {count} analyzed scenarios")
@@ -0,0 +1,119 @@
+import os
+import logging
+import threading
+from typing import Any, Dict
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+logger = logging.getLogger(__name__)
+
+
+def engine_profile(database_uri: str) -> str:
+    """"sqlite", "postgresql", or "generic" for any other backend."""
+    backend = make_url(database_uri).get_backend_name()
+    return backend if backend in ("sqlite", "postgresql") else "generic"
+
+
+def engine_options(database_uri: str) -> Dict[str, Any]:
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the database in DATABASE_URL.
+
+    PostgreSQL gets a sized QueuePool (DB_POOL_SIZE + DB_MAX_OVERFLOW should
+    cover ANALYSIS_WORKERS, the request threads and the job event listener,
+    which holds one connection), pre-ping so connections dropped while the
+    dyno slept are replaced instead of failing a request, recycling before
+    server-side idle timeouts, and LIFO checkout so idle connections age out.
+
+    SQLite keeps SQLAlchemy's QueuePool, so each thread checks out a
+    connection of its own for the length of its transaction (never shared
+    concurrently), and waits up to DB_BUSY_TIMEOUT_MS for the write lock
+    instead of failing with "database is locked". Pragmas are set per
+    connection by configure_engine.
+
+    Other backends get the same pool sizing and pre-ping as PostgreSQL but
+    no driver-specific connect_args.
+    """
+    profile = engine_profile(database_uri)
+    if profile == "sqlite":
+        busy_timeout = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000")) / 1000
+        if make_url(database_uri).database in (None, "", ":memory:"):
+            # SQLAlchemy keeps one connection per thread for in-memory databases; nothing to size
+            return {"connect_args": {"timeout": busy_timeout}}
+        return {
+            "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            "connect_args": {
+                "timeout": busy_timeout,
+                "check_same_thread": False,
+            },
+        }
+    options = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": True,
+        "pool_use_lifo": True,
+    }
+    if profile == "postgresql":
+        # libpq connection parameters, understood by psycopg2 and psycopg 3
+        options["connect_args"] = {
+            "connect_timeout": int(os.getenv("DB_CONNECT_TIMEOUT", "10")),
+            "application_name": os.getenv("DB_APPLICATION_NAME", "impactlens"),
+        }
+    return options
+
+
+class PoolStats:
+    """Counts pool events (connections opened, checkouts, invalidations) for /api/health and /api/metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"connects": 0, "checkouts": 0, "invalidations": 0}
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def snapshot(self, engine: Engine) -> Dict[str, Any]:
+        pool = engine.pool
+        stats = {"profile": engine_profile(str(engine.url)), "pool": type(pool).__name__}
+        if hasattr(pool, "checkedout"):
+            stats.update(size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(),
+                         overflow=pool.overflow())
+        with self._lock:
+            stats.update(self.counts)
+        return stats
+
+
+POOL_STATS = PoolStats()
+
+
+def configure_engine(engine: Engine) -> None:
+    """Attach pool counters and, on SQLite, the per-connection pragmas."""
+    event.listen(engine, "connect", lambda dbapi_connection, record: POOL_STATS.count("connects"))
+    event.listen(engine, "checkout", lambda dbapi_connection, record, proxy: POOL_STATS.count("checkouts"))
+    event.listen(engine, "invalidate", lambda dbapi_connection, record, error: POOL_STATS.count("invalidations"))
+
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = {
+        # Readers no longer block the writer (or each other); persistent, but cheap to repeat
+        "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+        # Safe with WAL: a power cut may lose the last commits but never corrupts the file
+        "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout": int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000")),
+    }
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    logger.info(f"SQLite pragmas: {', '.join(f'{name}={value}' for name, value in pragmas.items())}")
@@ -0,0 +1,45 @@
+import os
+import logging
+
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson. Output matches the default
+    provider's (sorted keys, Flask's handling of dates, Decimal, etc.), but
+    encodes several times faster, which shows on large analysis payloads.
+    Calls with extra arguments (indent in debug responses) use the stdlib path.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def create_json_provider(app):
+    """JSON_PROVIDER=auto (default) uses orjson when it is installed; "default" keeps the stdlib encoder."""
+    choice = os.getenv("JSON_PROVIDER", "auto")
+    if choice == "default":
+        return DefaultJSONProvider(app)
+    if orjson is None:
+        if choice == "orjson":
+            logger.warning("JSON_PROVIDER=orjson but orjson is not installed, using the default encoder")
+        return DefaultJSONProvider(app)
+    return OrjsonProvider(app)
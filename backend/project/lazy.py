@@ -0,0 +1,30 @@
+import threading
+from typing import Any, Callable
+
+
+class LazyService:
+    """
+    Stands in for a service in app.config that is built on first attribute
+    access, so create_app doesn't pay for imports and setup (NumPy, loading
+    an index from disk) that a process may never use. Built once, under a
+    lock; `built` tells whether that has happened yet.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def built(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> Any:
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
@@ -0,0 +1,387 @@
+import os
+import json
+import math
+import time
+import atexit
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (name, type, help, labels, value) produced at scrape time by collectors
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            values = {json.dumps(key): _copy(value) for key, value in self._values.items()}
+        return {"type": self.type, "help": self.documentation, "labelnames": list(self.labelnames), "values": values}
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (not cumulative) counts, the last one being +Inf, then sum and count
+                state = self._values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            state["counts"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def snapshot(self) -> Dict:
+        snapshot = super().snapshot()
+        snapshot["buckets"] = list(self.buckets)
+        return snapshot
+
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {"counts": list(value["counts"]), "sum": value["sum"], "count": value["count"]}
+    return value
+
+
+class MetricsRegistry:
+    """
+    Thread-safe registry of counters, gauges and histograms rendered in the
+    Prometheus text exposition format.
+
+    render() also takes collectors, callables run at scrape time that
+    return extra samples (queue occupancy, pool usage, ...) from the
+    scraping process only.
+
+    With METRICS_MULTIPROC_DIR set, every process writes its metrics to
+    <dir>/<pid>.json every METRICS_FLUSH_SECONDS and at exit; a scrape of any
+    process sums counters and histograms across all files, and gauges across
+    processes that are still alive. That lets gunicorn workers share one view.
+    """
+
+    def __init__(self, multiproc_dir: Optional[str] = None, flush_interval: float = None):
+        self.multiproc_dir = multiproc_dir if multiproc_dir is not None else os.getenv("METRICS_MULTIPROC_DIR")
+        self.flush_interval = flush_interval or float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    # --- Multiprocess --------------------------------------------------------
+
+    def start_flushing(self) -> None:
+        """Begin writing this process's metrics to the multiprocess directory (no-op without one)."""
+        if not self.multiproc_dir or self._flusher:
+            return
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+        # Threads don't survive fork, so pre-forked workers (gunicorn --preload) start their own
+        os.register_at_fork(after_in_child=self._restart_in_child)
+
+    def _restart_in_child(self):
+        self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.multiproc_dir:
+            return
+        path = os.path.join(self.multiproc_dir, f"{os.getpid()}.json")
+        try:
+            with open(path + ".tmp", "w") as snapshot_file:
+                json.dump({"pid": os.getpid(), "metrics": self.snapshot()}, snapshot_file)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logger.warning(f"Failed to write metrics snapshot: {str(e)}")
+
+    def _process_snapshots(self) -> List[Tuple[int, Dict]]:
+        snapshots = [(os.getpid(), self.snapshot())]
+        if not self.multiproc_dir or not os.path.isdir(self.multiproc_dir):
+            return snapshots
+        for filename in os.listdir(self.multiproc_dir):
+            if not filename.endswith(".json") or filename == f"{os.getpid()}.json":
+                continue
+            try:
+                with open(os.path.join(self.multiproc_dir, filename)) as snapshot_file:
+                    data = json.load(snapshot_file)
+                snapshots.append((data["pid"], data["metrics"]))
+            except (OSError, ValueError, KeyError):
+                continue
+        return snapshots
+
+    def _merged(self) -> Dict[str, Dict]:
+        merged = {}
+        for pid, snapshot in self._process_snapshots():
+            alive = pid == os.getpid() or _pid_alive(pid)
+            for name, metric in snapshot.items():
+                if metric["type"] == "gauge" and not alive:
+                    continue
+                target = merged.setdefault(name, dict(metric, values={}))
+                for key, value in metric["values"].items():
+                    current = target["values"].get(key)
+                    if current is None:
+                        target["values"][key] = _copy(value)
+                    elif isinstance(value, dict):
+                        current["counts"] = [a + b for a, b in zip(current["counts"], value["counts"])]
+                        current["sum"] += value["sum"]
+                        current["count"] += value["count"]
+                    else:
+                        target["values"][key] = current + value
+        return merged
+
+    # --- Exposition ----------------------------------------------------------
+
+    def render(self, collectors: Iterable[Callable[[], Iterable[Sample]]] = ()) -> str:
+        lines = []
+        for name, metric in sorted(self._merged().items()):
+            lines.append(f"# HELP {name} {_escape_help(metric['help'])}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for key, value in sorted(metric["values"].items()):
+                labels = dict(zip(metric["labelnames"], json.loads(key)))
+                if metric["type"] == "histogram":
+                    cumulative = 0
+                    for bound, count in zip(metric["buckets"] + ["+Inf"], value["counts"]):
+                        cumulative += count
+                        le = bound if bound == "+Inf" else _format_value(bound)
+                        lines.append(f"{name}_bucket{_format_labels(dict(labels, le=le))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        described = set()
+        for collector in collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+                continue
+            for name, metric_type, documentation, labels, value in samples:
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {_escape_help(documentation)}")
+                    lines.append(f"# TYPE {name} {metric_type}")
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value: object) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, object]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "impactlens_http_request_duration_seconds", "API request latency by blueprint route.",
+    ("method", "endpoint", "status")
+)
+ANALYSIS_DURATION = REGISTRY.histogram(
+    "impactlens_analysis_duration_seconds", "Analysis duration by the service that produced it.",
+    ("service_used",), buckets=(0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60, 120)
+)
+ANALYSIS_TOKENS = REGISTRY.histogram(
+    "impactlens_analysis_tokens", "Tokens used per analysis by the service that produced it.",
+    ("service_used",), buckets=(0, 250, 500, 750, 1000, 1500, 2000, 3000, 5000)
+)
+ANALYSIS_ROUTE_DURATION = REGISTRY.histogram(
+    "impactlens_analysis_route_duration_seconds", "Analysis duration by the model the router picked and why.",
+    ("model_used", "route_reason"), buckets=(0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60, 120)
+)
+ANALYSIS_ROUTE_TOKENS = REGISTRY.counter(
+    "impactlens_analysis_route_tokens_total", "Tokens used by the model the router picked and why.",
+    ("model_used", "route_reason")
+)
+ANALYSIS_RESULTS = REGISTRY.counter(
+    "impactlens_analysis_results_total", "Stored analysis results by service and reason (fallback rate).",
+    ("service_used", "service_reason")
+)
+ANALYSIS_PARSE_RESULTS = REGISTRY.counter(
+    "impactlens_analysis_parse_total", "OpenAI analyses by validation outcome before any repair.", ("outcome",)
+)
+ANALYSIS_INVALID_FIELDS = REGISTRY.counter(
+    "impactlens_analysis_invalid_fields_total", "Analysis fields that failed validation.", ("field",)
+)
+ANALYSIS_REPAIRS = REGISTRY.counter(
+    "impactlens_analysis_repairs_total", "Targeted repair calls by outcome.", ("outcome",)
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "impactlens_analysis_cache_lookups_total", "Analysis cache lookups by outcome.", ("result",)
+)
+# Kept here rather than read from WorkerPool/AsyncEngine stats, so they survive worker restarts
+ANALYSIS_QUEUE_COMPLETED = REGISTRY.counter(
+    "impactlens_analysis_queue_completed_total", "Analysis tasks the in-process queue ran to completion."
+)
+ANALYSIS_QUEUE_FAILED = REGISTRY.counter(
+    "impactlens_analysis_queue_failed_total", "Analysis tasks in the in-process queue that raised."
+)
+ANALYSIS_QUEUE_REJECTED = REGISTRY.counter(
+    "impactlens_analysis_queue_rejected_total", "Analysis tasks rejected because the in-process queue was full."
+)
+for _counter in (ANALYSIS_QUEUE_COMPLETED, ANALYSIS_QUEUE_FAILED, ANALYSIS_QUEUE_REJECTED):
+    # A series from the first scrape, so rate() doesn't miss the first events
+    _counter.inc(0)
+
+# Monotonic WorkerPool/AsyncEngine stats, exported through the counters above instead of as gauges
+QUEUE_COUNTER_STATS = ("completed", "failed", "rejected")
+
+
+def _openai_samples(openai_service) -> Iterable[Sample]:
+    circuit = openai_service.breaker.stats()
+    for state in ("closed", "open", "half_open"):
+        yield "impactlens_openai_circuit_state", "gauge", "OpenAI circuit breaker state (1 = current).", {"state": state}, int(circuit["state"] == state)
+    rate = openai_service.rate_scheduler.stats()
+    if rate["enabled"]:
+        for key in ("rpm_utilization", "tpm_utilization"):
+            if rate[key] is not None:
+                yield f"impactlens_openai_{key}", "gauge", f"OpenAI {key[:3].upper()} budget in use.", {}, rate[key]
+        yield "impactlens_openai_rate_waiting", "gauge", "Analyses waiting for OpenAI rate budget.", {}, rate["waiting"]
+    if openai_service.packer:
+        packing = openai_service.packer.stats()
+        yield "impactlens_analysis_packs_total", "counter", "Packed OpenAI calls made.", {}, packing["packs"]
+        yield "impactlens_analysis_packed_items_total", "counter", "Analyses sent in packed OpenAI calls.", {}, packing["packed_items"]
+
+
+def collect_app_metrics(app) -> Iterable[Sample]:
+    """Point-in-time samples from the app's services and database. Needs an app context."""
+    from sqlalchemy import func, select
+    from .models import db, AnalysisJob
+
+    counts = dict(db.session.execute(select(AnalysisJob.status, func.count()).group_by(AnalysisJob.status)).all())
+    for status in ("pending", "processing", "completed", "failed"):
+        yield "impactlens_analysis_jobs", "gauge", "Analysis jobs by status.", {"status": status}, counts.get(status, 0)
+
+    for key, value in app.config["job_service"].queue_stats().items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and key not in QUEUE_COUNTER_STATS:
+            key = key[len("queue_"):] if key.startswith("queue_") else key
+            yield f"impactlens_analysis_queue_{key}", "gauge", f"Analysis queue {key.replace('_', ' ')}.", {}, value
+
+    cache = app.config["analysis_cache"].stats()
+    yield "impactlens_analysis_cache_hit_ratio", "gauge", "Analysis cache hit ratio in this process.", {}, cache["hit_ratio"]
+    yield "impactlens_analysis_cache_memory_entries", "gauge", "Entries in the in-process analysis cache.", {}, cache["memory"]["entries"]
+    yield "impactlens_analysis_cache_memory_bytes", "gauge", "Bytes held by the in-process analysis cache.", {}, cache["memory"]["bytes"]
+
+    openai_service = app.config["openai_service"]
+    # A scrape must not build the OpenAI service; until it is built there is nothing to report
+    if openai_service.built:
+        yield from _openai_samples(openai_service)
+
+    from .database import POOL_STATS
+    pool = POOL_STATS.snapshot(db.engine)
+    if "checked_out" in pool:
+        yield "impactlens_db_pool_size", "gauge", "Database connection pool size.", {}, pool["size"]
+        yield "impactlens_db_pool_checked_in", "gauge", "Idle database connections in the pool.", {}, pool["checked_in"]
+        yield "impactlens_db_pool_checked_out", "gauge", "Database connections in use.", {}, pool["checked_out"]
+        yield "impactlens_db_pool_overflow", "gauge", "Database connections beyond the pool size.", {}, pool["overflow"]
+    yield "impactlens_db_connections_opened_total", "counter", "Database connections opened by this process.", {}, pool["connects"]
+    yield "impactlens_db_pool_checkouts_total", "counter", "Database connection checkouts.", {}, pool["checkouts"]
+    yield "impactlens_db_connections_invalidated_total", "counter", "Database connections discarded as broken (failed pre-ping or errors).", {}, pool["invalidations"]
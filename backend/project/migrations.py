@@ -0,0 +1,54 @@
+import logging
+
+from sqlalchemy import JSON, inspect, text
+
+from .models import db
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade():
+    """
+    Bring the schema up to date with the models.
+    create_all only creates missing tables, so columns and indexes added to
+    existing models are added here. Must run inside an app context.
+    """
+    db.create_all()
+
+    inspector = inspect(db.engine)
+    dialect = db.engine.dialect
+    for table in db.metadata.sorted_tables:
+        existing = {column["name"]: column for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                _convert_to_json(table, column, existing[column.name], dialect)
+                continue
+            column_type = column.type.compile(dialect=dialect)
+            db.session.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            logger.info(f"Added column {table.name}.{column.name}")
+
+    db.session.commit()
+
+    for table in db.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            index.create(bind=db.engine)
+            logger.info(f"Created index {index.name}")
+
+
+def _convert_to_json(table, column, existing, dialect):
+    """
+    Convert a Text column that now holds native JSON. The old column held
+    json.dumps output, so PostgreSQL can cast it in place; SQLite stores JSON
+    as text anyway and needs no change.
+    """
+    if dialect.name != "postgresql" or not isinstance(column.type, JSON) or isinstance(existing["type"], JSON):
+        return
+    column_type = column.type.compile(dialect=dialect)
+    db.session.execute(text(
+        f"ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE {column_type} "
+        f"USING NULLIF({column.name}, '')::{column_type}"
+    ))
+    logger.info(f"Converted {table.name}.{column.name} to {column_type}")
@@ -3,5 +3,5 @@ from flask_sqlalchemy import SQLAlchemy
 db = SQLAlchemy()
 
 from .user import User
-from .analysis import PartnershipScenario, AnalysisJob, AnalysisResult
-
+from .analysis import PartnershipScenario, AnalysisJob, AnalysisJobGroup, AnalysisResult, AnalysisCacheEntry
+from .analytics import PortfolioAggregate
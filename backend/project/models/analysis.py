@@ -1,7 +1,14 @@
 from . import db
 from datetime import datetime
+from sqlalchemy.dialects.postgresql import JSONB
+
+# Native JSON columns: JSONB on PostgreSQL, JSON (text with JSON functions) on SQLite
+JSONType = db.JSON().with_variant(JSONB(), "postgresql")
 
 class PartnershipScenario(db.Model):
+    # Keyset pagination of a user's scenarios, newest first
+    __table_args__ = (db.Index("ix_partnership_scenario_user_created", "user_id", "created_at", "id"),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     brand_a = db.Column(db.String(100), nullable=False)
@@ -28,6 +35,9 @@ class PartnershipScenario(db.Model):
         }
 
 class AnalysisJob(db.Model):
+    # Latest job per scenario is max(id) within scenario_id
+    __table_args__ = (db.Index("ix_analysis_job_scenario_id", "scenario_id", "id"),)
+
     id = db.Column(db.Integer, primary_key=True)
     job_id = db.Column(db.String(36), unique=True, nullable=False)
     scenario_id = db.Column(db.Integer, db.ForeignKey("partnership_scenario.id"), nullable=False)
@@ -38,20 +48,41 @@ class AnalysisJob(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     started_at = db.Column(db.DateTime)
     completed_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, default=0)
+    lease_owner = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    fingerprint = db.Column(db.String(64), index=True)
+    coalesced_into = db.Column(db.String(36))
+    group_id = db.Column(db.String(36), index=True)
+    deadline_seconds = db.Column(db.Float)
+    deadline_at = db.Column(db.DateTime)
+    stage_timings = db.Column(db.Text)
+
+class AnalysisJobGroup(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    group_id = db.Column(db.String(36), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    max_concurrency = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class AnalysisResult(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     scenario_id = db.Column(db.Integer, db.ForeignKey("partnership_scenario.id"), nullable=False)
-    job_id = db.Column(db.String(36), db.ForeignKey("analysis_job.job_id"), nullable=False)
+    job_id = db.Column(db.String(36), db.ForeignKey("analysis_job.job_id"), nullable=False, index=True)
     brand_alignment_score = db.Column(db.Float)
     audience_overlap_percentage = db.Column(db.Float)
     roi_projection = db.Column(db.Float)
     risk_level = db.Column(db.String(50))
-    key_risks = db.Column(db.Text)
-    recommendations = db.Column(db.Text)
-    market_insights = db.Column(db.Text)
+    key_risks = db.Column(JSONType)
+    recommendations = db.Column(JSONType)
+    market_insights = db.Column(JSONType)
     tokens_used = db.Column(db.Integer)
     analysis_duration = db.Column(db.Float)
+    service_used = db.Column(db.String(50))
+    service_reason = db.Column(db.String(100))
+    model_used = db.Column(db.String(100))
+    route_reason = db.Column(db.String(50))
 
     def to_dict(self):
         return {
@@ -66,6 +97,20 @@ class AnalysisResult(db.Model):
             "recommendations": self.recommendations,
             "market_insights": self.market_insights,
             "tokens_used": self.tokens_used,
-            "analysis_duration": self.analysis_duration
+            "analysis_duration": self.analysis_duration,
+            "service_used": self.service_used,
+            "service_reason": self.service_reason,
+            "model_used": self.model_used,
+            "route_reason": self.route_reason
         }
 
+
+class AnalysisCacheEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    model = db.Column(db.String(100), nullable=False)
+    prompt_version = db.Column(db.String(20), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    hit_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime)
@@ -0,0 +1,48 @@
+from . import db
+
+# Upper bounds of the ROI histogram buckets; the last bucket is open-ended
+ROI_BUCKET_EDGES = (50, 100, 150, 200, 300)
+ROI_BUCKET_LABELS = ("<50", "50-100", "100-150", "150-200", "200-300", "300+")
+RISK_LEVELS = ("low", "medium", "high", "other")
+# Brand value of the rows that roll up all of a user's results
+ALL_BRANDS = ""
+
+
+class PortfolioAggregate(db.Model):
+    """
+    Running totals of analysis results per user, brand and day. Each result
+    counts once in the user's ALL_BRANDS row and once per brand of its
+    scenario. Counters are plain integer columns so concurrent workers can
+    add to them with a single upsert.
+    """
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "brand", "day", name="uq_portfolio_aggregate_user_brand_day"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    brand = db.Column(db.String(100), nullable=False, default=ALL_BRANDS)
+    day = db.Column(db.Date, nullable=False)
+    result_count = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Float, nullable=False, default=0)
+    score_count = db.Column(db.Integer, nullable=False, default=0)
+    roi_sum = db.Column(db.Float, nullable=False, default=0)
+    roi_count = db.Column(db.Integer, nullable=False, default=0)
+    roi_bucket_0 = db.Column(db.Integer, nullable=False, default=0)
+    roi_bucket_1 = db.Column(db.Integer, nullable=False, default=0)
+    roi_bucket_2 = db.Column(db.Integer, nullable=False, default=0)
+    roi_bucket_3 = db.Column(db.Integer, nullable=False, default=0)
+    roi_bucket_4 = db.Column(db.Integer, nullable=False, default=0)
+    roi_bucket_5 = db.Column(db.Integer, nullable=False, default=0)
+    risk_low = db.Column(db.Integer, nullable=False, default=0)
+    risk_medium = db.Column(db.Integer, nullable=False, default=0)
+    risk_high = db.Column(db.Integer, nullable=False, default=0)
+    risk_other = db.Column(db.Integer, nullable=False, default=0)
+    tokens_used = db.Column(db.Integer, nullable=False, default=0)
+
+    COUNTERS = (
+        "result_count", "score_sum", "score_count", "roi_sum", "roi_count",
+        *(f"roi_bucket_{i}" for i in range(len(ROI_BUCKET_LABELS))),
+        *(f"risk_{level}" for level in RISK_LEVELS),
+        "tokens_used",
+    )
@@ -0,0 +1,205 @@
+import os
+import sys
+import time
+import heapq
+import logging
+import itertools
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Leaf frames in these files are threads parked on a lock, queue or socket selector
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+
+
+def profiling_enabled() -> bool:
+    """Opt-in per-stage timing of requests and analysis jobs (PROFILING_ENABLED)."""
+    return os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+
+
+class StageTimer:
+    """Accumulates wall time per named stage."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float, count: int = 0) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if count:
+            self.counts[name] = self.counts.get(name, 0) + count
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def breakdown(self) -> Dict[str, Any]:
+        breakdown = {name: round(seconds, 4) for name, seconds in self.stages.items()}
+        for name, count in self.counts.items():
+            breakdown[f"{name}_count"] = count
+        return breakdown
+
+
+class SlowRequestLog:
+    """The slowest N requests and analysis jobs seen by this process, with their stage breakdowns."""
+
+    def __init__(self, capacity: int = None):
+        self.capacity = capacity or int(os.getenv("SLOW_REQUEST_LOG_SIZE", "50"))
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def record(self, duration: float, entry: Dict[str, Any]) -> None:
+        entry = dict(entry, duration=round(duration, 4), at=datetime.utcnow().isoformat())
+        with self._lock:
+            if len(self._heap) < self.capacity:
+                heapq.heappush(self._heap, (duration, next(self._counter), entry))
+            elif duration > self._heap[0][0]:
+                heapq.heapreplace(self._heap, (duration, next(self._counter), entry))
+
+    def slowest(self, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = sorted(self._heap, reverse=True)
+        return [entry for _, _, entry in entries if kind is None or entry.get("kind") == kind]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap.clear()
+
+
+SLOW_LOG = SlowRequestLog()
+
+_current = threading.local()
+
+
+def current_timer() -> Optional[StageTimer]:
+    return getattr(_current, "timer", None)
+
+
+def install_request_profiling(app, engine) -> None:
+    """
+    Time every request and split it into jwt, db (with query count), json and
+    the remaining view time, feeding SLOW_LOG. Only installed with
+    PROFILING_ENABLED, since the SQL hooks cost a little on every query.
+    """
+    from flask import g, request
+    from sqlalchemy import event
+    import flask_jwt_extended.view_decorators as jwt_views
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["profiling_started"].pop()
+        timer = current_timer()
+        if timer:
+            timer.add("db", time.perf_counter() - started, count=1)
+
+    # jwt_required() looks verify_jwt_in_request up on its module at call time
+    verify_jwt = jwt_views.verify_jwt_in_request
+    if not getattr(verify_jwt, "profiled", False):
+        def timed_verify_jwt(*args, **kwargs):
+            timer = current_timer()
+            if not timer:
+                return verify_jwt(*args, **kwargs)
+            with timer.stage("jwt"):
+                return verify_jwt(*args, **kwargs)
+        timed_verify_jwt.profiled = True
+        jwt_views.verify_jwt_in_request = timed_verify_jwt
+
+    dumps = app.json.dumps
+
+    def timed_dumps(obj, **kwargs):
+        timer = current_timer()
+        if not timer:
+            return dumps(obj, **kwargs)
+        with timer.stage("json"):
+            return dumps(obj, **kwargs)
+    app.json.dumps = timed_dumps
+
+    @app.before_request
+    def start_profile():
+        _current.timer = g.profile = StageTimer()
+
+    @app.teardown_request
+    def finish_profile(error=None):
+        timer = current_timer()
+        _current.timer = None
+        if not timer or request.blueprint is None:
+            return
+        duration = timer.elapsed()
+        stages = timer.breakdown()
+        stages["other"] = round(max(0.0, duration - sum(timer.stages.values())), 4)
+        SLOW_LOG.record(duration, {
+            "kind": "request",
+            "method": request.method,
+            "path": request.path,
+            "endpoint": request.endpoint,
+            "status": getattr(g, "response_status", None),
+            "stages": stages,
+        })
+
+    @app.after_request
+    def remember_status(response):
+        g.response_status = response.status_code
+        return response
+
+
+class ProfilerBusy(Exception):
+    """Raised when a sampling run is already in progress."""
+
+
+_profile_lock = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(duration: float, interval: float = 0.005, include_idle: bool = False) -> str:
+    """
+    Sample every thread's stack for duration seconds and return them in
+    collapsed format ("thread;outer;...;inner count" per line), ready for
+    flamegraph.pl or speedscope. Idle threads are left out unless asked for.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        own = threading.get_ident()
+        counts = Counter()
+        samples = 0
+        end = time.monotonic() + duration
+        while time.monotonic() < end:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if not include_idle and os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                counts[";".join(reversed(stack))] += 1
+            samples += 1
+            time.sleep(interval)
+        logger.info(f"Sampling profile finished: {samples} samples over {duration:.1f}s")
+        return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+    finally:
+        _profile_lock.release()
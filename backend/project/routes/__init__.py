@@ -1,3 +1,5 @@
 from .user import user_bp
 from .analysis import analysis_bp
+from .admin import admin_bp
+from .analytics import analytics_bp
 
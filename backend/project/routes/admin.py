@@ -0,0 +1,60 @@
+import os
+import logging
+from functools import wraps
+
+from flask import Blueprint, Response, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from ..models import db, User
+from ..profiling import SLOW_LOG, ProfilerBusy, profiling_enabled, sample_stacks
+
+admin_bp = Blueprint("admin", __name__)
+logger = logging.getLogger(__name__)
+
+def _is_admin(user_id):
+    """ADMIN_USERS lists admin user ids or usernames, comma separated."""
+    admins = {entry.strip() for entry in os.getenv("ADMIN_USERS", "").split(",") if entry.strip()}
+    if not admins or user_id is None:
+        return False
+    if str(user_id) in admins:
+        return True
+    user = db.session.get(User, int(user_id)) if str(user_id).isdigit() else None
+    return bool(user and user.username in admins)
+
+def admin_required(fn):
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        if not _is_admin(get_jwt_identity()):
+            return jsonify({"error": "Admin access required"}), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
+@admin_bp.route("/admin/slow-requests", methods=["GET"])
+@admin_required
+def get_slow_requests():
+    kind = request.args.get("kind")
+    return jsonify({
+        "profiling_enabled": profiling_enabled(),
+        "capacity": SLOW_LOG.capacity,
+        "entries": SLOW_LOG.slowest(kind)
+    }), 200
+
+@admin_bp.route("/admin/profile", methods=["GET"])
+@admin_required
+def get_profile():
+    """Sample all threads for ?seconds= (max PROFILE_MAX_SECONDS) and return collapsed stacks."""
+    try:
+        seconds = float(request.args.get("seconds", "5"))
+        interval = float(request.args.get("interval", "0.005"))
+    except ValueError:
+        return jsonify({"error": "seconds and interval must be numbers"}), 400
+    seconds = max(0.1, min(seconds, float(os.getenv("PROFILE_MAX_SECONDS", "30"))))
+    interval = max(0.001, min(interval, 1.0))
+    include_idle = request.args.get("idle", "false").lower() == "true"
+
+    try:
+        stacks = sample_stacks(seconds, interval, include_idle)
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    return Response(stacks, mimetype="text/plain")
@@ -1,6 +1,14 @@
-from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token
+import os
+import json
+import time
+import queue
+from datetime import timedelta
+from flask import Blueprint, Response, request, jsonify, current_app, url_for
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity, get_jwt_request_location, create_access_token
 from ..models import db, PartnershipScenario, AnalysisJob, AnalysisResult, User
+from ..services import QueueFullError
+from ..services.job_events import TERMINAL_STATUSES, STREAM_TOKEN_SCOPE
+from ..services.scenario_listing import FIELDS, list_scenarios, parse_fields
 import logging
 
 analysis_bp = Blueprint("analysis", __name__)
@@ -59,6 +67,15 @@ def create_scenario():
         logger.error(f"Scenario creation failed: {str(e)}")
         return jsonify({"error": "Failed to create scenario"}), 500
 
+def _deadline_seconds(data):
+    """Optional per-request analysis deadline; JobService applies the default and the cap."""
+    value = data.get("deadline_seconds")
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError("deadline_seconds must be a positive number")
+    return float(value)
+
 @analysis_bp.route("/scenarios/<int:scenario_id>/analyze", methods=["POST"])
 @jwt_required()
 def analyze_scenario(scenario_id):
@@ -69,8 +86,13 @@ def analyze_scenario(scenario_id):
         if not scenario:
             return jsonify({"error": "Scenario not found"}), 404
         
+        try:
+            deadline_seconds = _deadline_seconds(request.get_json(silent=True) or {})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
         job_service = current_app.config["job_service"]
-        job_id = job_service.start_analysis(scenario.to_dict())
+        job_id = job_service.create_analysis_job(scenario.id, user_id, deadline_seconds=deadline_seconds)
         
         return jsonify({
             "job_id": job_id,
@@ -78,26 +100,250 @@ def analyze_scenario(scenario_id):
             "message": "Analysis job started"
         }), 202
         
+    except QueueFullError as e:
+        logger.warning(f"Analysis rejected, queue is full: {str(e)}")
+        response = jsonify({
+            "error": "Analysis queue is full, please retry later",
+            "retry_after": e.retry_after
+        })
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
+        
     except Exception as e:
         logger.error(f"Analysis start failed: {str(e)}")
         return jsonify({"error": "Failed to start analysis"}), 500
 
+@analysis_bp.route("/scenarios/batch/analyze", methods=["POST"])
+@jwt_required()
+def analyze_scenarios_batch():
+    try:
+        user_id = get_jwt_identity()
+        data = request.get_json() or {}
+        
+        scenario_ids = data.get("scenario_ids")
+        max_scenarios = int(os.getenv("BATCH_MAX_SCENARIOS", "200"))
+        if not isinstance(scenario_ids, list) or not scenario_ids:
+            return jsonify({"error": "scenario_ids must be a non-empty list"}), 400
+        if len(scenario_ids) > max_scenarios:
+            return jsonify({"error": f"At most {max_scenarios} scenarios per batch"}), 400
+        
+        try:
+            max_concurrency = int(data.get("max_concurrency", os.getenv("BATCH_DEFAULT_CONCURRENCY", "5")))
+        except (TypeError, ValueError):
+            return jsonify({"error": "max_concurrency must be an integer"}), 400
+        max_concurrency = max(1, min(max_concurrency, int(os.getenv("BATCH_MAX_CONCURRENCY", "20"))))
+        try:
+            deadline_seconds = _deadline_seconds(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        scenarios = PartnershipScenario.query.filter(
+            PartnershipScenario.id.in_(scenario_ids),
+            PartnershipScenario.user_id == user_id
+        ).all()
+        by_id = {scenario.id: scenario for scenario in scenarios}
+        missing = [scenario_id for scenario_id in scenario_ids if scenario_id not in by_id]
+        if missing:
+            return jsonify({"error": "Scenarios not found", "scenario_ids": missing}), 404
+        
+        job_service = current_app.config["job_service"]
+        group, jobs = job_service.create_job_group(
+            [by_id[scenario_id] for scenario_id in scenario_ids], user_id, max_concurrency,
+            deadline_seconds=deadline_seconds
+        )
+        
+        return jsonify({
+            "group_id": group.group_id,
+            "status": "started",
+            "max_concurrency": max_concurrency,
+            "jobs": [{"job_id": job.job_id, "scenario_id": job.scenario_id} for job in jobs],
+            "message": f"Batch analysis started for {len(jobs)} scenarios"
+        }), 202
+        
+    except QueueFullError as e:
+        logger.warning(f"Batch analysis rejected, queue is full: {str(e)}")
+        response = jsonify({
+            "error": "Analysis queue is full, please retry later",
+            "retry_after": e.retry_after
+        })
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
+        
+    except Exception as e:
+        logger.error(f"Batch analysis start failed: {str(e)}")
+        return jsonify({"error": "Failed to start batch analysis"}), 500
+
+@analysis_bp.route("/job-groups/<group_id>", methods=["GET"])
+@jwt_required()
+def get_job_group_status(group_id):
+    try:
+        user_id = get_jwt_identity()
+        job_service = current_app.config["job_service"]
+        group_status = job_service.get_group_status(group_id, user_id)
+        
+        if not group_status:
+            return jsonify({"error": "Job group not found"}), 404
+        
+        return jsonify(group_status), 200
+        
+    except Exception as e:
+        logger.error(f"Job group status check failed: {str(e)}")
+        return jsonify({"error": "Failed to get job group status"}), 500
+
 @analysis_bp.route("/jobs/<job_id>", methods=["GET"])
 @jwt_required()
 def get_job_status(job_id):
+    """
+    Job status with a strong ETag; If-None-Match gets a 304. ?wait=<seconds>
+    long-polls until the status differs from the one the client holds
+    (If-None-Match) or the wait runs out.
+    """
     try:
         job_service = current_app.config["job_service"]
-        job_status = job_service.get_job_status(job_id)
-        
-        if not job_status:
+        seen = request.if_none_match
+
+        cached_etag = job_service.cached_etag(job_id)
+        if cached_etag and seen.contains(cached_etag):
+            return _not_modified(cached_etag, "completed")
+
+        try:
+            wait = min(float(request.args.get("wait", "0")), float(os.getenv("JOB_STATUS_MAX_WAIT", "30")))
+        except ValueError:
+            return jsonify({"error": "wait must be a number of seconds"}), 400
+
+        if wait > 0:
+            payload = job_service.wait_for_job_status(job_id, wait, seen_etags=seen if seen else None)
+        else:
+            payload = job_service.job_status_payload(job_id)
+        if not payload:
             return jsonify({"error": "Job not found"}), 404
-        
-        return jsonify(job_status), 200
+
+        body, etag, status = payload
+        if seen.contains(etag):
+            return _not_modified(etag, status)
+        response = Response(body + "\n", mimetype="application/json")
+        _cache_headers(response, etag, status)
+        return response, 200
         
     except Exception as e:
         logger.error(f"Job status check failed: {str(e)}")
         return jsonify({"error": "Failed to get job status"}), 500
 
+def _cache_headers(response, etag, status):
+    response.set_etag(etag)
+    if status == "completed":
+        # A completed job's payload never changes
+        response.headers["Cache-Control"] = "private, max-age=86400, immutable"
+    else:
+        response.headers["Cache-Control"] = "private, no-cache"
+
+def _not_modified(etag, status):
+    response = Response(status=304)
+    _cache_headers(response, etag, status)
+    return response
+
+def _owns_job(job_id):
+    return db.session.query(AnalysisJob.id).filter_by(job_id=job_id, user_id=get_jwt_identity()).first() is not None
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@analysis_bp.route("/jobs/<job_id>/events/token", methods=["POST"])
+@jwt_required()
+def create_job_events_token(job_id):
+    """
+    Short-lived token for EventSource, which can't send an Authorization
+    header: it only opens this job's event stream, so the copy that ends up
+    in access logs and browser history is worth little.
+    """
+    if not _owns_job(job_id):
+        return jsonify({"error": "Job not found"}), 404
+    expires_in = int(os.getenv("SSE_TOKEN_SECONDS", "60"))
+    token = create_access_token(
+        identity=get_jwt_identity(),
+        expires_delta=timedelta(seconds=expires_in),
+        additional_claims={"scope": STREAM_TOKEN_SCOPE, "job_id": job_id}
+    )
+    return jsonify({
+        "stream_token": token,
+        "expires_in": expires_in,
+        "events_url": url_for("analysis.stream_job_events", job_id=job_id, jwt=token)
+    }), 201
+
+@analysis_bp.route("/jobs/<job_id>/events", methods=["GET"])
+@jwt_required(locations=["headers", "query_string"])
+def stream_job_events(job_id):
+    """
+    Server-sent events: a status snapshot, then every transition until the
+    job finishes. Authenticate with the Authorization header, or with ?jwt=
+    carrying a token from POST /jobs/<job_id>/events/token.
+    """
+    if get_jwt_request_location() == "query_string":
+        claims = get_jwt()
+        if claims.get("scope") != STREAM_TOKEN_SCOPE or claims.get("job_id") != job_id:
+            return jsonify({"error": "Use a stream token from POST /api/jobs/<job_id>/events/token"}), 401
+    if not _owns_job(job_id):
+        return jsonify({"error": "Job not found"}), 404
+    job_service = current_app.config["job_service"]
+    bus = current_app.config["job_events"]
+    keepalive = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+    max_duration = float(os.getenv("SSE_MAX_DURATION", "300"))
+
+    # Subscribe before reading the snapshot so no transition falls between the two
+    subscription = bus.subscribe(job_id)
+    try:
+        snapshot = job_service.get_job_status(job_id)
+    except Exception as e:
+        bus.unsubscribe(job_id, subscription)
+        logger.error(f"Job event stream failed: {str(e)}")
+        return jsonify({"error": "Failed to get job status"}), 500
+    if not snapshot:
+        bus.unsubscribe(job_id, subscription)
+        return jsonify({"error": "Job not found"}), 404
+
+    app = current_app._get_current_object()
+
+    def read_status():
+        # A session per read: an open stream must not hold a pooled connection for its whole life
+        with app.app_context():
+            return job_service.get_job_status(job_id)
+
+    def generate():
+        try:
+            yield _sse("status", snapshot)
+            if snapshot["status"] in TERMINAL_STATUSES:
+                return
+
+            deadline = time.monotonic() + max_duration
+            while time.monotonic() < deadline:
+                try:
+                    event = subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    # Also covers transitions made by processes we get no notifications from
+                    status = read_status()
+                    if status and status["status"] in TERMINAL_STATUSES:
+                        yield _sse("status", status)
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if event["status"] in TERMINAL_STATUSES:
+                    # Terminal events are small; send the full stored result instead
+                    yield _sse("status", read_status() or event)
+                    return
+                yield _sse("status", event)
+
+            yield _sse("timeout", {"job_id": job_id})
+        finally:
+            bus.unsubscribe(job_id, subscription)
+
+    return Response(
+        # Not stream_with_context: the request context (and its session) ends before streaming starts
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @analysis_bp.route("/test-openai", methods=["POST"])
 def test_openai():
     """Test endpoint to directly call OpenAI service with detailed logging"""
@@ -140,12 +386,69 @@ def test_openai():
 @analysis_bp.route("/scenarios", methods=["GET"])
 @jwt_required()
 def get_scenarios():
+    """
+    The user's scenarios, newest first. ?limit= pages the listing and the
+    next page's cursor comes back in the X-Next-Cursor header (and a Link
+    header), so the body stays a plain list. ?fields= picks columns, plus
+    latest_analysis for the most recent job's status and scores.
+    """
     try:
         user_id = get_jwt_identity()
-        scenarios = PartnershipScenario.query.filter_by(user_id=user_id).all()
-        
-        return jsonify([scenario.to_dict() for scenario in scenarios]), 200
+        max_limit = int(os.getenv("SCENARIOS_MAX_PAGE_SIZE", "500"))
+        try:
+            # SCENARIOS_PAGE_SIZE=0 (the default) returns everything unless ?limit= is given
+            limit = int(request.args.get("limit", os.getenv("SCENARIOS_PAGE_SIZE", "0")))
+            if limit < 0:
+                raise ValueError("limit must not be negative")
+            fields = parse_fields(request.args.get("fields"))
+            scenarios, next_cursor = list_scenarios(
+                user_id, limit=min(limit, max_limit) or None, cursor=request.args.get("cursor"), fields=fields
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        response = jsonify(scenarios)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+            next_args = request.args.to_dict()
+            next_args["cursor"] = next_cursor
+            response.headers["Link"] = f'<{url_for("analysis.get_scenarios", **next_args)}>; rel="next"'
+        return response, 200
         
     except Exception as e:
         logger.error(f"Get scenarios failed: {str(e)}")
         return jsonify({"error": "Failed to get scenarios"}), 500
+
+@analysis_bp.route("/scenarios/<int:scenario_id>/similar", methods=["GET"])
+@jwt_required()
+def get_similar_scenarios(scenario_id):
+    """The user's previously analyzed scenarios most similar to this one (?k=, default 10)."""
+    try:
+        user_id = get_jwt_identity()
+        scenario = PartnershipScenario.query.filter_by(id=scenario_id, user_id=user_id).first()
+        if not scenario:
+            return jsonify({"error": "Scenario not found"}), 404
+        try:
+            k = max(1, min(int(request.args.get("k", "10")), int(os.getenv("SIMILARITY_MAX_K", "50"))))
+        except ValueError:
+            return jsonify({"error": "k must be an integer"}), 400
+
+        started = time.perf_counter()
+        index = current_app.config["similarity_index"]
+        neighbors = index.search(scenario.to_dict(), user_id, k=k)
+        search_ms = (time.perf_counter() - started) * 1000
+
+        scores = dict(neighbors)
+        scenarios, _ = list_scenarios(user_id, fields=FIELDS, scenario_ids=list(scores))
+        scenarios.sort(key=lambda item: scores[item["id"]], reverse=True)
+
+        return jsonify({
+            "scenario_id": scenario_id,
+            "similar": [dict(item, similarity=round(scores[item["id"]], 4)) for item in scenarios],
+            "index_size": index.stats()["scenarios"],
+            "search_ms": round(search_ms, 2)
+        }), 200
+
+    except Exception as e:
+        logger.error(f"Similar scenarios lookup failed: {str(e)}")
+        return jsonify({"error": "Failed to find similar scenarios"}), 500
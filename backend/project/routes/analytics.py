@@ -0,0 +1,62 @@
+import logging
+from datetime import date
+
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from ..services.portfolio_analytics import portfolio_summary, route_summary
+
+analytics_bp = Blueprint("analytics", __name__)
+logger = logging.getLogger(__name__)
+
+def _day(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+
+def _brand_limit():
+    try:
+        return max(1, min(int(request.args.get("brands", "20")), 100))
+    except ValueError:
+        raise ValueError("brands must be an integer")
+
+@analytics_bp.route("/analytics", methods=["GET"])
+@jwt_required()
+def get_analytics():
+    """Portfolio rollups for the current user; ?brand= narrows to one brand, ?from=/?to= to a day range."""
+    try:
+        user_id = get_jwt_identity()
+        try:
+            start, end = _day("from"), _day("to")
+            brand_limit = _brand_limit()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        summary = portfolio_summary(user_id, brand=request.args.get("brand"), start=start, end=end,
+                                    brand_limit=brand_limit)
+        return jsonify(summary), 200
+
+    except Exception as e:
+        logger.error(f"Get analytics failed: {str(e)}")
+        return jsonify({"error": "Failed to get analytics"}), 500
+
+@analytics_bp.route("/analytics/routes", methods=["GET"])
+@jwt_required()
+def get_route_analytics():
+    """Results, tokens and latency per model route for the current user; ?from=/?to= narrow the day range."""
+    try:
+        user_id = get_jwt_identity()
+        try:
+            start, end = _day("from"), _day("to")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return jsonify({"routes": route_summary(user_id, start=start, end=end)}), 200
+
+    except Exception as e:
+        logger.error(f"Get route analytics failed: {str(e)}")
+        return jsonify({"error": "Failed to get route analytics"}), 500
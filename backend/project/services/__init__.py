@@ -1,3 +1,3 @@
 from .openai_service import OpenAIService
 from .job_service import JobService
-
+from .worker_pool import WorkerPool, QueueFullError
@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from flask import has_app_context
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..models import db, AnalysisCacheEntry
+from ..metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+# Counter names mapped to the result label of the lookups metric
+_LOOKUP_RESULTS = {"memory_hits": "memory_hit", "table_hits": "table_hit", "misses": "miss"}
+
+# Scenario fields that influence the analysis; ids, owner and timestamps don't
+FINGERPRINT_FIELDS = ("brand_a", "brand_b", "partnership_type", "target_audience", "budget_range")
+
+
+def normalize_scenario(scenario_data: Dict[str, Any]) -> Dict[str, str]:
+    """Case- and whitespace-insensitive view of the fields the prompt is built from."""
+    return {
+        field: " ".join(str(scenario_data.get(field) or "").lower().split())
+        for field in FINGERPRINT_FIELDS
+    }
+
+
+def scenario_fingerprint(scenario_data: Dict[str, Any], model: str, prompt_version: str) -> str:
+    material = json.dumps(
+        {"scenario": normalize_scenario(scenario_data), "model": model, "prompt_version": prompt_version},
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe LRU with per-entry TTL, bounded by entry count and total payload bytes."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, expires = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def set(self, key: str, payload: str) -> None:
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (payload, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        payload, _ = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "evictions": self.evictions}
+
+
+class AnalysisCache:
+    """
+    Two-tier cache of successful analysis responses.
+    Tier one is a per-process LRU, tier two the shared analysis_cache_entry table.
+    Entries are content-addressed by scenario_fingerprint().
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+        self.ttl = int(os.getenv("ANALYSIS_CACHE_TTL", "86400"))
+        self.memory = LRUCache(
+            max_entries=int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "1000")),
+            max_bytes=int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(10 * 1024 * 1024))),
+            ttl=self.ttl,
+        )
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "table_hits": 0, "misses": 0, "stores": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+        if name in _LOOKUP_RESULTS:
+            CACHE_LOOKUPS.inc(result=_LOOKUP_RESULTS[name])
+
+    def get(self, scenario_data: Dict[str, Any], model: str, prompt_version: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        key = scenario_fingerprint(scenario_data, model, prompt_version)
+
+        payload = self.memory.get(key)
+        if payload is not None:
+            self._count("memory_hits")
+            return json.loads(payload)
+
+        payload = self._table_get(key)
+        if payload is not None:
+            self._count("table_hits")
+            self.memory.set(key, payload)
+            return json.loads(payload)
+
+        self._count("misses")
+        return None
+
+    def put(self, scenario_data: Dict[str, Any], model: str, prompt_version: str, response: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        key = scenario_fingerprint(scenario_data, model, prompt_version)
+        payload = json.dumps({
+            "analysis": response["analysis"],
+            "tokens_used": response.get("tokens_used"),
+            "analysis_duration": response.get("analysis_duration"),
+        })
+        self.memory.set(key, payload)
+        self._table_put(key, model, prompt_version, payload)
+        self._count("stores")
+
+    def _table_get(self, key: str) -> Optional[str]:
+        if not has_app_context():
+            return None
+        try:
+            # Own session so cache traffic never commits or rolls back the caller's work
+            with Session(db.engine) as session:
+                entry = session.query(AnalysisCacheEntry).filter_by(cache_key=key).first()
+                if not entry or (entry.expires_at and entry.expires_at < datetime.utcnow()):
+                    return None
+                entry.hit_count = (entry.hit_count or 0) + 1
+                session.commit()
+                return entry.payload
+        except Exception as e:
+            logger.warning(f"Analysis cache lookup failed: {str(e)}")
+            return None
+
+    def _table_put(self, key: str, model: str, prompt_version: str, payload: str) -> None:
+        if not has_app_context():
+            return
+        expires_at = datetime.utcnow() + timedelta(seconds=self.ttl)
+        try:
+            with Session(db.engine) as session:
+                entry = session.query(AnalysisCacheEntry).filter_by(cache_key=key).first()
+                if entry is None:
+                    entry = AnalysisCacheEntry(cache_key=key, model=model, prompt_version=prompt_version)
+                    session.add(entry)
+                entry.payload = payload
+                entry.created_at = datetime.utcnow()
+                entry.expires_at = expires_at
+                try:
+                    session.commit()
+                except IntegrityError:
+                    # Another process stored the same analysis first; theirs is as good as ours
+                    session.rollback()
+        except Exception as e:
+            logger.warning(f"Analysis cache store failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["memory_hits"] + counters["table_hits"] + counters["misses"]
+        hits = counters["memory_hits"] + counters["table_hits"]
+        return dict(
+            counters,
+            enabled=self.enabled,
+            hit_ratio=round(hits / lookups, 4) if lookups else 0.0,
+            memory=self.memory.stats(),
+        )
@@ -0,0 +1,112 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (scenario data, deadline, future for its result)
+PackItem = Tuple[Dict[str, Any], Optional[float], Future]
+
+
+class PackFailed(Exception):
+    """The packed call produced nothing usable for this scenario; analyze it on its own."""
+
+
+class _Pack:
+    def __init__(self, model: Optional[str]):
+        self.model = model
+        self.items: List[PackItem] = []
+        self.full = threading.Event()
+
+    def accepts(self, model: Optional[str], deadline: Optional[float], slack: float) -> bool:
+        if model != self.model:
+            return False
+        deadlines = [item_deadline for _, item_deadline, _ in self.items]
+        if deadline is None or None in deadlines:
+            return deadline is None and all(item_deadline is None for item_deadline in deadlines)
+        return max(deadlines + [deadline]) - min(deadlines + [deadline]) <= slack
+
+
+class AnalysisPacker:
+    """
+    Groups analyses that arrive together into one packed model call.
+
+    The first caller to reach the packer opens a pack and leads it: it waits
+    up to ANALYSIS_PACK_WINDOW_MS for other callers with the same model and
+    deadlines within ANALYSIS_PACK_DEADLINE_SLACK seconds of each other,
+    or until ANALYSIS_PACK_SIZE callers have joined, then runs run_pack on
+    its own thread. run_pack sets each item's future to its result, or to
+    PackFailed for items that need a single call. A pack of one returns None
+    so the caller takes the normal path. A caller that joined someone else's
+    pack stops waiting at its own deadline and gets PackFailed.
+    """
+
+    def __init__(self, run_pack: Callable[[List[PackItem], Optional[str]], None], max_size: Optional[int] = None,
+                 window: Optional[float] = None, deadline_slack: Optional[float] = None):
+        self.run_pack = run_pack
+        self.max_size = max_size or int(os.getenv("ANALYSIS_PACK_SIZE", "4"))
+        self.window = window if window is not None else float(os.getenv("ANALYSIS_PACK_WINDOW_MS", "50")) / 1000
+        self.deadline_slack = (deadline_slack if deadline_slack is not None
+                               else float(os.getenv("ANALYSIS_PACK_DEADLINE_SLACK", "10")))
+        self._open: List[_Pack] = []
+        self._lock = threading.Lock()
+        self._packs = 0
+        self._packed_items = 0
+
+    def analyze(self, scenario_data: Dict[str, Any], deadline: Optional[float] = None,
+                model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The caller's result from a packed call, None if nobody joined, or PackFailed."""
+        future = Future()
+        with self._lock:
+            pack = next((pack for pack in self._open if pack.accepts(model, deadline, self.deadline_slack)), None)
+            leader = pack is None
+            if leader:
+                pack = _Pack(model)
+                self._open.append(pack)
+            pack.items.append((scenario_data, deadline, future))
+            if len(pack.items) >= self.max_size:
+                self._open.remove(pack)
+                pack.full.set()
+
+        if not leader:
+            try:
+                return future.result(timeout=None if deadline is None else max(0.0, deadline - time.time()))
+            except FutureTimeout:
+                raise PackFailed("deadline_exceeded")
+
+        window = self.window
+        if deadline is not None:
+            window = min(window, max(0.0, (deadline - time.time()) / 4))
+        pack.full.wait(window)
+        with self._lock:
+            if pack in self._open:
+                self._open.remove(pack)
+            items = list(pack.items)
+
+        if len(items) == 1:
+            return None
+        with self._lock:
+            self._packs += 1
+            self._packed_items += len(items)
+        logger.info(f"Packing {len(items)} scenarios into one analysis call")
+        try:
+            self.run_pack(items, model)
+        except Exception as e:
+            logger.warning(f"Packed analysis failed, analyzing its scenarios one by one: {str(e)}")
+        finally:
+            for _, _, item_future in items:
+                if not item_future.done():
+                    item_future.set_exception(PackFailed("packed call failed"))
+        return future.result()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "packs": self._packs,
+                "packed_items": self._packed_items,
+                "average_pack_size": round(self._packed_items / self._packs, 2) if self._packs else None,
+                "open_packs": len(self._open),
+            }
@@ -0,0 +1,115 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+RISK_LEVELS = ("Low", "Medium", "High")
+
+# JSON schema of one analysis, used for structured outputs and for validation
+FIELD_SCHEMAS = {
+    "brand_alignment_score": {"type": "number", "description": "Brand alignment score from 0 to 100"},
+    "audience_overlap_percentage": {"type": "number", "description": "Audience overlap percentage from 0 to 100"},
+    "roi_projection": {"type": "number", "description": "Projected ROI percentage, e.g. 150 for 150%"},
+    "risk_level": {"type": "string", "enum": list(RISK_LEVELS)},
+    "key_risks": {"type": "array", "items": {"type": "string"}, "description": "Two to five key risks"},
+    "recommendations": {"type": "array", "items": {"type": "string"}, "description": "Two to five recommendations"},
+    "market_insights": {"type": "array", "items": {"type": "string"}, "description": "Two to five market insights"},
+}
+ANALYSIS_FIELDS = tuple(FIELD_SCHEMAS)
+
+# Bounds checked after parsing; strict structured outputs don't enforce minimum/maximum
+NUMBER_RANGES = {
+    "brand_alignment_score": (0, 100),
+    "audience_overlap_percentage": (0, 100),
+    "roi_projection": (-100, 1000),
+}
+
+
+def object_schema(fields: Iterable[str]) -> Dict[str, Any]:
+    fields = list(fields)
+    return {
+        "type": "object",
+        "properties": {field: FIELD_SCHEMAS[field] for field in fields},
+        "required": fields,
+        "additionalProperties": False,
+    }
+
+
+def response_format(fields: Iterable[str] = ANALYSIS_FIELDS, name: str = "partnership_analysis") -> Dict[str, Any]:
+    """The response_format argument asking the model for exactly these fields."""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "strict": True, "schema": object_schema(fields)},
+    }
+
+
+def packed_response_format(count: int) -> Dict[str, Any]:
+    """response_format for a packed call: {"analyses": [{"scenario": n, ...fields}, ...]}."""
+    item = object_schema(ANALYSIS_FIELDS)
+    item["properties"] = {"scenario": {"type": "integer", "description": f"Scenario number, 1 to {count}"},
+                          **item["properties"]}
+    item["required"] = ["scenario", *item["required"]]
+    schema = {
+        "type": "object",
+        "properties": {"analyses": {"type": "array", "items": item}},
+        "required": ["analyses"],
+        "additionalProperties": False,
+    }
+    return {"type": "json_schema", "json_schema": {"name": "packed_partnership_analyses", "strict": True, "schema": schema}}
+
+
+def _number(value: Any, field: str) -> Tuple[Optional[float], Optional[str]]:
+    if isinstance(value, bool):
+        return None, "must be a number"
+    if isinstance(value, str):
+        try:
+            value = float(value.strip().rstrip("%"))
+        except ValueError:
+            return None, "must be a number"
+    if not isinstance(value, (int, float)):
+        return None, "must be a number"
+    low, high = NUMBER_RANGES[field]
+    if not low <= value <= high:
+        return None, f"must be between {low} and {high}"
+    return value, None
+
+
+def _risk_level(value: Any) -> Tuple[Optional[str], Optional[str]]:
+    if isinstance(value, str):
+        for level in RISK_LEVELS:
+            if value.strip().lower() == level.lower():
+                return level, None
+    return None, f"must be one of {', '.join(RISK_LEVELS)}"
+
+
+def _strings(value: Any) -> Tuple[Optional[List[str]], Optional[str]]:
+    if isinstance(value, str) and value.strip():
+        return [value.strip()], None
+    if not isinstance(value, list) or not value:
+        return None, "must be a non-empty list of strings"
+    items = [item.strip() for item in value if isinstance(item, str) and item.strip()]
+    if len(items) != len(value):
+        return None, "must be a non-empty list of strings"
+    return items, None
+
+
+def validate_analysis(data: Dict[str, Any], fields: Iterable[str] = ANALYSIS_FIELDS) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Check and normalize the analysis fields. Returns (valid fields, errors
+    by field); harmless variations such as "85" or "medium" are coerced.
+    Fields outside the schema are dropped.
+    """
+    valid, errors = {}, {}
+    for field in fields:
+        if field not in data or data[field] is None:
+            errors[field] = "missing"
+            continue
+        value = data[field]
+        if field in NUMBER_RANGES:
+            value, error = _number(value, field)
+        elif field == "risk_level":
+            value, error = _risk_level(value)
+        else:
+            value, error = _strings(value)
+        if error:
+            errors[field] = error
+        else:
+            valid[field] = value
+    return valid, errors
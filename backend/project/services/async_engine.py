@@ -0,0 +1,136 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Coroutine, Dict
+
+from .worker_pool import QueueFullError
+from ..metrics import ANALYSIS_QUEUE_COMPLETED, ANALYSIS_QUEUE_FAILED, ANALYSIS_QUEUE_REJECTED
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncEngine:
+    """
+    Event loop running in a dedicated thread that analysis coroutines are
+    submitted to from request and worker threads.
+
+    At most max_concurrency coroutines run at once (the rest wait on a
+    semaphore, up to queue_size of them); blocking work such as database
+    access is pushed onto a small thread pool with run_sync().
+    """
+
+    def __init__(self, max_concurrency: int = None, queue_size: int = None,
+                 sync_workers: int = None, retry_after: int = None):
+        self.max_concurrency = max_concurrency or int(os.getenv("ASYNC_MAX_CONCURRENCY", "100"))
+        self.queue_size = queue_size or int(os.getenv("ANALYSIS_QUEUE_SIZE", "100"))
+        self.retry_after = retry_after or int(os.getenv("ANALYSIS_RETRY_AFTER", "5"))
+        sync_workers = sync_workers or int(os.getenv("ASYNC_SYNC_WORKERS", "4"))
+
+        self._executor = ThreadPoolExecutor(max_workers=sync_workers, thread_name_prefix="async-engine-sync")
+        self._loop = asyncio.new_event_loop()
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._shutdown = False
+
+        self._thread = threading.Thread(target=self._run_loop, name="async-engine", daemon=True)
+        self._thread.start()
+        self._semaphore = self.call_soon(lambda: asyncio.Semaphore(self.max_concurrency)).result()
+
+        logger.info(f"Async engine started with concurrency {self.max_concurrency}")
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def call_soon(self, fn: Callable[[], Any]) -> Future:
+        """Run a plain callable on the loop thread and return its result as a Future."""
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(fn())
+            except Exception as e:
+                future.set_exception(e)
+
+        self._loop.call_soon_threadsafe(run)
+        return future
+
+    def submit(self, coro: Coroutine) -> Future:
+        """Schedule a coroutine on the engine loop. Raises QueueFullError when saturated."""
+        if self._shutdown:
+            coro.close()
+            raise RuntimeError("Async engine is shut down")
+        with self._lock:
+            if self._submitted >= self.max_concurrency + self.queue_size:
+                self._rejected += 1
+                ANALYSIS_QUEUE_REJECTED.inc()
+                coro.close()
+                logger.warning(f"Async engine saturated ({self.queue_size} waiting), rejecting task")
+                raise QueueFullError(self.retry_after)
+            self._submitted += 1
+        return asyncio.run_coroutine_threadsafe(self._guarded(coro), self._loop)
+
+    async def _guarded(self, coro: Coroutine):
+        async with self._semaphore:
+            with self._lock:
+                self._running += 1
+            try:
+                result = await coro
+                with self._lock:
+                    self._completed += 1
+                    ANALYSIS_QUEUE_COMPLETED.inc()
+                return result
+            except Exception as e:
+                logger.error(f"Async task failed: {str(e)}")
+                with self._lock:
+                    self._failed += 1
+                    ANALYSIS_QUEUE_FAILED.inc()
+                raise
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._submitted -= 1
+
+    async def run_sync(self, fn: Callable, *args) -> Any:
+        """Await a blocking callable on the engine's thread pool."""
+        return await self._loop.run_in_executor(self._executor, fn, *args)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "active": self._running,
+                "queue_depth": self._submitted - self._running,
+                "queue_size": self.queue_size,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self, wait: bool = True, timeout: float = 30.0) -> None:
+        """Stop accepting work, wait for in-flight coroutines and stop the loop."""
+        if self._shutdown:
+            return
+        self._shutdown = True
+        logger.info("Shutting down async engine")
+
+        async def drain():
+            pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            if pending:
+                await asyncio.wait(pending, timeout=timeout)
+
+        if wait:
+            try:
+                asyncio.run_coroutine_threadsafe(drain(), self._loop).result(timeout + 1)
+            except Exception as e:
+                logger.warning(f"Async engine did not drain cleanly: {str(e)}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if wait:
+            self._thread.join(timeout)
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,145 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker driven by error rate and p95 latency over a
+    sliding time window.
+
+    Closed: calls go through and outcomes are recorded. When the window holds
+    at least min_requests outcomes and either the error rate or p95 latency
+    crosses its threshold, the breaker opens. Open: calls are refused until
+    the cooldown passes. Half-open: a single trial call is let through;
+    success closes the breaker, failure re-opens it with a doubled cooldown
+    (capped at max_cooldown).
+    """
+
+    def __init__(self, name: str, window_seconds: float = None, min_requests: int = None,
+                 error_threshold: float = None, latency_threshold: float = None,
+                 cooldown: float = None, max_cooldown: float = None):
+        self.name = name
+        self.window_seconds = window_seconds or float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60"))
+        self.min_requests = min_requests or int(os.getenv("CIRCUIT_MIN_REQUESTS", "10"))
+        self.error_threshold = error_threshold or float(os.getenv("CIRCUIT_ERROR_THRESHOLD", "0.5"))
+        self.latency_threshold = latency_threshold or float(os.getenv("CIRCUIT_LATENCY_P95_SECONDS", "20"))
+        self.base_cooldown = cooldown or float(os.getenv("CIRCUIT_COOLDOWN_SECONDS", "30"))
+        self.max_cooldown = max_cooldown or float(os.getenv("CIRCUIT_MAX_COOLDOWN_SECONDS", "300"))
+
+        self._lock = threading.Lock()
+        self._outcomes = deque()  # (timestamp, ok, latency)
+        self._state = CLOSED
+        self._cooldown = self.base_cooldown
+        self._opened_at = 0.0
+        self._open_reason = None
+        self._trial_in_flight = False
+        self._rejected = 0
+
+    def allow(self) -> Tuple[bool, Optional[str]]:
+        """Return (allowed, reason). reason explains a refusal or marks a half-open trial."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True, None
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self._cooldown:
+                    self._rejected += 1
+                    return False, "circuit_open"
+                self._state = HALF_OPEN
+                self._trial_in_flight = False
+                logger.info(f"Circuit '{self.name}' half-open, allowing a trial request")
+            if self._trial_in_flight:
+                self._rejected += 1
+                return False, "circuit_half_open"
+            self._trial_in_flight = True
+            return True, "half_open_trial"
+
+    def record(self, ok: bool, latency: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._outcomes.append((now, ok, latency))
+            self._prune(now)
+
+            if self._state == HALF_OPEN:
+                self._trial_in_flight = False
+                if ok:
+                    logger.info(f"Circuit '{self.name}' closed after successful trial")
+                    self._state = CLOSED
+                    self._cooldown = self.base_cooldown
+                    self._outcomes.clear()
+                else:
+                    self._open("trial request failed", min(self._cooldown * 2, self.max_cooldown), now)
+                return
+
+            if self._state == CLOSED and len(self._outcomes) >= self.min_requests:
+                error_rate = self._error_rate()
+                p95 = self._percentile(0.95)
+                if error_rate >= self.error_threshold:
+                    self._open(f"error rate {error_rate:.0%}", self.base_cooldown, now)
+                elif p95 >= self.latency_threshold:
+                    self._open(f"p95 latency {p95:.1f}s", self.base_cooldown, now)
+
+    def release_trial(self) -> None:
+        """Settle a call that ended without an outcome (cancelled): frees a half-open trial, records nothing."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trial_in_flight = False
+
+    def _open(self, reason: str, cooldown: float, now: float) -> None:
+        logger.warning(f"Circuit '{self.name}' opened ({reason}), cooling down for {cooldown:.0f}s")
+        self._state = OPEN
+        self._opened_at = now
+        self._cooldown = cooldown
+        self._open_reason = reason
+
+    def _prune(self, now: float) -> None:
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(1 for _, ok, _ in self._outcomes if not ok) / len(self._outcomes)
+
+    def _percentile(self, q: float) -> float:
+        latencies = sorted(latency for _, _, latency in self._outcomes)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def latency_percentile(self, q: float) -> Optional[float]:
+        """Latency quantile over the current window, or None without enough samples."""
+        with self._lock:
+            self._prune(time.monotonic())
+            if len(self._outcomes) < self.min_requests:
+                return None
+            return self._percentile(q)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._prune(time.monotonic())
+            stats = {
+                "state": self._state,
+                "window_requests": len(self._outcomes),
+                "error_rate": round(self._error_rate(), 4),
+                "p95_latency": round(self._percentile(0.95), 3),
+                "rejected": self._rejected,
+            }
+            if self._state != CLOSED:
+                stats["open_reason"] = self._open_reason
+                stats["cooldown_seconds"] = self._cooldown
+            return stats
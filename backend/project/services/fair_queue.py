@@ -0,0 +1,84 @@
+import os
+import heapq
+import itertools
+from typing import Any, Dict, Optional
+
+
+def load_user_weights() -> Dict[str, float]:
+    """Per-user scheduling weights from ANALYSIS_USER_WEIGHTS, e.g. "12:3,40:0.5"."""
+    weights = {}
+    for pair in os.getenv("ANALYSIS_USER_WEIGHTS", "").split(","):
+        if ":" not in pair:
+            continue
+        user_id, weight = pair.split(":", 1)
+        try:
+            weights[user_id.strip()] = max(float(weight), 0.01)
+        except ValueError:
+            continue
+    return weights
+
+
+class FairQueue:
+    """
+    Weighted fair queue (self-clocked fair queuing) over keys such as user ids.
+
+    Each item gets a virtual finish tag of max(now, key's last tag) + cost /
+    weight and items leave in tag order, so a key with many queued items
+    doesn't delay others by more than one item, and a key with weight 2 gets
+    twice the share of one with weight 1. Not thread-safe; callers lock.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, default_weight: float = 1.0):
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        self._heap = []
+        self._counter = itertools.count()
+        self._virtual = 0.0
+        self._last = {}
+        self._size = 0
+
+    def push(self, key: Any, item: Any, cost: float = 1.0) -> list:
+        """Queue item under key; returns an entry handle that can be passed to remove()."""
+        key = str(key)
+        weight = self.weights.get(key, self.default_weight)
+        tag = max(self._virtual, self._last.get(key, 0.0)) + cost / weight
+        self._last[key] = tag
+        entry = [tag, next(self._counter), key, item, True]
+        heapq.heappush(self._heap, entry)
+        self._size += 1
+        return entry
+
+    def remove(self, entry: list) -> None:
+        if entry[4]:
+            entry[4] = False
+            self._size -= 1
+
+    def peek(self) -> Optional[list]:
+        """Entry that would be popped next, or None."""
+        self._prune()
+        return self._heap[0] if self._heap else None
+
+    def pop(self) -> Any:
+        self._prune()
+        entry = heapq.heappop(self._heap)
+        self._size -= 1
+        self._virtual = entry[0]
+        # Keys that have caught up with virtual time no longer need their own clock
+        if self._last.get(entry[2], 0.0) <= self._virtual:
+            self._last.pop(entry[2], None)
+        return entry[3]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of queued items per key."""
+        counts = {}
+        for entry in self._heap:
+            if entry[4]:
+                counts[entry[2]] = counts.get(entry[2], 0) + 1
+        return counts
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _prune(self) -> None:
+        while self._heap and not self._heap[0][4]:
+            heapq.heappop(self._heap)
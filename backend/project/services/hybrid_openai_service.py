@@ -1,18 +1,77 @@
 import os
+import time
+import asyncio
 import logging
-from typing import Dict, Any
-from .openai_service import OpenAIService
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Any, Callable, List, Optional
+from .openai_service import OpenAIService, PROMPT_VERSION, _apportion
+from .analysis_packer import AnalysisPacker, PackFailed, PackItem
+from .analysis_cache import scenario_fingerprint
 from .mock_openai_service import MockOpenAIService
+from .circuit_breaker import CircuitBreaker
+from .rate_scheduler import RateScheduler
+from .model_router import ModelRouter, Route
 
 logger = logging.getLogger(__name__)
 
+
+class DeadlineExceeded(TimeoutError):
+    """The OpenAI attempt ran out of its per-request deadline."""
+
+
+class InvalidAnalysis(Exception):
+    """OpenAI answered, but fields were still invalid after repair."""
+
+
 class HybridOpenAIService:
     """
     Hybrid service that tries real OpenAI first, falls back to mock on failure.
     This ensures we always try the real API for each request.
+    Successful OpenAI analyses are stored in the optional AnalysisCache and
+    served from it for identical scenarios.
+
+    A circuit breaker watches OpenAI error rate and latency; while it is open
+    requests go straight to the mock instead of waiting out the client
+    timeout. Every result carries service_used plus a service_reason saying
+    why that service was picked.
+
+    Calls may carry a deadline; OpenAI gets only the time that is left and a
+    missed deadline falls back like any other failure. With
+    ANALYSIS_HEDGE_MODE set to "mock" or "model", an OpenAI call still
+    running after the ANALYSIS_HEDGE_PERCENTILE latency of recent calls is
+    raced against the mock or OPENAI_HEDGE_MODEL, and the first success wins.
+
+    OpenAI calls also go through a RateScheduler that keeps them under the
+    configured RPM/TPM limits, queuing users fairly; a call that can't get a
+    slot in time falls back with service_reason rate_limited.
+
+    With ANALYSIS_PACKING=true, synchronous non-streaming calls that arrive
+    together are packed into one OpenAI request by an AnalysisPacker; each
+    gets its own result and token share, and scenarios the packed answer
+    left out or got wrong are analyzed on their own as usual.
+
+    A ModelRouter picks the model for each OpenAI call; results carry
+    model_used and route_reason next to service_used.
     """
     
-    def __init__(self):
+    def __init__(self, cache=None, similarity_index=None):
+        self.cache = cache
+        self.breaker = CircuitBreaker("openai")
+        self.rate_scheduler = RateScheduler()
+        self.hedge_mode = os.getenv("ANALYSIS_HEDGE_MODE", "off")
+        self.hedge_percentile = float(os.getenv("ANALYSIS_HEDGE_PERCENTILE", "0.95"))
+        # Used until the breaker has seen enough calls to estimate the percentile
+        self.hedge_delay = float(os.getenv("ANALYSIS_HEDGE_DELAY_SECONDS", "10"))
+        self.hedge_model = os.getenv("OPENAI_HEDGE_MODEL")
+        if self.hedge_mode == "model" and not self.hedge_model:
+            logger.warning("ANALYSIS_HEDGE_MODE=model needs OPENAI_HEDGE_MODEL, hedging disabled")
+            self.hedge_mode = "off"
+        self._hedge_pool = None
+        if self.hedge_mode != "off":
+            self._hedge_pool = ThreadPoolExecutor(
+                max_workers=int(os.getenv("ANALYSIS_HEDGE_WORKERS", "16")), thread_name_prefix="analysis-hedge"
+            )
         self.openai_service = None
         self.mock_service = MockOpenAIService()
         self.openai_available = True
@@ -25,34 +84,457 @@ class HybridOpenAIService:
             logger.warning(f"OpenAI service unavailable at startup: {str(e)}")
             self.openai_available = False
 
-    def analyze_partnership(self, scenario_data: Dict[str, Any]) -> Dict[str, Any]:
+        self.router = ModelRouter(self.model, rate_scheduler=self.rate_scheduler, similarity_index=similarity_index)
+        self.packer = None
+        if self.openai_service and os.getenv("ANALYSIS_PACKING", "false").lower() == "true":
+            self.packer = AnalysisPacker(self._run_pack)
+
+    @property
+    def model(self) -> str:
+        if self.openai_service:
+            return self.openai_service.model
+        return self.mock_service.model
+
+    def fingerprint(self, scenario_data: Dict[str, Any]) -> str:
+        """Identity of the analysis this scenario would produce with the current model and prompt."""
+        return scenario_fingerprint(scenario_data, self.model, PROMPT_VERSION)
+
+    def cached_analysis(self, scenario_data: Dict[str, Any]):
+        """Return a cached response for this scenario, or None."""
+        if not self.cache or not self.openai_service:
+            return None
+        # Entries are keyed by model; an answer from the fast model is as reusable as one from the default
+        models = [self.model]
+        if self.router.enabled:
+            models.append(self.router.fast_model)
+        for model in models:
+            cached = self.cache.get(scenario_data, model, PROMPT_VERSION)
+            if cached is not None:
+                return {
+                    "status": "success",
+                    "analysis": cached["analysis"],
+                    "tokens_used": 0,
+                    "analysis_duration": 0.0,
+                    "service_used": "cache",
+                    "service_reason": "cache_hit",
+                    "model_used": model
+                }
+        return None
+
+    def analyze_partnership(self, scenario_data: Dict[str, Any],
+                            on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+                            deadline: Optional[float] = None) -> Dict[str, Any]:
         """
         Try OpenAI first, fall back to mock on failure.
+        on_partial is handed to OpenAIService for streamed partial fields; the
+        returned result is authoritative even if partials were reported first.
+        deadline is a time.time() timestamp the OpenAI attempt must finish by.
         """
         
         # If OpenAI was never available, use mock
         if not self.openai_available or not self.openai_service:
             logger.info("Using mock service (OpenAI not available)")
             result = self.mock_service.analyze_partnership(scenario_data)
-            result["service_used"] = "mock"
-            return result
+            return self._tag(result, "mock", "openai_unavailable")
         
+        cached = self.cached_analysis(scenario_data)
+        if cached:
+            logger.info("Serving analysis from cache")
+            return cached
+
+        route = self.router.route(scenario_data, deadline)
+        # Streamed partials need a call of their own
+        if self.packer and not (on_partial and self.openai_service.streaming):
+            try:
+                result = self.packer.analyze(scenario_data, deadline, model=route.model)
+                if result:
+                    return self._routed(result, route)
+            except PackFailed as e:
+                logger.info(f"Packed analysis unusable ({str(e)}), analyzing on its own")
+
+        permit, reason = self._admit(scenario_data, deadline)
+        if not permit:
+            logger.info(f"Skipping OpenAI ({reason}), using mock fallback")
+            result = self.mock_service.analyze_partnership(scenario_data)
+            return self._routed(self._tag(result, "mock_fallback", reason), route)
+
+        if self.hedge_mode != "off":
+            return self._routed(self._analyze_hedged(scenario_data, on_partial, deadline, reason, permit, route.model), route)
+
         # Try OpenAI first
         try:
-            logger.info("Attempting real OpenAI analysis...")
-            result = self.openai_service.analyze_partnership(scenario_data)
-            
-            if result["status"] == "success":
-                logger.info("✅ Real OpenAI analysis successful")
-                result["service_used"] = "openai"
-                return result
-            else:
-                logger.warning(f"OpenAI returned error: {result.get('error', 'Unknown error')}")
-                raise Exception(result.get('error', 'OpenAI service error'))
-                
+            logger.info(f"Attempting real OpenAI analysis with {route.model} ({route.reason})...")
+            return self._routed(self._call_openai(scenario_data, on_partial, deadline, reason, permit, route.model), route)
         except Exception as e:
             logger.warning(f"OpenAI failed, falling back to mock: {str(e)}")
             result = self.mock_service.analyze_partnership(scenario_data)
-            result["service_used"] = "mock_fallback"
-            result["openai_error"] = str(e)
+            return self._routed(self._mark_fallback(result, e), route)
+
+    async def analyze_partnership_async(self, scenario_data: Dict[str, Any],
+                                        on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+                                        deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Async counterpart of analyze_partnership for the AsyncEngine."""
+        if not self.openai_available or not self.openai_service:
+            logger.info("Using mock service (OpenAI not available)")
+            result = await self.mock_service.analyze_partnership_async(scenario_data)
+            return self._tag(result, "mock", "openai_unavailable")
+
+        # The shared cache tier does blocking database I/O
+        cached = await asyncio.to_thread(self.cached_analysis, scenario_data)
+        if cached:
+            logger.info("Serving analysis from cache")
+            return cached
+
+        # The similarity lookup may read new results from the database
+        route = await asyncio.to_thread(self.router.route, scenario_data, deadline)
+        permit, reason = await self._admit_async(scenario_data, deadline)
+        if not permit:
+            logger.info(f"Skipping OpenAI ({reason}), using mock fallback")
+            result = await self.mock_service.analyze_partnership_async(scenario_data)
+            return self._routed(self._tag(result, "mock_fallback", reason), route)
+
+        if self.hedge_mode != "off":
+            result = await self._analyze_hedged_async(scenario_data, on_partial, deadline, reason, permit, route.model)
+            return self._routed(result, route)
+
+        try:
+            logger.info(f"Attempting real OpenAI analysis with {route.model} ({route.reason}, async)...")
+            result = await self._call_openai_async(scenario_data, on_partial, deadline, reason, permit, route.model)
+            return self._routed(result, route)
+        except Exception as e:
+            logger.warning(f"OpenAI failed, falling back to mock: {str(e)}")
+            result = await self.mock_service.analyze_partnership_async(scenario_data)
+            return self._routed(self._mark_fallback(result, e), route)
+
+    def _admit(self, scenario_data: Dict[str, Any], deadline: Optional[float]):
+        """
+        Decide whether to call OpenAI. Returns (permit, reason); permit is None
+        when the call should be skipped, with reason saying why.
+        """
+        remaining = self._remaining(deadline)
+        if remaining is not None and remaining <= 0:
+            return None, "deadline_exceeded"
+        permit = self.rate_scheduler.acquire(
+            scenario_data.get("user_id"), self.openai_service.estimate_tokens(scenario_data), timeout=remaining
+        )
+        return self._check_breaker(permit)
+
+    async def _admit_async(self, scenario_data: Dict[str, Any], deadline: Optional[float]):
+        remaining = self._remaining(deadline)
+        if remaining is not None and remaining <= 0:
+            return None, "deadline_exceeded"
+        permit = await self.rate_scheduler.acquire_async(
+            scenario_data.get("user_id"), self.openai_service.estimate_tokens(scenario_data), timeout=remaining
+        )
+        return self._check_breaker(permit)
+
+    def _run_pack(self, items: List[PackItem], model: Optional[str]) -> None:
+        """
+        One OpenAI call for a pack, under one rate permit per user in it and
+        a single breaker trial, bounded by the earliest deadline in the pack.
+        Sets each item's future; items without a valid result are left for
+        the packer to fail.
+        """
+        scenarios = [scenario_data for scenario_data, _, _ in items]
+        deadlines = [deadline for _, deadline, _ in items if deadline is not None]
+        deadline = min(deadlines) if deadlines else None
+        remaining = self._remaining(deadline)
+        if remaining is not None and remaining <= 0:
+            raise PackFailed("deadline_exceeded")
+        permits = self._acquire_pack_permits(scenarios, remaining)
+        if permits is None:
+            raise PackFailed("rate_limited")
+        allowed, reason = self.breaker.allow()
+        if not allowed:
+            for permit in permits:
+                self.rate_scheduler.release(permit)
+            raise PackFailed(reason)
+
+        start_time = time.monotonic()
+        try:
+            packed = self.openai_service.analyze_packed(scenarios, timeout=self._remaining(deadline), model=model)
+            if packed.get("tokens_used") is not None:
+                actual = _apportion(packed["tokens_used"], [permit.tokens for permit in permits])
+                for permit, tokens in zip(permits, actual):
+                    self.rate_scheduler.reconcile(permit, tokens)
+        except Exception:
+            self.breaker.record(False, time.monotonic() - start_time)
+            raise
+        self.breaker.record(packed["status"] == "success", time.monotonic() - start_time)
+        if packed["status"] != "success":
+            raise PackFailed(packed.get("error", "OpenAI service error"))
+        self.router.observe(model or self.model, time.monotonic() - start_time)
+
+        for (scenario_data, _, future), result in zip(items, packed["results"]):
+            if result is None:
+                continue
+            self._tag(result, "openai", "packed")
+            if self.cache:
+                self.cache.put(scenario_data, model or self.model, PROMPT_VERSION, result)
+            future.set_result(result)
+
+    def _acquire_pack_permits(self, scenarios: List[Dict[str, Any]], timeout: Optional[float]):
+        """
+        Rate permits for a pack: each user waits in the fair queue for their
+        own scenarios' share of the estimate, and the first pays the call's
+        one request. None (nothing left held) if any of them times out.
+        """
+        shares = _apportion(self.openai_service.estimate_packed_tokens(scenarios),
+                            [self.openai_service.estimate_tokens(scenario_data) for scenario_data in scenarios])
+        by_user = {}
+        for scenario_data, tokens in zip(scenarios, shares):
+            user_id = scenario_data.get("user_id")
+            by_user[user_id] = by_user.get(user_id, 0) + tokens
+
+        give_up = None if timeout is None else time.monotonic() + timeout
+        permits = []
+        for user_id, tokens in by_user.items():
+            left = None if give_up is None else max(0.0, give_up - time.monotonic())
+            permit = self.rate_scheduler.acquire(user_id, tokens, timeout=left, requests=0 if permits else 1)
+            if permit is None:
+                for held in permits:
+                    self.rate_scheduler.release(held)
+                return None
+            permits.append(permit)
+        return permits
+
+    def _check_breaker(self, permit):
+        # The rate slot is taken first so a half-open trial is never stuck waiting for one
+        if permit is None:
+            return None, "rate_limited"
+        allowed, reason = self.breaker.allow()
+        if not allowed:
+            self.rate_scheduler.release(permit)
+            return None, reason
+        return permit, reason
+
+    def _remaining(self, deadline: Optional[float]) -> Optional[float]:
+        if deadline is None:
+            return None
+        return deadline - time.time()
+
+    def _hedge_after(self, deadline: Optional[float]) -> float:
+        """Seconds to give OpenAI before hedging: the configured latency percentile, at most half the remaining budget."""
+        delay = self.breaker.latency_percentile(self.hedge_percentile)
+        if delay is None:
+            delay = self.hedge_delay
+        remaining = self._remaining(deadline)
+        if remaining is not None:
+            delay = min(delay, remaining / 2)
+        return max(delay, 0.0)
+
+    def _call_openai(self, scenario_data: Dict[str, Any], on_partial, deadline: Optional[float],
+                     reason: Optional[str], permit, model: Optional[str] = None) -> Dict[str, Any]:
+        """One OpenAI attempt, recorded on the breaker and rate scheduler. Raises when it fails or runs out of time."""
+        start_time = time.monotonic()
+        try:
+            result = self.openai_service.analyze_partnership(
+                scenario_data, on_partial=on_partial, timeout=self._remaining(deadline), model=model
+            )
+            self.rate_scheduler.reconcile(permit, result.get("tokens_used"))
+            result = self._accept_openai_result(scenario_data, result, reason, model)
+        except InvalidAnalysis:
+            # Upstream answered; a malformed answer is no reason to open the circuit
+            self.breaker.record(True, time.monotonic() - start_time)
+            raise
+        except Exception:
+            self.breaker.record(False, time.monotonic() - start_time)
+            raise
+        self.breaker.record(True, time.monotonic() - start_time)
+        self.router.observe(model or self.model, time.monotonic() - start_time)
+        return result
+
+    async def _call_openai_async(self, scenario_data: Dict[str, Any], on_partial, deadline: Optional[float],
+                                 reason: Optional[str], permit, model: Optional[str] = None) -> Dict[str, Any]:
+        start_time = time.monotonic()
+        try:
+            remaining = self._remaining(deadline)
+            result = await asyncio.wait_for(
+                self.openai_service.analyze_partnership_async(
+                    scenario_data, on_partial=on_partial, timeout=remaining, model=model
+                ),
+                timeout=remaining
+            )
+            self.rate_scheduler.reconcile(permit, result.get("tokens_used"))
+            if result["status"] == "success" and self.cache:
+                result = await asyncio.to_thread(self._accept_openai_result, scenario_data, result, reason, model)
+            else:
+                result = self._accept_openai_result(scenario_data, result, reason, model)
+        except InvalidAnalysis:
+            self.breaker.record(True, time.monotonic() - start_time)
+            raise
+        except asyncio.CancelledError:
+            # A winning hedge cancels this call; that says nothing about upstream health
+            self.breaker.release_trial()
+            raise
+        except Exception:
+            self.breaker.record(False, time.monotonic() - start_time)
+            raise
+        self.breaker.record(True, time.monotonic() - start_time)
+        self.router.observe(model or self.model, time.monotonic() - start_time)
+        return result
+
+    def _hedge_permit(self, scenario_data: Dict[str, Any]):
+        # A model hedge is a second full request: it needs budget of its own, and is skipped
+        # rather than queued when there is none, since the primary is already in flight
+        permit = self.rate_scheduler.try_acquire(scenario_data.get("user_id"),
+                                                 self.openai_service.estimate_tokens(scenario_data))
+        if permit is None:
+            logger.info("No rate budget left for a hedge, waiting on the primary call")
+            raise Exception("No rate budget for a hedge")
+        return permit
+
+    def _call_hedge(self, scenario_data: Dict[str, Any], deadline: Optional[float]) -> Dict[str, Any]:
+        if self.hedge_mode == "model":
+            permit = self._hedge_permit(scenario_data)
+            result = self.openai_service.analyze_partnership(
+                scenario_data, timeout=self._remaining(deadline), model=self.hedge_model
+            )
+            self.rate_scheduler.reconcile(permit, result.get("tokens_used"))
+            return self._accept_hedge_result(result)
+        result = self.mock_service.analyze_partnership(scenario_data)
+        return self._tag(result, "mock_fallback", "hedged")
+
+    async def _call_hedge_async(self, scenario_data: Dict[str, Any], deadline: Optional[float]) -> Dict[str, Any]:
+        if self.hedge_mode == "model":
+            permit = self._hedge_permit(scenario_data)
+            remaining = self._remaining(deadline)
+            result = await asyncio.wait_for(
+                self.openai_service.analyze_partnership_async(scenario_data, timeout=remaining, model=self.hedge_model),
+                timeout=remaining
+            )
+            self.rate_scheduler.reconcile(permit, result.get("tokens_used"))
+            return self._accept_hedge_result(result)
+        result = await self.mock_service.analyze_partnership_async(scenario_data)
+        return self._tag(result, "mock_fallback", "hedged")
+
+    def _accept_hedge_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        # Not cached: the cache is keyed on the primary model
+        if result["status"] != "success":
+            raise Exception(result.get("error", "Hedge model error"))
+        result["model_used"] = self.hedge_model
+        return self._tag(result, "openai", "hedge_model")
+
+    def _analyze_hedged(self, scenario_data: Dict[str, Any], on_partial, deadline: Optional[float],
+                        reason: Optional[str], permit, model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Give OpenAI until the hedge delay, then race it against the hedge and
+        return whichever succeeds first. The loser can't be interrupted and
+        finishes in the background; its partials are dropped.
+        """
+        settled = threading.Event()
+
+        def partial(fields):
+            if not settled.is_set():
+                on_partial(fields)
+
+        futures = {self._hedge_pool.submit(
+            self._call_openai, scenario_data, partial if on_partial else None, deadline, reason, permit, model
+        )}
+        error = None
+        try:
+            delay = self._hedge_after(deadline)
+            done, _ = wait(futures, timeout=delay)
+            if not done:
+                logger.info(f"OpenAI slower than {delay:.1f}s, hedging with {self.hedge_mode}")
+                futures.add(self._hedge_pool.submit(self._call_hedge, scenario_data, deadline))
+
+            while futures:
+                remaining = self._remaining(deadline)
+                done, futures = wait(futures, timeout=None if remaining is None else max(remaining, 0),
+                                     return_when=FIRST_COMPLETED)
+                if not done:
+                    error = DeadlineExceeded("Analysis deadline exceeded")
+                    break
+                for future in done:
+                    try:
+                        return future.result()
+                    except Exception as e:
+                        error = e
+        finally:
+            settled.set()
+
+        logger.warning(f"OpenAI failed, falling back to mock: {str(error)}")
+        result = self.mock_service.analyze_partnership(scenario_data)
+        return self._mark_fallback(result, error)
+
+    async def _analyze_hedged_async(self, scenario_data: Dict[str, Any], on_partial, deadline: Optional[float],
+                                    reason: Optional[str], permit, model: Optional[str] = None) -> Dict[str, Any]:
+        """Async counterpart of _analyze_hedged; here the losing attempt is cancelled."""
+        settled = False
+
+        def partial(fields):
+            if not settled:
+                on_partial(fields)
+
+        tasks = {asyncio.create_task(
+            self._call_openai_async(scenario_data, partial if on_partial else None, deadline, reason, permit, model)
+        )}
+        error = None
+        try:
+            delay = self._hedge_after(deadline)
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                logger.info(f"OpenAI slower than {delay:.1f}s, hedging with {self.hedge_mode}")
+                tasks.add(asyncio.create_task(self._call_hedge_async(scenario_data, deadline)))
+
+            while tasks:
+                remaining = self._remaining(deadline)
+                done, tasks = await asyncio.wait(tasks, timeout=None if remaining is None else max(remaining, 0),
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    error = DeadlineExceeded("Analysis deadline exceeded")
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+        finally:
+            settled = True
+            for task in tasks:
+                task.cancel()
+
+        logger.warning(f"OpenAI failed, falling back to mock: {str(error)}")
+        result = await self.mock_service.analyze_partnership_async(scenario_data)
+        return self._mark_fallback(result, error)
+
+    def _accept_openai_result(self, scenario_data: Dict[str, Any], result: Dict[str, Any],
+                              reason: Optional[str] = None, model: Optional[str] = None) -> Dict[str, Any]:
+        """Tag and cache a successful OpenAI result; raise on an error result so the caller falls back."""
+        if result["status"] == "success":
+            logger.info("✅ Real OpenAI analysis successful")
+            self._tag(result, "openai", reason or "ok")
+            if self.cache:
+                self.cache.put(scenario_data, model or self.model, PROMPT_VERSION, result)
             return result
+
+        logger.warning(f"OpenAI returned error: {result.get('error', 'Unknown error')}")
+        if result.get("timed_out"):
+            raise DeadlineExceeded(result.get("error", "OpenAI request timed out"))
+        if result.get("invalid_fields"):
+            raise InvalidAnalysis(result["error"])
+        raise Exception(result.get('error', 'OpenAI service error'))
+
+    def _tag(self, result: Dict[str, Any], service_used: str, reason: str) -> Dict[str, Any]:
+        result["service_used"] = service_used
+        result["service_reason"] = reason
+        if service_used.startswith("mock"):
+            result["model_used"] = self.mock_service.model
+        return result
+
+    def _routed(self, result: Dict[str, Any], route: Route) -> Dict[str, Any]:
+        """Record the routing decision; model_used stays as set by a hedge or the mock."""
+        result.setdefault("model_used", route.model)
+        result["route_reason"] = route.reason
+        return result
+
+    def _mark_fallback(self, result: Dict[str, Any], error: Exception) -> Dict[str, Any]:
+        if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+            reason = "deadline_exceeded"
+        elif isinstance(error, InvalidAnalysis):
+            reason = "invalid_response"
+        else:
+            reason = "openai_error"
+        self._tag(result, "mock_fallback", reason)
+        result["openai_error"] = str(error)
+        return result
@@ -0,0 +1,93 @@
+import json
+from typing import Any, List, Tuple
+
+
+class IncrementalObjectParser:
+    """
+    Parses a JSON object that arrives in chunks and reports each top-level
+    field as soon as its value is complete, e.g. "risk_level" is available
+    before "market_insights" has finished streaming.
+
+    Text before the opening brace (such as a ```json fence) is skipped.
+    Fields whose value isn't valid JSON are reported in `errors` rather than
+    raising, so a bad field doesn't hide the rest of the object.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+        self.errors = {}
+        self.done = False
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect = "key"
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume the next chunk and return the (key, value) pairs it completed."""
+        self.buffer += chunk
+        completed = []
+
+        while self._pos < len(self.buffer) and not self.done:
+            char = self.buffer[self._pos]
+
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect == "key_end":
+                        self._key = json.loads(self.buffer[self._key_start:self._pos + 1])
+                        self._expect = "colon"
+                self._pos += 1
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect == "key":
+                    self._key_start = self._pos
+                    self._expect = "key_end"
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 1 and char == "}":
+                    self._close_value(completed)
+                    self.done = True
+                self._depth -= 1
+            elif char == ":" and self._depth == 1 and self._expect == "colon":
+                self._value_start = self._pos + 1
+                self._expect = "value"
+            elif char == "," and self._depth == 1:
+                self._close_value(completed)
+
+            self._pos += 1
+
+        return completed
+
+    def _close_value(self, completed: List[Tuple[str, Any]]) -> None:
+        if self._expect != "value":
+            return
+        raw = self.buffer[self._value_start:self._pos].strip()
+        try:
+            value = json.loads(raw)
+            self.fields[self._key] = value
+            completed.append((self._key, value))
+        except json.JSONDecodeError as e:
+            self.errors[self._key] = str(e)
+        self._expect = "key"
+        self._key = None
+        self._value_start = None
@@ -0,0 +1,177 @@
+import os
+import json
+import uuid
+import queue
+import select
+import logging
+import threading
+from typing import Any, Dict
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed")
+# "scope" claim of the short-lived tokens that may only open a job's event stream
+STREAM_TOKEN_SCOPE = "job_events"
+
+# pg_notify rejects payloads of 8000 bytes or more
+MAX_NOTIFY_BYTES = 7900
+
+
+class JobEventBus:
+    """
+    In-process pub/sub of job status events, keyed by job_id.
+    Subscribers get a Queue of event dicts. Events published in other
+    processes arrive through the notifier (see PostgresNotifier).
+    """
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self.notifier = None
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, job_id: str) -> queue.Queue:
+        subscription = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(job_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, job_id: str, subscription: queue.Queue) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        event = dict(event, job_id=job_id)
+        self.deliver(job_id, event)
+        if self.notifier:
+            self.notifier.publish(job_id, event)
+
+    def deliver(self, job_id: str, event: Dict[str, Any]) -> None:
+        """Hand an event to this process's subscribers only."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(job_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                # A stalled client shouldn't hold up the job; it still gets the terminal snapshot
+                logger.warning(f"Dropping event for slow subscriber of job {job_id}")
+
+
+class PostgresNotifier:
+    """
+    Relays bus events between processes with PostgreSQL LISTEN/NOTIFY.
+    Payloads carry only the small status event (streamed partial fields
+    stay in the publishing process); subscribers fetch full results from
+    the database when a job reaches a terminal status. Works with psycopg2
+    and psycopg 3.
+    """
+
+    channel = "analysis_job_events"
+
+    def __init__(self, bus: JobEventBus, engine):
+        self.bus = bus
+        self.engine = engine
+        self.origin = uuid.uuid4().hex
+        self._stop = threading.Event()
+        # Publishing is handed to a sender thread so job threads and the async loop never wait on NOTIFY
+        self._outbox = queue.Queue(maxsize=10000)
+        self._listener = threading.Thread(target=self._listen, name="job-events-listener", daemon=True)
+        self._listener.start()
+        self._sender = threading.Thread(target=self._send, name="job-events-sender", daemon=True)
+        self._sender.start()
+
+    def publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        payload = self._payload(job_id, {key: value for key, value in event.items() if key != "partial"})
+        if len(payload.encode()) > MAX_NOTIFY_BYTES:
+            payload = self._payload(job_id, {key: event[key] for key in ("job_id", "status", "progress") if key in event})
+        try:
+            self._outbox.put_nowait(payload)
+        except queue.Full:
+            logger.warning(f"Job event outbox full, dropping event for job {job_id}")
+
+    def _payload(self, job_id: str, event: Dict[str, Any]) -> str:
+        return json.dumps({"origin": self.origin, "job_id": job_id, "event": event})
+
+    def _send(self):
+        while not self._stop.is_set():
+            try:
+                payload = self._outbox.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                with self.engine.connect() as conn:
+                    conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": payload})
+                    conn.commit()
+            except Exception as e:
+                logger.warning(f"Failed to notify job event: {str(e)}")
+
+    def _listen(self):
+        while not self._stop.is_set():
+            connection = None
+            try:
+                connection = self.engine.raw_connection()
+                dbapi_connection = connection.driver_connection
+                dbapi_connection.autocommit = True
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                logger.info(f"Listening for job events on {self.channel}")
+
+                while not self._stop.is_set():
+                    for payload in self._notifications(dbapi_connection, 5):
+                        self._handle(payload)
+            except Exception as e:
+                logger.error(f"Job event listener failed, reconnecting: {str(e)}")
+                self._stop.wait(2)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.invalidate()
+                    except Exception:
+                        pass
+
+    @staticmethod
+    def _notifications(dbapi_connection, timeout: float):
+        """Payloads of the notifications received within timeout seconds."""
+        if hasattr(dbapi_connection, "poll"):
+            # psycopg2: wait for the socket, then poll() fills the notifies list
+            if select.select([dbapi_connection], [], [], timeout) == ([], [], []):
+                return []
+            dbapi_connection.poll()
+            payloads = [notify.payload for notify in dbapi_connection.notifies]
+            dbapi_connection.notifies.clear()
+            return payloads
+        # psycopg 3 (3.2+): yields each notification as it arrives, stops after timeout
+        return (notify.payload for notify in dbapi_connection.notifies(timeout=timeout))
+
+    def _handle(self, payload: str) -> None:
+        message = json.loads(payload)
+        if message["origin"] == self.origin:
+            return
+        self.bus.deliver(message["job_id"], message["event"])
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def create_event_bus(engine) -> JobEventBus:
+    """
+    Build the bus for this process. JOB_EVENTS_BACKEND=auto (default) fans out
+    through PostgreSQL when the database is PostgreSQL; SQLite deployments run
+    in a single process and only need local delivery.
+    """
+    bus = JobEventBus()
+    backend = os.getenv("JOB_EVENTS_BACKEND", "auto")
+    if backend == "postgres" or (backend == "auto" and engine.dialect.name == "postgresql"):
+        bus.notifier = PostgresNotifier(bus, engine)
+    return bus
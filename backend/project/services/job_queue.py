@@ -0,0 +1,243 @@
+import os
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import aliased
+
+from ..models import db, AnalysisJob, AnalysisJobGroup
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseJobQueue:
+    """
+    Work queue on top of the analysis_job table.
+
+    Workers claim a job by taking a time-limited lease on its row. Leases are
+    extended by heartbeats while the job runs; a job whose lease expires (the
+    worker died or the dyno restarted) becomes claimable again. PostgreSQL
+    claims with SELECT ... FOR UPDATE SKIP LOCKED, other databases fall back
+    to a compare-and-set UPDATE on the candidate row.
+
+    Jobs that belong to an AnalysisJobGroup are only claimable while fewer
+    than the group's max_concurrency jobs hold live leases. Concurrent
+    claims can overshoot that cap by a job or two; it is a throttle, not a
+    hard guarantee.
+    """
+
+    def __init__(self, lease_seconds: int = None, max_attempts: int = None):
+        self.lease_seconds = lease_seconds or int(os.getenv("JOB_LEASE_SECONDS", "60"))
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+    def _claimable(self, now: datetime):
+        running = aliased(AnalysisJob)
+        group_running = (
+            select(func.count())
+            .select_from(running)
+            .where(running.group_id == AnalysisJob.group_id,
+                   running.status == "processing",
+                   running.lease_expires_at >= now)
+            .correlate(AnalysisJob)
+            .scalar_subquery()
+        )
+        group_limit = (
+            select(AnalysisJobGroup.max_concurrency)
+            .where(AnalysisJobGroup.group_id == AnalysisJob.group_id)
+            .correlate(AnalysisJob)
+            .scalar_subquery()
+        )
+        # Coalesced followers are finished by their leader, never claimed
+        return and_(
+            AnalysisJob.coalesced_into.is_(None),
+            or_(
+                AnalysisJob.status == "pending",
+                and_(AnalysisJob.status == "processing", AnalysisJob.lease_expires_at < now),
+            ),
+            or_(AnalysisJob.group_id.is_(None), group_running < group_limit),
+        )
+
+    def claim(self, worker_id: str) -> Optional[str]:
+        """Lease the oldest claimable job to worker_id and return its job_id."""
+        while True:
+            job_id, attempts = self._claim_one(worker_id)
+            if job_id is None:
+                return None
+            if attempts <= self.max_attempts:
+                return job_id
+            self._give_up(job_id, worker_id)
+
+    def _claim_one(self, worker_id: str):
+        now = datetime.utcnow()
+        values = {
+            "status": "processing",
+            "lease_owner": worker_id,
+            "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+            "heartbeat_at": now,
+            "attempts": func.coalesce(AnalysisJob.attempts, 0) + 1,
+        }
+
+        if db.engine.dialect.name == "postgresql":
+            stmt = (
+                select(AnalysisJob.id, AnalysisJob.job_id)
+                .where(self._claimable(now))
+                .order_by(AnalysisJob.created_at)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            row = db.session.execute(stmt).first()
+            if not row:
+                db.session.rollback()
+                return None, 0
+            db.session.execute(update(AnalysisJob).where(AnalysisJob.id == row.id).values(**values))
+            attempts = db.session.execute(select(AnalysisJob.attempts).where(AnalysisJob.id == row.id)).scalar()
+            db.session.commit()
+            return row.job_id, attempts
+
+        # No row locks: pick a candidate and take it only if nobody else did first
+        candidates = db.session.execute(
+            select(AnalysisJob.id, AnalysisJob.job_id)
+            .where(self._claimable(now))
+            .order_by(AnalysisJob.created_at)
+            .limit(10)
+        ).all()
+        for row in candidates:
+            result = db.session.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id == row.id, self._claimable(now))
+                .values(**values)
+            )
+            if result.rowcount == 1:
+                attempts = db.session.execute(select(AnalysisJob.attempts).where(AnalysisJob.id == row.id)).scalar()
+                db.session.commit()
+                return row.job_id, attempts
+            db.session.rollback()
+        db.session.rollback()
+        return None, 0
+
+    def _give_up(self, job_id: str, worker_id: str):
+        logger.warning(f"Job {job_id} exceeded {self.max_attempts} delivery attempts, marking failed")
+        db.session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.job_id == job_id, AnalysisJob.lease_owner == worker_id)
+            .values(status="failed", error_message="Exceeded maximum delivery attempts",
+                    lease_expires_at=None, completed_at=datetime.utcnow())
+        )
+        db.session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.coalesced_into == job_id, AnalysisJob.status == "pending")
+            .values(status="failed", error_message="Exceeded maximum delivery attempts",
+                    completed_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Extend the lease. Returns False if the worker no longer holds it."""
+        now = datetime.utcnow()
+        result = db.session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.job_id == job_id,
+                   AnalysisJob.lease_owner == worker_id,
+                   AnalysisJob.status == "processing")
+            .values(lease_expires_at=now + timedelta(seconds=self.lease_seconds), heartbeat_at=now)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def holds_lease(self, job: AnalysisJob, worker_id: str) -> bool:
+        db.session.refresh(job)
+        return job.lease_owner == worker_id and job.status == "processing"
+
+    def stats(self) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        counts = dict(
+            db.session.execute(
+                select(AnalysisJob.status, func.count())
+                .where(AnalysisJob.status.in_(["pending", "processing"]), AnalysisJob.coalesced_into.is_(None))
+                .group_by(AnalysisJob.status)
+            ).all()
+        )
+        expired = db.session.execute(
+            select(func.count())
+            .select_from(AnalysisJob)
+            .where(AnalysisJob.status == "processing", AnalysisJob.lease_expires_at < now)
+        ).scalar()
+        return {
+            "mode": "database",
+            "queue_depth": counts.get("pending", 0),
+            "processing": counts.get("processing", 0),
+            "expired_leases": expired,
+            "lease_seconds": self.lease_seconds,
+            "max_attempts": self.max_attempts,
+        }
+
+
+class QueueWorker:
+    """
+    Drains the database job queue with a fixed number of threads.
+    Used by worker.py; every thread claims, heartbeats and runs one job at a time.
+    """
+
+    def __init__(self, app, job_service, concurrency: int = None, poll_interval: float = None):
+        self.app = app
+        self.job_service = job_service
+        self.queue = job_service.job_queue
+        self.concurrency = concurrency or int(os.getenv("QUEUE_WORKER_CONCURRENCY", "4"))
+        self.poll_interval = poll_interval or float(os.getenv("QUEUE_POLL_INTERVAL", "1.0"))
+        self.heartbeat_interval = max(1.0, self.queue.lease_seconds / 3)
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._threads = []
+
+    def run(self):
+        """Start the worker threads and block until stop() is called."""
+        logger.info(f"Queue worker {self.worker_prefix} starting with {self.concurrency} threads")
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._loop, args=(f"{self.worker_prefix}:{i}",), name=f"queue-worker-{i}")
+            thread.start()
+            self._threads.append(thread)
+        for thread in self._threads:
+            thread.join()
+        logger.info(f"Queue worker {self.worker_prefix} stopped")
+
+    def stop(self):
+        logger.info("Queue worker stopping after in-flight jobs finish")
+        self._stop.set()
+
+    def _loop(self, worker_id: str):
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    job_id = self.queue.claim(worker_id)
+                except Exception as e:
+                    logger.error(f"Claiming job failed: {str(e)}")
+                    db.session.rollback()
+                    job_id = None
+
+                if job_id is None:
+                    self._stop.wait(self.poll_interval)
+                    continue
+
+                logger.info(f"Worker {worker_id} claimed job {job_id}")
+                done = threading.Event()
+                heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, worker_id, done), daemon=True)
+                heartbeat.start()
+                try:
+                    self.job_service.process_claimed_job(job_id, worker_id)
+                finally:
+                    done.set()
+                    heartbeat.join()
+
+    def _heartbeat(self, job_id: str, worker_id: str, done: threading.Event):
+        with self.app.app_context():
+            while not done.wait(self.heartbeat_interval):
+                try:
+                    if not self.queue.heartbeat(job_id, worker_id):
+                        logger.warning(f"Worker {worker_id} lost the lease on job {job_id}")
+                        return
+                except Exception as e:
+                    logger.error(f"Heartbeat for job {job_id} failed: {str(e)}")
+                    db.session.rollback()
@@ -1,92 +1,704 @@
+import os
+import time
 import uuid
 import json
+import queue
+import atexit
+import hashlib
 import logging
 import threading
-from datetime import datetime
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
 from flask import current_app
+from sqlalchemy import update
 
-from ..models import db, AnalysisJob, AnalysisResult, PartnershipScenario
+from ..models import db, AnalysisJob, AnalysisJobGroup, AnalysisResult, PartnershipScenario
+from ..metrics import (
+    ANALYSIS_DURATION, ANALYSIS_RESULTS, ANALYSIS_ROUTE_DURATION, ANALYSIS_ROUTE_TOKENS, ANALYSIS_TOKENS
+)
+from ..profiling import SLOW_LOG, StageTimer, profiling_enabled
+from .worker_pool import WorkerPool, QueueFullError
+from .job_queue import DatabaseJobQueue
+from .async_engine import AsyncEngine
+from .portfolio_analytics import record_result
 
 logger = logging.getLogger(__name__)
 
+# Top-level fields in an analysis response, used to turn streamed fields into progress
+PARTIAL_FIELD_COUNT = 7
+
 class JobService:
-    def __init__(self, app, openai_service):
+    """
+    Creates analysis jobs and runs them.
+
+    In "local" queue mode (default) jobs run in this process, either on the
+    worker pool or, with ANALYSIS_ENGINE=async, as coroutines on the
+    AsyncEngine event loop. In "database" mode jobs are only written to the analysis_job table and
+    drained by worker.py processes through DatabaseJobQueue leases.
+
+    Identical in-flight analyses are coalesced: a new job whose scenario
+    fingerprint matches a pending or processing job attaches to it as a
+    follower (coalesced_into) instead of calling upstream, and is completed
+    from the leader's response. Because leaders are looked up in the job
+    table this also works across processes; two processes racing on the very
+    first job of a fingerprint may still both become leaders.
+
+    Each job gets an analysis deadline (ANALYSIS_DEADLINE_SECONDS, or a
+    per-request value capped at ANALYSIS_MAX_DEADLINE_SECONDS) that starts
+    when a worker picks it up and is handed to the analysis service.
+    """
+
+    def __init__(self, app, openai_service, worker_pool=None, queue_mode=None, events=None):
         self.app = app
         self.openai_service = openai_service
+        self.events = events
+        self.coalesce_window = int(os.getenv("ANALYSIS_COALESCE_WINDOW", "300"))
+        # 0 disables the default deadline; clients can still ask for one
+        self.default_deadline = float(os.getenv("ANALYSIS_DEADLINE_SECONDS", "60"))
+        self.max_deadline = float(os.getenv("ANALYSIS_MAX_DEADLINE_SECONDS", "300"))
+        self._coalesce_lock = threading.Lock()
+        # Local-mode job groups: backlog of undispatched jobs and running count per group
+        self._groups = {}
+        self._group_lock = threading.Lock()
+        # Fields streamed so far for jobs running in this process
+        self._partials = {}
+        self._partials_lock = threading.Lock()
+        # Per-stage timings of jobs running in this process (PROFILING_ENABLED only)
+        self.profiling = profiling_enabled()
+        self._stage_timers = {}
+        self._stage_timers_lock = threading.Lock()
+        # Serialized status of completed jobs, which never change: job_id -> (body, etag, status)
+        self.completed_cache_size = int(os.getenv("COMPLETED_JOB_CACHE_SIZE", "2000"))
+        self._completed = OrderedDict()
+        self._completed_lock = threading.Lock()
+        self.queue_mode = queue_mode or os.getenv("JOB_QUEUE_MODE", "local")
+        self.worker_pool = None
+        self.async_engine = None
+        self.job_queue = None
+
+        if self.queue_mode == "database":
+            self.job_queue = DatabaseJobQueue()
+            self.max_pending = int(os.getenv("JOB_QUEUE_MAX_PENDING", "1000"))
+            self.retry_after = int(os.getenv("ANALYSIS_RETRY_AFTER", "5"))
+        elif os.getenv("ANALYSIS_ENGINE", "threads") == "async" and hasattr(openai_service, "analyze_partnership_async"):
+            self.async_engine = AsyncEngine()
+            atexit.register(self.shutdown)
+        else:
+            self.worker_pool = worker_pool or WorkerPool()
+            atexit.register(self.shutdown)
+
+    # Looked up per use: openai_service may be a LazyService that isn't built until the first job
+    @property
+    def cache_lookup(self):
+        return getattr(self.openai_service, "cached_analysis", None)
+
+    @property
+    def fingerprint(self):
+        return getattr(self.openai_service, "fingerprint", None)
+
+    def create_analysis_job(self, scenario_id, user_id, deadline_seconds=None):
+        self._check_admission(1)
+
+        scenario = db.session.get(PartnershipScenario, scenario_id)
+        job, runnable = self._prepare_job(scenario_id, scenario, user_id, deadline_seconds=deadline_seconds)
+
+        if not runnable or self.job_queue:
+            # Finished already, attached to a leader, or left for a queue worker to claim
+            return job.job_id
+
+        try:
+            self._dispatch(job.job_id, current_app._get_current_object(), user_id=user_id)
+        except QueueFullError:
+            # Nothing will ever pick the job up, so don't leave it behind as pending. Failing it
+            # rather than deleting it also fails any identical request that attached meanwhile
+            self._mark_failed(job, "Analysis queue is full")
+            raise
 
-    def create_analysis_job(self, scenario_id, user_id):
-        job_id = str(uuid.uuid4())
+        return job.job_id
+
+    def create_job_group(self, scenarios, user_id, max_concurrency, deadline_seconds=None):
+        """
+        Create one job per scenario under a new AnalysisJobGroup.
+        At most max_concurrency of the group's jobs run at a time; the
+        deadline applies to each job on its own.
+        """
+        self._check_admission(len(scenarios))
+
+        group = AnalysisJobGroup(group_id=str(uuid.uuid4()), user_id=user_id, max_concurrency=max_concurrency)
+        db.session.add(group)
+        db.session.commit()
+
+        jobs = []
+        runnable_ids = []
+        for scenario in scenarios:
+            job, runnable = self._prepare_job(scenario.id, scenario, user_id, group_id=group.group_id,
+                                              deadline_seconds=deadline_seconds)
+            jobs.append(job)
+            if runnable:
+                runnable_ids.append(job.job_id)
+
+        if not self.job_queue:
+            self._enqueue_group(group.group_id, max_concurrency, runnable_ids, current_app._get_current_object(), user_id)
+
+        logger.info(f"Job group {group.group_id} created with {len(jobs)} jobs ({len(runnable_ids)} to run)")
+        return group, jobs
+
+    def _check_admission(self, count):
+        if not self.job_queue:
+            return
+        pending = AnalysisJob.query.filter_by(status="pending", coalesced_into=None).count()
+        if pending + count > self.max_pending:
+            logger.warning(f"Job queue saturated ({pending} pending), rejecting {count} job(s)")
+            raise QueueFullError(self.retry_after)
+
+    def _deadline_for(self, deadline_seconds):
+        seconds = deadline_seconds or self.default_deadline
+        if not seconds:
+            return None
+        return max(1.0, min(float(seconds), self.max_deadline))
+
+    def _prepare_job(self, scenario_id, scenario, user_id, group_id=None, deadline_seconds=None):
+        """
+        Create the job row. Returns (job, runnable); runnable is False when the
+        job was completed from the cache or attached to an in-flight leader.
+        """
         job = AnalysisJob(
-            job_id=job_id,
+            job_id=str(uuid.uuid4()),
             scenario_id=scenario_id,
             user_id=user_id,
-            status="pending"
+            group_id=group_id,
+            status="pending",
+            progress=0,
+            deadline_seconds=self._deadline_for(deadline_seconds)
         )
+
+        # A cached analysis completes the job right away without taking a worker slot
+        scenario_data = scenario.to_dict() if scenario else None
+        cached = self.cache_lookup(scenario_data) if self.cache_lookup and scenario else None
+        if cached:
+            job.started_at = datetime.utcnow()
+            db.session.add(job)
+            self._store_result(job, scenario.id, cached)
+            logger.info(f"Job {job.job_id} completed from analysis cache")
+            return job, False
+
+        if self.fingerprint and scenario:
+            job.fingerprint = self.fingerprint(scenario_data)
+            if self._attach_to_leader(job):
+                return job, False
+
         db.session.add(job)
         db.session.commit()
+        return job, True
+
+    def _dispatch(self, job_id, app, group_id=None, user_id=None):
+        if self.async_engine:
+            self.async_engine.submit(self._process_analysis_job_async(job_id, app, group_id))
+        else:
+            # Keyed by user so the pool starts jobs in fair order across users
+            self.worker_pool.submit(self._process_analysis_job, job_id, app, group_id, key=user_id)
+
+    def _enqueue_group(self, group_id, max_concurrency, job_ids, app, user_id=None):
+        with self._group_lock:
+            self._groups[group_id] = {"backlog": deque(job_ids), "active": 0, "limit": max_concurrency,
+                                      "user_id": user_id}
+        self._pump_group(group_id, app)
+
+    def _pump_group(self, group_id, app):
+        """Dispatch backlog jobs of a local group until its concurrency limit is reached."""
+        while True:
+            with self._group_lock:
+                group = self._groups.get(group_id)
+                if group is None:
+                    return
+                if not group["backlog"]:
+                    if group["active"] == 0:
+                        del self._groups[group_id]
+                    return
+                if group["active"] >= group["limit"]:
+                    return
+                job_id = group["backlog"].popleft()
+                group["active"] += 1
+
+            try:
+                self._dispatch(job_id, app, group_id, user_id=group["user_id"])
+            except QueueFullError as e:
+                with self._group_lock:
+                    group["backlog"].appendleft(job_id)
+                    group["active"] -= 1
+                # Try again once the pool has had a chance to drain
+                timer = threading.Timer(e.retry_after, self._pump_group, args=(group_id, app))
+                timer.daemon = True
+                timer.start()
+                return
+
+    def _group_job_done(self, group_id, app):
+        with self._group_lock:
+            group = self._groups.get(group_id)
+            if group is None:
+                return
+            group["active"] -= 1
+        self._pump_group(group_id, app)
+
+    def _attach_to_leader(self, job):
+        """Make job a follower of an in-flight job with the same fingerprint, if any."""
+        with self._coalesce_lock:
+            # Leaders older than the window are presumed lost (local mode has no re-delivery)
+            cutoff = datetime.utcnow() - timedelta(seconds=self.coalesce_window)
+            leader = AnalysisJob.query.filter(
+                AnalysisJob.fingerprint == job.fingerprint,
+                AnalysisJob.coalesced_into.is_(None),
+                AnalysisJob.status.in_(["pending", "processing"]),
+                AnalysisJob.created_at >= cutoff
+            ).order_by(AnalysisJob.created_at).first()
+            if not leader:
+                return False
+
+            job.coalesced_into = leader.job_id
+            db.session.add(job)
+            db.session.commit()
 
-        thread = threading.Thread(target=self._process_analysis_job, args=(job_id, current_app._get_current_object()))
-        thread.daemon = True
-        thread.start()
+        logger.info(f"Job {job.job_id} coalesced into in-flight job {leader.job_id}")
 
-        return job_id
+        # The leader may have finished before we attached and missed us in its sweep
+        db.session.refresh(leader)
+        if leader.status == "completed":
+            leader_result = AnalysisResult.query.filter_by(job_id=leader.job_id).first()
+            if leader_result:
+                self._complete_followers(leader.job_id, leader_result.to_dict(), job_ids=[job.job_id])
+        elif leader.status == "failed":
+            self._fail_followers(leader.job_id, leader.error_message, job_ids=[job.job_id])
+        return True
 
     def get_job_status(self, job_id):
         job = AnalysisJob.query.filter_by(job_id=job_id).first()
         if not job:
             return None
-        
-        result = {"job_id": job.job_id, "status": job.status}
+
+        result = {"job_id": job.job_id, "status": job.status, "progress": job.progress or 0}
+        if job.status == "failed":
+            result["error"] = job.error_message
+        if job.deadline_at and job.status in ("pending", "processing"):
+            result["deadline_at"] = job.deadline_at.isoformat()
+        if job.stage_timings:
+            result["stage_timings"] = json.loads(job.stage_timings)
+        if job.status == "processing":
+            with self._partials_lock:
+                partial = self._partials.get(job_id)
+                if partial:
+                    result["partial"] = dict(partial)
         if job.status == "completed":
             analysis_result = AnalysisResult.query.filter_by(job_id=job_id).first()
             if analysis_result:
                 result["analysis"] = analysis_result.to_dict()
-        
+
         return result
 
-    def _process_analysis_job(self, job_id, app):
+    def cached_etag(self, job_id):
+        """ETag of a completed job's cached payload, without touching the database."""
+        with self._completed_lock:
+            cached = self._completed.get(job_id)
+        return cached[1] if cached else None
+
+    def job_status_payload(self, job_id):
+        """
+        The job status as (serialized body, strong ETag, status), or None.
+        Completed payloads are kept in memory, so repeat polls of a finished
+        job skip both queries and the serialization.
+        """
+        with self._completed_lock:
+            cached = self._completed.get(job_id)
+            if cached:
+                self._completed.move_to_end(job_id)
+                return cached
+
+        status = self.get_job_status(job_id)
+        if status is None:
+            return None
+        body = self.app.json.dumps(status)
+        payload = (body, hashlib.sha256(body.encode()).hexdigest()[:32], status["status"])
+        # With profiling on, stage timings land just after completion; cache once they are in
+        if status["status"] == "completed" and (not self.profiling or "stage_timings" in status):
+            with self._completed_lock:
+                self._completed[job_id] = payload
+                while len(self._completed) > self.completed_cache_size:
+                    self._completed.popitem(last=False)
+        return payload
+
+    def wait_for_job_status(self, job_id, timeout, seen_etags=None):
+        """
+        Long-poll: return the job status once it differs from what the client
+        has seen, or after timeout seconds. Without seen_etags the client is
+        assumed to have seen the current status. Wakes on the job event bus.
+        """
+        if not self.events:
+            return self.job_status_payload(job_id)
+
+        # Subscribe before reading so a transition between the two still wakes us
+        subscription = self.events.subscribe(job_id)
+        try:
+            payload = self.job_status_payload(job_id)
+            if payload is None or payload[2] in ("completed", "failed"):
+                return payload
+            if seen_etags is not None and payload[1] not in seen_etags:
+                return payload
+
+            seen = payload[1]
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return payload
+                # Return the request's connection while blocked; the next read checks out a fresh one
+                db.session.remove()
+                try:
+                    subscription.get(timeout=remaining)
+                except queue.Empty:
+                    return self.job_status_payload(job_id)
+                # Some events (e.g. "saving") are published before the row they describe changes
+                payload = self.job_status_payload(job_id)
+                if payload is None or payload[1] != seen:
+                    return payload
+        finally:
+            self.events.unsubscribe(job_id, subscription)
+
+    def get_group_status(self, group_id, user_id):
+        group = AnalysisJobGroup.query.filter_by(group_id=group_id, user_id=user_id).first()
+        if not group:
+            return None
+
+        jobs = AnalysisJob.query.filter_by(group_id=group_id).order_by(AnalysisJob.id).all()
+        completed_ids = [job.job_id for job in jobs if job.status == "completed"]
+        results = {}
+        if completed_ids:
+            for analysis_result in AnalysisResult.query.filter(AnalysisResult.job_id.in_(completed_ids)):
+                results[analysis_result.job_id] = analysis_result.to_dict()
+
+        counts = {"pending": 0, "processing": 0, "completed": 0, "failed": 0}
+        job_states = []
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+            state = {"job_id": job.job_id, "scenario_id": job.scenario_id, "status": job.status}
+            if job.status == "failed":
+                state["error"] = job.error_message
+            if job.job_id in results:
+                state["analysis"] = results[job.job_id]
+            job_states.append(state)
+
+        finished = counts["completed"] + counts["failed"]
+        if finished == len(jobs):
+            status = "completed"
+        elif counts["processing"] or finished:
+            status = "processing"
+        else:
+            status = "pending"
+
+        return {
+            "group_id": group.group_id,
+            "status": status,
+            "total": len(jobs),
+            "max_concurrency": group.max_concurrency,
+            "counts": counts,
+            "jobs": job_states,
+            "created_at": group.created_at.isoformat()
+        }
+
+    def queue_stats(self):
+        if self.job_queue:
+            return self.job_queue.stats()
+        if self.async_engine:
+            return dict(self.async_engine.stats(), mode="local", engine="async")
+        return dict(self.worker_pool.stats(), mode="local", engine="threads")
+
+    def shutdown(self, wait=True):
+        if self.worker_pool:
+            self.worker_pool.shutdown(wait=wait)
+        if self.async_engine:
+            self.async_engine.shutdown(wait=wait)
+
+    def process_claimed_job(self, job_id, worker_id):
+        """Run a job leased from the database queue. Needs an app context."""
+        try:
+            self._run_analysis_job(job_id, lease_owner=worker_id)
+        except Exception as e:
+            logger.error(f"Analysis job {job_id} crashed: {str(e)}")
+            db.session.rollback()
+            # Leave the job leased; it is re-delivered when the lease expires
+
+    def _process_analysis_job(self, job_id, app, group_id=None):
         with app.app_context():
-            job = AnalysisJob.query.filter_by(job_id=job_id).first()
-            if not job:
+            try:
+                self._run_analysis_job(job_id)
+            except Exception as e:
+                self._fail_crashed_job(job_id, e)
+        if group_id:
+            self._group_job_done(group_id, app)
+
+    async def _process_analysis_job_async(self, job_id, app, group_id=None):
+        """Coroutine version of _process_analysis_job; database stages run on the engine's thread pool."""
+        run_sync = self.async_engine.run_sync
+        try:
+            started = await run_sync(self._in_app_context, app, self._start_job, job_id)
+            if started is None:
                 return
+            scenario_data, deadline = started
+            # App context lets the cache reach the shared table from its helper threads
+            with app.app_context(), self._stage(job_id, "analyze"):
+                analysis_response = await self.openai_service.analyze_partnership_async(
+                    scenario_data, on_partial=self._partial_handler(job_id), deadline=deadline
+                )
+            await run_sync(self._in_app_context, app, self._finish_job, job_id, scenario_data, analysis_response)
+        except Exception as e:
+            await run_sync(self._in_app_context, app, self._fail_crashed_job, job_id, e)
+        finally:
+            if group_id:
+                self._group_job_done(group_id, app)
+
+    def _in_app_context(self, app, fn, *args):
+        with app.app_context():
+            return fn(*args)
+
+    def _partial_handler(self, job_id):
+        """Callback that records streamed fields and publishes them as partial results."""
+        def on_partial(fields):
+            with self._partials_lock:
+                partial = self._partials.setdefault(job_id, {})
+                partial.update(fields)
+                received = len(partial)
+            # Streaming covers the 30-90 progress band, roughly one step per analysis field
+            progress = min(89, 30 + int(60 * received / PARTIAL_FIELD_COUNT))
+            self._publish(job_id, "processing", progress, stage="streaming", partial=fields)
+        return on_partial
+
+    def _clear_partial(self, job_id):
+        with self._partials_lock:
+            self._partials.pop(job_id, None)
 
-            job.status = "processing"
+    @contextmanager
+    def _stage(self, job_id, name):
+        """Time a stage of a job's processing; a no-op unless profiling is enabled."""
+        if not self.profiling:
+            yield
+            return
+        with self._stage_timers_lock:
+            timer = self._stage_timers.setdefault(job_id, StageTimer())
+        with timer.stage(name):
+            yield
+
+    def _record_timings(self, job, analysis_response=None):
+        """Persist the job's stage breakdown and offer it to the slow-request log."""
+        with self._stage_timers_lock:
+            timer = self._stage_timers.pop(job.job_id, None)
+        if timer is None:
+            return
+        if analysis_response and analysis_response.get("timings"):
+            for name, seconds in analysis_response["timings"].items():
+                timer.add(name, seconds)
+        stages = timer.breakdown()
+        if job.started_at and job.created_at:
+            stages["queue_wait"] = round((job.started_at - job.created_at).total_seconds(), 4)
+        try:
+            job.stage_timings = json.dumps(stages)
             db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Could not save stage timings for job {job.job_id}: {str(e)}")
+        SLOW_LOG.record(timer.elapsed(), {
+            "kind": "job",
+            "job_id": job.job_id,
+            "status": job.status,
+            "stages": stages,
+        })
 
-            scenario = PartnershipScenario.query.get(job.scenario_id)
-            if not scenario:
-                job.status = "failed"
-                job.error_message = "Scenario not found"
-                db.session.commit()
-                return
+    def _fail_crashed_job(self, job_id, error):
+        logger.error(f"Analysis job {job_id} crashed: {str(error)}")
+        db.session.rollback()
+        job = AnalysisJob.query.filter_by(job_id=job_id).first()
+        if job:
+            self._mark_failed(job, str(error)[:500])
 
-            scenario_data = scenario.to_dict()
-            analysis_response = self.openai_service.analyze_partnership(scenario_data)
+    def _publish(self, job_id, status, progress, **extra):
+        if self.events:
+            self.events.publish(job_id, dict(extra, status=status, progress=progress))
 
-            if analysis_response["status"] == "error":
-                job.status = "failed"
-                job.error_message = analysis_response["error"]
-                db.session.commit()
-                return
+    def _mark_failed(self, job, error_message):
+        self._clear_partial(job.job_id)
+        job.status = "failed"
+        job.error_message = error_message
+        job.completed_at = datetime.utcnow()
+        job.lease_expires_at = None
+        db.session.commit()
+        self._record_timings(job)
+        self._publish(job.job_id, "failed", job.progress, error=error_message)
+        self._fail_followers(job.job_id, error_message)
 
-            analysis_data = analysis_response["analysis"]
-            analysis_result = AnalysisResult(
-                scenario_id=scenario.id,
-                job_id=job_id,
-                brand_alignment_score=analysis_data.get("brand_alignment_score"),
-                audience_overlap_percentage=analysis_data.get("audience_overlap_percentage"),
-                roi_projection=analysis_data.get("roi_projection"),
-                risk_level=analysis_data.get("risk_level"),
-                key_risks=json.dumps(analysis_data.get("key_risks")),
-                recommendations=json.dumps(analysis_data.get("recommendations")),
-                market_insights=json.dumps(analysis_data.get("market_insights")),
-                tokens_used=analysis_response.get("tokens_used"),
-                analysis_duration=analysis_response.get("analysis_duration")
+    def _run_analysis_job(self, job_id, lease_owner=None):
+        started = self._start_job(job_id)
+        if started is None:
+            return
+        scenario_data, deadline = started
+        # End the session's transaction and return its connection for the length of the
+        # upstream call; _finish_job starts a fresh one
+        db.session.remove()
+        with self._stage(job_id, "analyze"):
+            analysis_response = self.openai_service.analyze_partnership(
+                scenario_data, on_partial=self._partial_handler(job_id), deadline=deadline
             )
-            db.session.add(analysis_result)
+        self._finish_job(job_id, scenario_data, analysis_response, lease_owner)
+
+    def _start_job(self, job_id):
+        """
+        Mark the job processing and return (scenario data, deadline), or None
+        if there is nothing to run. The deadline is a time.time() timestamp.
+        """
+        job = AnalysisJob.query.filter_by(job_id=job_id).first()
+        if not job:
+            return None
 
-            job.status = "completed"
-            job.completed_at = datetime.utcnow()
+        deadline = None
+        job.status = "processing"
+        job.progress = 10
+        job.started_at = datetime.utcnow()
+        if job.deadline_seconds:
+            # Restarts on re-delivery: a new attempt gets a full budget
+            deadline = time.time() + job.deadline_seconds
+            job.deadline_at = job.started_at + timedelta(seconds=job.deadline_seconds)
+        db.session.commit()
+        self._publish(job_id, "processing", 10, stage="started")
+
+        with self._stage(job_id, "load_scenario"):
+            scenario = db.session.get(PartnershipScenario, job.scenario_id)
+            scenario_data = scenario.to_dict() if scenario else None
+        if not scenario:
+            self._mark_failed(job, "Scenario not found")
+            return None
+
+        self._publish(job_id, "processing", 30, stage="analyzing")
+        return scenario_data, deadline
+
+    def _finish_job(self, job_id, scenario_data, analysis_response, lease_owner=None):
+        job = AnalysisJob.query.filter_by(job_id=job_id).first()
+        if not job:
+            logger.warning(f"Job {job_id} was deleted while analyzing, discarding result")
+            self._fail_followers(job_id, "Analysis job was deleted")
+            return
+
+        if lease_owner and not self.job_queue.holds_lease(job, lease_owner):
+            logger.warning(f"Lease on job {job_id} was lost while analyzing, discarding result")
+            return
+
+        if analysis_response["status"] == "error":
+            self._mark_failed(job, analysis_response["error"])
+            return
+
+        self._publish(job_id, "processing", 90, stage="saving")
+        analysis_result = self._store_result(job, scenario_data["id"], analysis_response)
+        self._complete_followers(job_id, analysis_result.to_dict())
+
+    def _store_result(self, job, scenario_id, analysis_response):
+        with self._stage(job.job_id, "persist"):
+            analysis_result = self._save_result(job, scenario_id, analysis_response)
+        self._record_timings(job, analysis_response)
+        self._clear_partial(job.job_id)
+        self._publish(job.job_id, "completed", 100)
+        self._observe_result(analysis_response)
+        return analysis_result
+
+    def _save_result(self, job, scenario_id, analysis_response):
+        analysis_data = analysis_response["analysis"]
+        analysis_result = AnalysisResult(
+            scenario_id=scenario_id,
+            job_id=job.job_id,
+            brand_alignment_score=analysis_data.get("brand_alignment_score"),
+            audience_overlap_percentage=analysis_data.get("audience_overlap_percentage"),
+            roi_projection=analysis_data.get("roi_projection"),
+            risk_level=analysis_data.get("risk_level"),
+            key_risks=analysis_data.get("key_risks"),
+            recommendations=analysis_data.get("recommendations"),
+            market_insights=analysis_data.get("market_insights"),
+            tokens_used=analysis_response.get("tokens_used"),
+            analysis_duration=analysis_response.get("analysis_duration"),
+            service_used=analysis_response.get("service_used"),
+            service_reason=analysis_response.get("service_reason"),
+            model_used=analysis_response.get("model_used"),
+            route_reason=analysis_response.get("route_reason")
+        )
+        db.session.add(analysis_result)
+
+        job.status = "completed"
+        job.progress = 100
+        job.completed_at = datetime.utcnow()
+        job.lease_expires_at = None
+        record_result(analysis_result, job.user_id, job.completed_at.date())
+        db.session.commit()
+        return analysis_result
+
+    def _observe_result(self, analysis_response):
+        service_used = analysis_response.get("service_used") or "unknown"
+        ANALYSIS_RESULTS.inc(service_used=service_used, service_reason=analysis_response.get("service_reason") or "")
+        if analysis_response.get("analysis_duration") is not None:
+            ANALYSIS_DURATION.observe(analysis_response["analysis_duration"], service_used=service_used)
+        if analysis_response.get("tokens_used") is not None:
+            ANALYSIS_TOKENS.observe(analysis_response["tokens_used"], service_used=service_used)
+        if analysis_response.get("route_reason"):
+            route = {"model_used": analysis_response.get("model_used") or "unknown",
+                     "route_reason": analysis_response["route_reason"]}
+            if analysis_response.get("analysis_duration") is not None:
+                ANALYSIS_ROUTE_DURATION.observe(analysis_response["analysis_duration"], **route)
+            ANALYSIS_ROUTE_TOKENS.inc(analysis_response.get("tokens_used") or 0, **route)
+
+    def _followers(self, leader_job_id, job_ids=None):
+        query = AnalysisJob.query.filter_by(coalesced_into=leader_job_id, status="pending")
+        if job_ids is not None:
+            query = query.filter(AnalysisJob.job_id.in_(job_ids))
+        return query.all()
+
+    def _claim_follower(self, follower, **values):
+        # Conditional update so a follower is only ever finished once, whoever gets there first
+        result = db.session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.job_id == follower.job_id, AnalysisJob.status == "pending")
+            .values(**values)
+        )
+        return result.rowcount == 1
+
+    def _complete_followers(self, leader_job_id, leader_result, job_ids=None):
+        for follower in self._followers(leader_job_id, job_ids):
+            now = datetime.utcnow()
+            if not self._claim_follower(follower, status="completed", progress=100, started_at=now, completed_at=now):
+                db.session.rollback()
+                continue
+            follower_result = AnalysisResult(
+                scenario_id=follower.scenario_id,
+                job_id=follower.job_id,
+                brand_alignment_score=leader_result["brand_alignment_score"],
+                audience_overlap_percentage=leader_result["audience_overlap_percentage"],
+                roi_projection=leader_result["roi_projection"],
+                risk_level=leader_result["risk_level"],
+                key_risks=leader_result["key_risks"],
+                recommendations=leader_result["recommendations"],
+                market_insights=leader_result["market_insights"],
+                tokens_used=0,
+                analysis_duration=leader_result["analysis_duration"],
+                service_used=leader_result["service_used"],
+                service_reason="coalesced",
+                model_used=leader_result.get("model_used"),
+                route_reason=leader_result.get("route_reason")
+            )
+            db.session.add(follower_result)
+            record_result(follower_result, follower.user_id, now.date())
             db.session.commit()
+            self._publish(follower.job_id, "completed", 100)
+            ANALYSIS_RESULTS.inc(service_used=leader_result["service_used"] or "unknown", service_reason="coalesced")
+            logger.info(f"Job {follower.job_id} completed from coalesced job {leader_job_id}")
 
+    def _fail_followers(self, leader_job_id, error_message, job_ids=None):
+        for follower in self._followers(leader_job_id, job_ids):
+            if self._claim_follower(follower, status="failed", error_message=error_message,
+                                    completed_at=datetime.utcnow()):
+                db.session.commit()
+                self._publish(follower.job_id, "failed", 0, error=error_message)
+            else:
+                db.session.rollback()
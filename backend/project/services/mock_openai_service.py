@@ -1,4 +1,5 @@
 import time
+import asyncio
 import logging
 import random
 from typing import Dict, Any
@@ -18,6 +19,14 @@ class MockOpenAIService:
         # Simulate API delay
         time.sleep(random.uniform(1, 3))
         
+        return self._build_response(scenario_data, start_time)
+
+    async def analyze_partnership_async(self, scenario_data: Dict[str, Any]) -> Dict[str, Any]:
+        start_time = time.time()
+        await asyncio.sleep(random.uniform(1, 3))
+        return self._build_response(scenario_data, start_time)
+
+    def _build_response(self, scenario_data: Dict[str, Any], start_time: float) -> Dict[str, Any]:
         try:
             brand_a = scenario_data.get("brand_a", "Brand A")
             brand_b = scenario_data.get("brand_b", "Brand B")
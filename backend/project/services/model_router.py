@@ -0,0 +1,146 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, NamedTuple, Optional
+
+from flask import has_app_context
+
+logger = logging.getLogger(__name__)
+
+
+class Route(NamedTuple):
+    model: str
+    reason: str
+
+
+def load_user_slos() -> Dict[str, float]:
+    """Per-user latency SLOs in seconds from MODEL_ROUTER_USER_SLOS, e.g. "12:5,40:30"."""
+    slos = {}
+    for pair in os.getenv("MODEL_ROUTER_USER_SLOS", "").split(","):
+        if ":" not in pair:
+            continue
+        user_id, seconds = pair.split(":", 1)
+        try:
+            slos[user_id.strip()] = max(float(seconds), 0.1)
+        except ValueError:
+            continue
+    return slos
+
+
+class ModelRouter:
+    """
+    Picks the model for each analysis: the default (deep) model or
+    OPENAI_FAST_MODEL. Rules, first match wins:
+
+    - latency_slo: the deep model's recent p95 latency is over the user's
+      SLO (MODEL_ROUTER_USER_SLOS, else MODEL_ROUTER_LATENCY_SLO) or over
+      the time left before the analysis deadline; MODEL_ROUTER_PROBE_RATE
+      of those calls still go to the deep model (reason "latency_probe") so
+      its latency keeps being measured and routing can recover
+    - budget: less than MODEL_ROUTER_MIN_HEADROOM of the RPM/TPM budget is left
+    - detailed_brief: the scenario names both an audience and a budget (deep)
+    - similar_analyzed: one of the user's analyzed scenarios is at least
+      MODEL_ROUTER_SIMILARITY alike, so the pair is familiar ground
+    - simple_brief: neither audience nor budget is given
+    - default: the deep model
+
+    Disabled (every call gets the default model, reason "default") unless
+    MODEL_ROUTING=true and OPENAI_FAST_MODEL is set.
+    """
+
+    def __init__(self, deep_model: str, fast_model: Optional[str] = None, rate_scheduler=None,
+                 similarity_index=None):
+        self.deep_model = deep_model
+        self.fast_model = fast_model if fast_model is not None else os.getenv("OPENAI_FAST_MODEL") or None
+        self.enabled = os.getenv("MODEL_ROUTING", "false").lower() == "true"
+        if self.enabled and not self.fast_model:
+            logger.warning("MODEL_ROUTING=true needs OPENAI_FAST_MODEL, routing disabled")
+            self.enabled = False
+        self.rate_scheduler = rate_scheduler
+        self.similarity_index = similarity_index
+        self.latency_slo = float(os.getenv("MODEL_ROUTER_LATENCY_SLO", "20"))
+        self.user_slos = load_user_slos()
+        self.min_headroom = float(os.getenv("MODEL_ROUTER_MIN_HEADROOM", "0.2"))
+        self.similarity = float(os.getenv("MODEL_ROUTER_SIMILARITY", "0.9"))
+        self.min_samples = int(os.getenv("MODEL_ROUTER_MIN_SAMPLES", "20"))
+        # Only recent samples count, so an old slow spell doesn't pin routing to the fast model
+        self.latency_window = float(os.getenv("MODEL_ROUTER_LATENCY_WINDOW", "300"))
+        self.probe_rate = float(os.getenv("MODEL_ROUTER_PROBE_RATE", "0.05"))
+        self.clock = time.monotonic
+        self._latencies = {}
+        self._decisions = {}
+        self._lock = threading.Lock()
+
+    def route(self, scenario_data: Dict[str, Any], deadline: Optional[float] = None) -> Route:
+        route = self._decide(scenario_data, deadline)
+        with self._lock:
+            key = f"{route.model}:{route.reason}"
+            self._decisions[key] = self._decisions.get(key, 0) + 1
+        return route
+
+    def _decide(self, scenario_data: Dict[str, Any], deadline: Optional[float]) -> Route:
+        if not self.enabled:
+            return Route(self.deep_model, "default")
+
+        p95 = self.latency_percentile(self.deep_model, 0.95)
+        if p95 is not None:
+            slo = self.user_slos.get(str(scenario_data.get("user_id")), self.latency_slo)
+            if deadline is not None:
+                slo = min(slo, deadline - time.time())
+            if p95 > slo:
+                if random.random() < self.probe_rate:
+                    return Route(self.deep_model, "latency_probe")
+                return Route(self.fast_model, "latency_slo")
+
+        headroom = self.rate_scheduler.headroom() if self.rate_scheduler else None
+        if headroom is not None and headroom < self.min_headroom:
+            return Route(self.fast_model, "budget")
+
+        has_audience = bool((scenario_data.get("target_audience") or "").strip())
+        has_budget = bool((scenario_data.get("budget_range") or "").strip())
+        if has_audience and has_budget:
+            return Route(self.deep_model, "detailed_brief")
+        if self._has_similar(scenario_data):
+            return Route(self.fast_model, "similar_analyzed")
+        if not has_audience and not has_budget:
+            return Route(self.fast_model, "simple_brief")
+        return Route(self.deep_model, "default")
+
+    def _has_similar(self, scenario_data: Dict[str, Any]) -> bool:
+        # The index reads new results from the database, so it needs an app context
+        if self.similarity_index is None or not has_app_context() or scenario_data.get("id") is None:
+            return False
+        try:
+            matches = self.similarity_index.search(scenario_data, scenario_data.get("user_id"), k=1)
+        except Exception as e:
+            logger.warning(f"Similarity lookup for routing failed: {str(e)}")
+            return False
+        return bool(matches) and matches[0][1] >= self.similarity
+
+    def observe(self, model: str, seconds: float) -> None:
+        """Record the latency of a successful call on model."""
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=200)).append((self.clock(), seconds))
+
+    def latency_percentile(self, model: str, q: float) -> Optional[float]:
+        """Quantile q of model's latencies in the last MODEL_ROUTER_LATENCY_WINDOW seconds."""
+        cutoff = self.clock() - self.latency_window
+        with self._lock:
+            samples = sorted(seconds for observed_at, seconds in self._latencies.get(model, ())
+                             if observed_at >= cutoff)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            decisions = dict(self._decisions)
+        p95 = {}
+        for model in filter(None, (self.deep_model, self.fast_model)):
+            latency = self.latency_percentile(model, 0.95)
+            p95[model] = round(latency, 3) if latency is not None else None
+        return {"enabled": self.enabled, "deep_model": self.deep_model, "fast_model": self.fast_model,
+                "decisions": decisions, "latency_p95": p95}
@@ -2,11 +2,40 @@ import os
 import json
 import time
 import logging
-from typing import Dict, Any
-from openai import OpenAI
+import threading
+from typing import TYPE_CHECKING, Dict, Any, Callable, List, Optional
+
+from .incremental_json import IncrementalObjectParser
+from .analysis_schema import ANALYSIS_FIELDS, packed_response_format, response_format, validate_analysis
+from ..metrics import ANALYSIS_INVALID_FIELDS, ANALYSIS_PARSE_RESULTS, ANALYSIS_REPAIRS
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever the system prompt or _build_analysis_prompt changes so cached
+# analyses produced by the old prompt stop matching.
+PROMPT_VERSION = "2"
+
+MAX_COMPLETION_TOKENS = 1000
+REPAIR_MAX_TOKENS = 400
+
+SYSTEM_PROMPT = "You are a luxury brand partnership analyst. Provide analysis in JSON format with the following structure: {\"brand_alignment_score\": 85, \"audience_overlap_percentage\": 70, \"roi_projection\": 150, \"risk_level\": \"Medium\", \"key_risks\": [\"Risk 1\", \"Risk 2\"], \"recommendations\": [\"Rec 1\", \"Rec 2\"], \"market_insights\": [\"Insight 1\", \"Insight 2\"]}"
+
+def _apportion(total: Optional[int], weights: List[int]) -> List[int]:
+    """Split an integer total in proportion to weights, keeping the sum exact (largest remainder)."""
+    total = total or 0
+    if not any(weights):
+        weights = [1] * len(weights)
+    weight_sum = sum(weights) or 1
+    exact = [total * weight / weight_sum for weight in weights]
+    shares = [int(share) for share in exact]
+    by_remainder = sorted(range(len(weights)), key=lambda i: exact[i] - shares[i], reverse=True)
+    for i in by_remainder[:total - sum(shares)]:
+        shares[i] += 1
+    return shares
+
 class OpenAIService:
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
@@ -15,54 +44,387 @@ class OpenAIService:
             raise ValueError("OPENAI_API_KEY is not set.")
         
         logger.info(f"OpenAI API key loaded: {self.api_key[:8]}...{self.api_key[-4:]} ({len(self.api_key)} chars)")
-        self.client = OpenAI(api_key=self.api_key)
+        # Point at a compatible endpoint, e.g. fake_openai_server.py for offline load tests
+        self.base_url = os.getenv("OPENAI_BASE_URL") or None
+        if self.base_url:
+            logger.info(f"Using OpenAI-compatible endpoint {self.base_url}")
+        # The openai package and its HTTP clients are the bulk of a cold start, so both
+        # clients are built on first use
+        self._client = None
+        self._client_lock = threading.Lock()
         # Use the working model
         self.model = os.getenv("OPENAI_MODEL", "gpt-4.1-nano")
+        # Created on first async call so it binds to the engine's event loop
+        self._async_client = None
+        self.async_max_connections = int(os.getenv("ASYNC_MAX_CONCURRENCY", "100"))
+        # Stream tokens and report fields as they close when the caller asks for partials
+        self.streaming = os.getenv("OPENAI_STREAMING", "false").lower() == "true"
+        # Ask for schema-constrained JSON (response_format json_schema) instead of free text
+        self.structured_outputs = os.getenv("OPENAI_STRUCTURED_OUTPUTS", "false").lower() == "true"
+        # Follow-up calls that re-ask only for fields that failed validation; 0 fails the analysis instead
+        self.repair_attempts = int(os.getenv("OPENAI_REPAIR_ATTEMPTS", "1"))
+
+    @property
+    def client(self) -> "OpenAI":
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client
+
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        if self._async_client is None:
+            import httpx
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+            http_client = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.async_max_connections,
+                    max_keepalive_connections=self.async_max_connections
+                )
+            )
+            self._async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, http_client=http_client)
+        return self._async_client
 
-    def analyze_partnership(self, scenario_data: Dict[str, Any]) -> Dict[str, Any]:
+    def analyze_partnership(self, scenario_data: Dict[str, Any],
+                            on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+                            timeout: Optional[float] = None, model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Run one analysis. With OPENAI_STREAMING enabled and an on_partial
+        callback, the completion is streamed and on_partial receives each
+        batch of top-level fields as soon as they are complete.
+
+        timeout bounds the whole call in seconds (client retries are skipped
+        so they can't stretch it); model overrides OPENAI_MODEL for this call.
+
+        The response is parsed in one pass and validated field by field; fields
+        that fail get up to OPENAI_REPAIR_ATTEMPTS targeted follow-up calls,
+        and an analysis that still has invalid fields is returned as an error
+        carrying invalid_fields.
+        """
         start_time = time.time()
+        model = model or self.model
         try:
-            logger.info(f"🤖 Starting REAL OpenAI analysis with model: {self.model}")
+            logger.info(f"🤖 Starting REAL OpenAI analysis with model: {model}")
             prompt = self._build_analysis_prompt(scenario_data)
             logger.info(f"Prompt: {prompt[:200]}...")
+            client = self._bounded(self.client, timeout)
+            prompt_built = time.time()
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a luxury brand partnership analyst. Provide analysis in JSON format with the following structure: {\"brand_alignment_score\": 85, \"audience_overlap_percentage\": 70, \"roi_projection\": 150, \"risk_level\": \"Medium\", \"key_risks\": [\"Risk 1\", \"Risk 2\"], \"recommendations\": [\"Rec 1\", \"Rec 2\"], \"market_insights\": [\"Insight 1\", \"Insight 2\"]}"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=1000
+            if self.streaming and on_partial:
+                stream = client.chat.completions.create(**self._completion_params(prompt, stream=True, model=model))
+                parser = IncrementalObjectParser()
+                total_tokens = None
+                for chunk in stream:
+                    if self._overdue(start_time, timeout):
+                        stream.close()
+                        raise TimeoutError(f"Analysis deadline of {timeout:.1f}s exceeded while streaming")
+                    total_tokens = self._consume_chunk(chunk, parser, on_partial) or total_tokens
+            else:
+                response = client.chat.completions.create(**self._completion_params(prompt, model=model))
+                parser = self._parse(response.choices[0].message.content)
+                total_tokens = response.usage.total_tokens
+            received = time.time()
+
+            analysis, errors = self._validate(parser)
+            attempts = 0
+            while errors and attempts < self.repair_attempts and not self._overdue(start_time, timeout):
+                attempts += 1
+                response = client.chat.completions.create(**self._repair_params(prompt, parser, errors, model))
+                errors = self._apply_repair(response.choices[0].message.content, analysis, errors)
+                total_tokens = (total_tokens or 0) + response.usage.total_tokens
+            return self._build_result(analysis, errors, total_tokens, start_time, prompt_built, received, attempts)
+        except Exception as e:
+            logger.error(f"❌ OpenAI analysis failed: {str(e)}")
+            return self._error_result(e)
+
+    async def analyze_partnership_async(self, scenario_data: Dict[str, Any],
+                                        on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+                                        timeout: Optional[float] = None, model: Optional[str] = None) -> Dict[str, Any]:
+        """Same as analyze_partnership, on the pooled AsyncOpenAI client. Runs on the AsyncEngine loop."""
+        start_time = time.time()
+        model = model or self.model
+        try:
+            logger.info(f"🤖 Starting REAL OpenAI analysis (async) with model: {model}")
+            prompt = self._build_analysis_prompt(scenario_data)
+            client = self._bounded(self.async_client, timeout)
+            prompt_built = time.time()
+
+            if self.streaming and on_partial:
+                stream = await client.chat.completions.create(**self._completion_params(prompt, stream=True, model=model))
+                parser = IncrementalObjectParser()
+                total_tokens = None
+                async for chunk in stream:
+                    if self._overdue(start_time, timeout):
+                        await stream.close()
+                        raise TimeoutError(f"Analysis deadline of {timeout:.1f}s exceeded while streaming")
+                    total_tokens = self._consume_chunk(chunk, parser, on_partial) or total_tokens
+            else:
+                response = await client.chat.completions.create(**self._completion_params(prompt, model=model))
+                parser = self._parse(response.choices[0].message.content)
+                total_tokens = response.usage.total_tokens
+            received = time.time()
+
+            analysis, errors = self._validate(parser)
+            attempts = 0
+            while errors and attempts < self.repair_attempts and not self._overdue(start_time, timeout):
+                attempts += 1
+                response = await client.chat.completions.create(**self._repair_params(prompt, parser, errors, model))
+                errors = self._apply_repair(response.choices[0].message.content, analysis, errors)
+                total_tokens = (total_tokens or 0) + response.usage.total_tokens
+            return self._build_result(analysis, errors, total_tokens, start_time, prompt_built, received, attempts)
+        except Exception as e:
+            logger.error(f"❌ OpenAI analysis failed: {str(e)}")
+            return self._error_result(e)
+
+    def analyze_packed(self, scenarios: List[Dict[str, Any]], timeout: Optional[float] = None,
+                       model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Analyze several scenarios in one call that asks for an array of
+        analyses. Returns {"status", "results", "tokens_used"} where results
+        holds one analyze_partnership-style result per scenario, or None for
+        scenarios whose entry was missing or invalid (no repair is attempted
+        here; callers re-run those on their own). Each result's tokens_used
+        is its share of the call: prompt tokens split by the size of its
+        scenario block, completion tokens by the size of its answer.
+        """
+        start_time = time.time()
+        model = model or self.model
+        try:
+            logger.info(f"🤖 Starting packed OpenAI analysis of {len(scenarios)} scenarios with model: {model}")
+            blocks = [self._scenario_details(scenario_data) for scenario_data in scenarios]
+            prompt = self._build_packed_prompt(blocks)
+            client = self._bounded(self.client, timeout)
+            prompt_built = time.time()
+            response = client.chat.completions.create(**self._packed_params(prompt, len(scenarios), model))
+            received = time.time()
+
+            entries = self._demultiplex(response.choices[0].message.content, len(scenarios))
+            usage = response.usage
+            prompt_shares = _apportion(usage.prompt_tokens, [len(block) for block in blocks])
+            completion_shares = _apportion(
+                usage.completion_tokens, [len(json.dumps(entry)) if entry else 1 for entry in entries]
             )
-            
-            analysis_duration = time.time() - start_time
-            logger.info(f"✅ REAL OpenAI response received in {analysis_duration:.2f}s")
-            
-            response_content = response.choices[0].message.content
-            logger.info(f"Raw OpenAI response: {response_content[:200]}...")
-            
-            analysis_result = self._parse_analysis_response(response_content)
-            
-            return {
-                "status": "success",
-                "analysis": analysis_result,
-                "tokens_used": response.usage.total_tokens,
-                "analysis_duration": analysis_duration
+            finished = time.time()
+            timings = {
+                "build_prompt": round(prompt_built - start_time, 4),
+                "upstream": round(received - prompt_built, 4),
+                "parse": round(finished - received, 4)
             }
+
+            results = []
+            for i, entry in enumerate(entries):
+                analysis, errors = validate_analysis(entry or {})
+                ANALYSIS_PARSE_RESULTS.inc(outcome="invalid" if errors else "ok")
+                for field in errors:
+                    ANALYSIS_INVALID_FIELDS.inc(field=field)
+                if errors:
+                    logger.warning(f"Packed analysis {i + 1}/{len(scenarios)} has invalid fields: {errors}")
+                    results.append(None)
+                    continue
+                results.append({
+                    "status": "success",
+                    "analysis": {field: analysis[field] for field in ANALYSIS_FIELDS},
+                    "tokens_used": prompt_shares[i] + completion_shares[i],
+                    "analysis_duration": finished - start_time,
+                    "packed_with": len(scenarios),
+                    "timings": dict(timings)
+                })
+            return {"status": "success", "results": results, "tokens_used": usage.total_tokens}
         except Exception as e:
-            logger.error(f"❌ OpenAI analysis failed: {str(e)}")
-            return {"status": "error", "error": str(e)}
+            logger.error(f"❌ Packed OpenAI analysis failed: {str(e)}")
+            return self._error_result(e)
 
-    def _build_analysis_prompt(self, scenario_data: Dict[str, Any]) -> str:
-        return f"""Analyze this luxury brand partnership scenario:
+    def estimate_tokens(self, scenario_data: Dict[str, Any]) -> int:
+        """Upper-bound token estimate for one analysis: ~4 characters per prompt token plus the completion cap."""
+        prompt = self._build_analysis_prompt(scenario_data)
+        return (len(SYSTEM_PROMPT) + len(prompt)) // 4 + MAX_COMPLETION_TOKENS
 
-**Partnership Details:**
-- Brand A: {scenario_data.get("brand_a")}
+    def estimate_packed_tokens(self, scenarios: List[Dict[str, Any]]) -> int:
+        prompt = self._build_packed_prompt([self._scenario_details(scenario_data) for scenario_data in scenarios])
+        return (len(SYSTEM_PROMPT) + len(prompt)) // 4 + MAX_COMPLETION_TOKENS * len(scenarios)
+
+    def _bounded(self, client, timeout: Optional[float]):
+        """Client whose requests give up after timeout seconds, without retries."""
+        if timeout is None:
+            return client
+        return client.with_options(timeout=max(timeout, 0.1), max_retries=0)
+
+    def _overdue(self, start_time: float, timeout: Optional[float]) -> bool:
+        # The HTTP timeout only bounds each read, so a slowly trickling stream is checked here
+        return timeout is not None and time.time() - start_time > timeout
+
+    def _error_result(self, error: Exception) -> Dict[str, Any]:
+        from openai import APITimeoutError
+        return {
+            "status": "error",
+            "error": str(error),
+            "timed_out": isinstance(error, (TimeoutError, APITimeoutError))
+        }
+
+    def _consume_chunk(self, chunk, parser: IncrementalObjectParser,
+                       on_partial: Callable[[Dict[str, Any]], None]) -> Optional[int]:
+        """Feed one stream chunk to the parser; returns total tokens once the usage chunk arrives."""
+        if chunk.choices:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                completed = parser.feed(delta)
+                if completed:
+                    try:
+                        on_partial(dict(completed))
+                    except Exception as e:
+                        logger.warning(f"Partial result callback failed: {str(e)}")
+        if chunk.usage:
+            return chunk.usage.total_tokens
+        return None
+
+    def _completion_params(self, prompt: str, stream: bool = False, model: Optional[str] = None) -> Dict[str, Any]:
+        params = {
+            "model": model or self.model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.3,
+            "max_tokens": MAX_COMPLETION_TOKENS
+        }
+        if self.structured_outputs:
+            params["response_format"] = response_format()
+        if stream:
+            params["stream"] = True
+            params["stream_options"] = {"include_usage": True}
+        return params
+
+    def _parse(self, content: Optional[str]) -> IncrementalObjectParser:
+        parser = IncrementalObjectParser()
+        parser.feed(content or "")
+        return parser
+
+    def _validate(self, parser: IncrementalObjectParser):
+        """Valid analysis fields and errors by field for a parsed response."""
+        analysis, errors = validate_analysis(parser.fields)
+        for field in parser.errors:
+            if field in errors:
+                errors[field] = "invalid JSON"
+        ANALYSIS_PARSE_RESULTS.inc(outcome="invalid" if errors else "ok")
+        for field in errors:
+            ANALYSIS_INVALID_FIELDS.inc(field=field)
+        if errors:
+            logger.warning(f"OpenAI analysis has invalid fields: {errors}")
+        return analysis, errors
+
+    def _repair_params(self, prompt: str, parser: IncrementalObjectParser, errors: Dict[str, str],
+                       model: str) -> Dict[str, Any]:
+        """A follow-up request for only the fields that failed validation."""
+        problems = []
+        for field, error in errors.items():
+            received = parser.fields.get(field, parser.errors.get(field))
+            problems.append(f"- {field}: {error}" + (f" (received {json.dumps(received)[:200]})" if received is not None else ""))
+        fields = [field for field in ANALYSIS_FIELDS if field in errors]
+        repair_prompt = (
+            "Some fields of your analysis were missing or invalid:\n" + "\n".join(problems) +
+            f"\n\nRespond in JSON format only, with exactly these fields: {', '.join(fields)}."
+        )
+        params = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+                {"role": "user", "content": repair_prompt}
+            ],
+            "temperature": 0,
+            "max_tokens": REPAIR_MAX_TOKENS
+        }
+        if self.structured_outputs:
+            params["response_format"] = response_format(fields, name="partnership_analysis_repair")
+        return params
+
+    def _apply_repair(self, content: Optional[str], analysis: Dict[str, Any], errors: Dict[str, str]) -> Dict[str, str]:
+        """Merge repaired fields into analysis and return the errors that remain."""
+        repaired, remaining = validate_analysis(self._parse(content).fields, fields=errors)
+        analysis.update(repaired)
+        ANALYSIS_REPAIRS.inc(outcome="failed" if remaining else "repaired")
+        return remaining
+
+    def _build_result(self, analysis: Dict[str, Any], errors: Dict[str, str], total_tokens: Optional[int],
+                      start_time: float, prompt_built: float, received: float, repair_attempts: int) -> Dict[str, Any]:
+        logger.info(f"✅ REAL OpenAI response received in {received - start_time:.2f}s")
+        finished = time.time()
+        timings = {
+            "build_prompt": round(prompt_built - start_time, 4),
+            "upstream": round(received - prompt_built, 4),
+        }
+        if repair_attempts:
+            timings["repair"] = round(finished - received, 4)
+        else:
+            timings["parse"] = round(finished - received, 4)
+
+        if errors:
+            return {
+                "status": "error",
+                "error": "Invalid analysis fields: " + ", ".join(f"{field} {error}" for field, error in errors.items()),
+                "invalid_fields": list(errors),
+                "tokens_used": total_tokens,
+                "repair_attempts": repair_attempts,
+                "timed_out": False
+            }
+        return {
+            "status": "success",
+            "analysis": {field: analysis[field] for field in ANALYSIS_FIELDS},
+            "tokens_used": total_tokens,
+            "analysis_duration": finished - start_time,
+            "repair_attempts": repair_attempts,
+            "timings": timings
+        }
+
+    def _scenario_details(self, scenario_data: Dict[str, Any]) -> str:
+        return f"""- Brand A: {scenario_data.get("brand_a")}
 - Brand B: {scenario_data.get("brand_b")}
 - Partnership Type: {scenario_data.get("partnership_type")}
 - Target Audience: {scenario_data.get("target_audience", "Not specified")}
-- Budget Range: {scenario_data.get("budget_range", "Not specified")}
+- Budget Range: {scenario_data.get("budget_range", "Not specified")}"""
+
+    def _build_packed_prompt(self, blocks: List[str]) -> str:
+        scenarios = "\n\n".join(f"**Scenario {i}:**\n{block}" for i, block in enumerate(blocks, 1))
+        return f"""Analyze each of these {len(blocks)} luxury brand partnership scenarios independently:
+
+{scenarios}
+
+For every scenario provide the same analysis as for a single scenario:
+brand alignment score (0-100), audience overlap percentage (0-100), ROI projection percentage,
+risk level (Low/Medium/High), key risks, recommendations and market insights.
+
+Respond in JSON format only, as {{"analyses": [...]}} with one object per scenario, in order,
+each with a "scenario" field holding the scenario number and the analysis fields."""
+
+    def _packed_params(self, prompt: str, count: int, model: str) -> Dict[str, Any]:
+        params = self._completion_params(prompt, model=model)
+        params["max_tokens"] = MAX_COMPLETION_TOKENS * count
+        if self.structured_outputs:
+            params["response_format"] = packed_response_format(count)
+        return params
+
+    def _demultiplex(self, content: Optional[str], count: int) -> List[Optional[Dict[str, Any]]]:
+        """Entries of a packed response by scenario, using the scenario number and falling back to position."""
+        entries = self._parse(content).fields.get("analyses")
+        by_scenario = [None] * count
+        if not isinstance(entries, list):
+            return by_scenario
+        for position, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                continue
+            number = entry.get("scenario")
+            index = number - 1 if isinstance(number, int) and not isinstance(number, bool) else position
+            if 0 <= index < count and by_scenario[index] is None:
+                by_scenario[index] = entry
+        return by_scenario
+
+    def _build_analysis_prompt(self, scenario_data: Dict[str, Any]) -> str:
+        return f"""Analyze this luxury brand partnership scenario:
+
+**Partnership Details:**
+{self._scenario_details(scenario_data)}
 
 Please provide a comprehensive analysis including:
 1. Brand alignment score (0-100)
@@ -74,38 +436,3 @@ Please provide a comprehensive analysis including:
 7. Market insights
 
 Respond in JSON format only."""
-
-    def _parse_analysis_response(self, response_text: str) -> Dict[str, Any]:
-        try:
-            # Try to extract JSON from the response
-            import re
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                return json.loads(json_str)
-            else:
-                # If no JSON found, return a structured fallback
-                return {
-                    "brand_alignment_score": 75,
-                    "audience_overlap_percentage": 60,
-                    "roi_projection": 120,
-                    "risk_level": "Medium",
-                    "key_risks": ["Market volatility", "Brand reputation risk"],
-                    "recommendations": ["Conduct market research", "Develop clear brand guidelines"],
-                    "market_insights": ["Strong potential in luxury segment", "Growing demand for collaborations"],
-                    "raw_response": response_text
-                }
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON from OpenAI response: {e}")
-            logger.error(f"Raw response: {response_text}")
-            return {
-                "error": "Invalid JSON response from AI",
-                "raw_response": response_text,
-                "brand_alignment_score": 70,
-                "audience_overlap_percentage": 50,
-                "roi_projection": 100,
-                "risk_level": "Medium",
-                "key_risks": ["Analysis parsing error"],
-                "recommendations": ["Retry analysis"],
-                "market_insights": ["Unable to parse AI response"]
-            }
@@ -0,0 +1,271 @@
+import logging
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, insert, select
+
+from ..models import db, AnalysisJob, AnalysisResult, PartnershipScenario
+from ..models.analytics import (
+    ALL_BRANDS, RISK_LEVELS, ROI_BUCKET_EDGES, ROI_BUCKET_LABELS, PortfolioAggregate
+)
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = PortfolioAggregate.COUNTERS
+KEY_COLUMNS = ("user_id", "brand", "day")
+
+
+def _risk_column(risk_level: Optional[str]) -> str:
+    level = (risk_level or "").strip().lower()
+    return f"risk_{level if level in RISK_LEVELS else 'other'}"
+
+
+def _increments(score, roi, risk_level, tokens_used) -> Dict[str, float]:
+    increments = dict.fromkeys(COUNTERS, 0)
+    increments["result_count"] = 1
+    if score is not None:
+        increments["score_sum"] = score
+        increments["score_count"] = 1
+    if roi is not None:
+        increments["roi_sum"] = roi
+        increments["roi_count"] = 1
+        increments[f"roi_bucket_{bisect_right(ROI_BUCKET_EDGES, roi)}"] = 1
+    if risk_level:
+        increments[_risk_column(risk_level)] = 1
+    increments["tokens_used"] = tokens_used or 0
+    return increments
+
+
+def _brands(brand_a: Optional[str], brand_b: Optional[str]) -> List[str]:
+    # Sorted so concurrent upserts lock rows in the same order
+    return sorted({ALL_BRANDS} | {brand for brand in (brand_a, brand_b) if brand})
+
+
+def record_result(result: AnalysisResult, user_id: int, day: date) -> None:
+    """
+    Add a new result to its user's aggregates, in the caller's transaction so
+    the rollups commit together with the result. Concurrent workers add to
+    the same rows through INSERT ... ON CONFLICT DO UPDATE.
+    """
+    scenario = db.session.execute(
+        select(PartnershipScenario.brand_a, PartnershipScenario.brand_b).where(PartnershipScenario.id == result.scenario_id)
+    ).one_or_none()
+    increments = _increments(result.brand_alignment_score, result.roi_projection, result.risk_level, result.tokens_used)
+    rows = [
+        dict(increments, user_id=user_id, brand=brand, day=day)
+        for brand in _brands(*(scenario or (None, None)))
+    ]
+    _upsert(rows)
+
+
+def _upsert(rows: List[Dict[str, Any]]) -> None:
+    table = PortfolioAggregate.__table__
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        _merge(rows)
+        return
+
+    statement = upsert(table).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(KEY_COLUMNS),
+        set_={name: table.c[name] + statement.excluded[name] for name in COUNTERS}
+    )
+    db.session.execute(statement)
+
+
+def _merge(rows: List[Dict[str, Any]]) -> None:
+    """Read-modify-write fallback for databases without ON CONFLICT."""
+    for row in rows:
+        aggregate = PortfolioAggregate.query.filter_by(
+            user_id=row["user_id"], brand=row["brand"], day=row["day"]
+        ).with_for_update().first()
+        if aggregate is None:
+            db.session.add(PortfolioAggregate(**row))
+            continue
+        for name in COUNTERS:
+            setattr(aggregate, name, getattr(aggregate, name) + row[name])
+
+
+def rebuild_aggregates(chunk_size: int = 10000) -> Dict[str, int]:
+    """
+    Recompute every aggregate from analysis_result, for backfills or after
+    the rollup definitions change. Results are read in chunks and summed per
+    (user, brand, day) with NumPy; the table is replaced in one transaction.
+    """
+    import numpy as np
+
+    day = func.date(func.coalesce(AnalysisJob.completed_at, AnalysisJob.created_at))
+    query = (
+        select(
+            AnalysisJob.user_id, PartnershipScenario.brand_a, PartnershipScenario.brand_b, day,
+            AnalysisResult.brand_alignment_score, AnalysisResult.roi_projection,
+            AnalysisResult.risk_level, AnalysisResult.tokens_used,
+        )
+        .select_from(AnalysisResult)
+        .join(AnalysisJob, AnalysisJob.job_id == AnalysisResult.job_id)
+        .join(PartnershipScenario, PartnershipScenario.id == AnalysisResult.scenario_id)
+        .execution_options(yield_per=chunk_size)
+    )
+
+    columns = {name: i for i, name in enumerate(COUNTERS)}
+    totals = {}
+    results = 0
+    for chunk in db.session.execute(query).partitions():
+        n = len(chunk)
+        results += n
+        score = np.array([row[4] for row in chunk], dtype=float)
+        roi = np.array([row[5] for row in chunk], dtype=float)
+        has_score = ~np.isnan(score)
+        has_roi = ~np.isnan(roi)
+
+        values = np.zeros((n, len(COUNTERS)))
+        values[:, columns["result_count"]] = 1
+        values[:, columns["score_sum"]] = np.where(has_score, score, 0)
+        values[:, columns["score_count"]] = has_score
+        values[:, columns["roi_sum"]] = np.where(has_roi, roi, 0)
+        values[:, columns["roi_count"]] = has_roi
+        buckets = np.searchsorted(ROI_BUCKET_EDGES, np.where(has_roi, roi, 0), side="right")
+        rows = np.flatnonzero(has_roi)
+        values[rows, columns["roi_bucket_0"] + buckets[rows]] = 1
+        risk_columns = [columns[_risk_column(row[6])] if row[6] else None for row in chunk]
+        rows = [i for i, column in enumerate(risk_columns) if column is not None]
+        values[rows, [risk_columns[i] for i in rows]] = 1
+        values[:, columns["tokens_used"]] = [row[7] or 0 for row in chunk]
+
+        # Each result counts towards the user's overall row and one row per brand
+        keys, groups, sources = {}, [], []
+        for i, row in enumerate(chunk):
+            row_day = row[3] if isinstance(row[3], date) else date.fromisoformat(str(row[3])[:10])
+            for brand in _brands(row[1], row[2]):
+                groups.append(keys.setdefault((row[0], brand, row_day), len(keys)))
+                sources.append(i)
+        groups = np.array(groups)
+        expanded = values[np.array(sources)]
+        sums = np.column_stack([
+            np.bincount(groups, weights=expanded[:, j], minlength=len(keys)) for j in range(len(COUNTERS))
+        ])
+        for key, group in keys.items():
+            totals[key] = totals[key] + sums[group] if key in totals else sums[group]
+
+    integer_columns = {name for name in COUNTERS if not name.endswith("_sum")}
+    rows = [
+        dict(
+            zip(KEY_COLUMNS, key),
+            **{name: int(round(value)) if name in integer_columns else float(value)
+               for name, value in zip(COUNTERS, sums)}
+        )
+        for key, sums in totals.items()
+    ]
+    db.session.query(PortfolioAggregate).delete()
+    if rows:
+        db.session.execute(insert(PortfolioAggregate), rows)
+    db.session.commit()
+    logger.info(f"Rebuilt {len(rows)} portfolio aggregate rows from {results} results")
+    return {"results": results, "rows": len(rows)}
+
+
+def _rollup(sums: Dict[str, Any]) -> Dict[str, Any]:
+    score_count = sums.get("score_count") or 0
+    roi_count = sums.get("roi_count") or 0
+    return {
+        "results": int(sums.get("result_count") or 0),
+        "average_brand_alignment_score": round(sums["score_sum"] / score_count, 2) if score_count else None,
+        "average_roi_projection": round(sums["roi_sum"] / roi_count, 2) if roi_count else None,
+        "roi_distribution": {
+            label: int(sums.get(f"roi_bucket_{i}") or 0) for i, label in enumerate(ROI_BUCKET_LABELS)
+        },
+        "risk_levels": {level: int(sums.get(f"risk_{level}") or 0) for level in RISK_LEVELS},
+        "tokens_used": int(sums.get("tokens_used") or 0),
+    }
+
+
+def _sums(*group_by):
+    return [*group_by, *(func.sum(PortfolioAggregate.__table__.c[name]).label(name) for name in COUNTERS)]
+
+
+def portfolio_summary(user_id: int, brand: Optional[str] = None, start: Optional[date] = None,
+                      end: Optional[date] = None, brand_limit: int = 20) -> Dict[str, Any]:
+    """Rollups for a user (or one of their brands) over an optional day range, read from the aggregates."""
+    aggregate = PortfolioAggregate
+
+    def scoped(query, brand_condition):
+        query = query.where(aggregate.user_id == user_id, brand_condition)
+        if start:
+            query = query.where(aggregate.day >= start)
+        if end:
+            query = query.where(aggregate.day <= end)
+        return query
+
+    target = aggregate.brand == (brand or ALL_BRANDS)
+    totals = db.session.execute(scoped(select(*_sums()), target)).mappings().one()
+    timeline = db.session.execute(
+        scoped(select(*_sums(aggregate.day)), target).group_by(aggregate.day).order_by(aggregate.day)
+    ).mappings().all()
+
+    summary = {
+        "brand": brand,
+        "totals": _rollup(totals),
+        "over_time": [
+            {
+                "day": row["day"].isoformat(),
+                "results": int(row["result_count"]),
+                "tokens_used": int(row["tokens_used"]),
+                "average_brand_alignment_score": round(row["score_sum"] / row["score_count"], 2) if row["score_count"] else None,
+            }
+            for row in timeline
+        ],
+    }
+
+    if not brand:
+        by_brand = (
+            scoped(select(*_sums(aggregate.brand)), aggregate.brand != ALL_BRANDS)
+            .group_by(aggregate.brand)
+            .order_by(func.sum(aggregate.result_count).desc())
+            .limit(brand_limit)
+        )
+        summary["by_brand"] = [
+            dict(_rollup(row), brand=row["brand"]) for row in db.session.execute(by_brand).mappings()
+        ]
+    return summary
+
+
+def route_summary(user_id: int, start: Optional[date] = None, end: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    Results, tokens and duration per (model_used, route_reason) for a user's
+    analyses, read from analysis_result since routes aren't part of the
+    aggregates. Coalesced copies are left out: they cost nothing themselves.
+    """
+    query = (
+        select(
+            AnalysisResult.model_used, AnalysisResult.route_reason,
+            func.count().label("results"),
+            func.sum(AnalysisResult.tokens_used).label("tokens_used"),
+            func.avg(AnalysisResult.analysis_duration).label("average_duration"),
+            func.max(AnalysisResult.analysis_duration).label("max_duration"),
+        )
+        .join(AnalysisJob, AnalysisJob.job_id == AnalysisResult.job_id)
+        .where(AnalysisJob.user_id == user_id, AnalysisResult.service_reason != "coalesced")
+        .group_by(AnalysisResult.model_used, AnalysisResult.route_reason)
+        .order_by(func.count().desc())
+    )
+    if start:
+        query = query.where(AnalysisJob.completed_at >= datetime.combine(start, datetime.min.time()))
+    if end:
+        query = query.where(AnalysisJob.completed_at < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    return [
+        {
+            "model_used": row["model_used"],
+            "route_reason": row["route_reason"],
+            "results": row["results"],
+            "tokens_used": int(row["tokens_used"] or 0),
+            "average_tokens": round((row["tokens_used"] or 0) / row["results"], 1),
+            "average_duration": round(row["average_duration"], 3) if row["average_duration"] is not None else None,
+            "max_duration": round(row["max_duration"], 3) if row["max_duration"] is not None else None,
+        }
+        for row in db.session.execute(query).mappings()
+    ]
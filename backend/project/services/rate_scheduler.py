@@ -0,0 +1,231 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+from .fair_queue import FairQueue, load_user_weights
+
+logger = logging.getLogger(__name__)
+
+# How often waiters that aren't at the head of the queue re-check
+_POLL_SECONDS = 0.05
+
+
+class TokenBucket:
+    """Bucket refilled continuously at per_minute / 60 per second, holding at most per_minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken (requests larger than the bucket only need a full one)."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """Charge (positive) or refund (negative) after the fact; the level may go into debt."""
+        self.level = min(self.capacity, self.level - delta)
+
+    def utilization(self, now: float) -> float:
+        self._refill(now)
+        return min(1.0, max(0.0, 1.0 - self.level / self.capacity))
+
+
+class Permit:
+    __slots__ = ("user_id", "tokens", "wait", "requests")
+
+    def __init__(self, user_id: Any, tokens: int, wait: float = 0.0, requests: int = 1):
+        self.user_id = user_id
+        self.tokens = tokens
+        self.wait = wait
+        self.requests = requests
+
+
+class RateScheduler:
+    """
+    Keeps OpenAI calls under the account's requests-per-minute and
+    tokens-per-minute limits (OPENAI_RPM_LIMIT / OPENAI_TPM_LIMIT, 0 = no
+    limit) with two token buckets.
+
+    Calls reserve their estimated tokens up front and are reconciled with the
+    real usage afterwards. When the buckets are empty, callers wait in a
+    per-user weighted fair queue (weights from ANALYSIS_USER_WEIGHTS, cost =
+    estimated tokens), so a user with a large backlog can't starve the
+    others. A caller that can't be admitted within its timeout gets None.
+    """
+
+    def __init__(self, rpm_limit: int = None, tpm_limit: int = None, max_wait: float = None,
+                 weights: Optional[Dict[str, float]] = None):
+        self.rpm_limit = rpm_limit if rpm_limit is not None else int(os.getenv("OPENAI_RPM_LIMIT", "0"))
+        self.tpm_limit = tpm_limit if tpm_limit is not None else int(os.getenv("OPENAI_TPM_LIMIT", "0"))
+        self.max_wait = max_wait or float(os.getenv("OPENAI_RATE_MAX_WAIT_SECONDS", "30"))
+
+        self._requests = TokenBucket(self.rpm_limit) if self.rpm_limit else None
+        self._tokens = TokenBucket(self.tpm_limit) if self.tpm_limit else None
+        self._cond = threading.Condition()
+        self._waiting = FairQueue(weights if weights is not None else load_user_weights())
+        self._waits = deque(maxlen=1000)
+        self._granted = 0
+        self._timed_out = 0
+        self._estimated_tokens = 0
+        self._actual_tokens = 0
+
+        if self.enabled:
+            logger.info(f"OpenAI rate scheduler enabled (rpm={self.rpm_limit or 'unlimited'}, "
+                        f"tpm={self.tpm_limit or 'unlimited'})")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._requests or self._tokens)
+
+    def acquire(self, user_id: Any, tokens: int, timeout: float = None, requests: int = 1) -> Optional[Permit]:
+        """
+        Block until the call fits in both buckets. Returns None after timeout
+        (default OPENAI_RATE_MAX_WAIT_SECONDS). requests=0 reserves tokens
+        only, for a user's share of a call another permit pays the request for.
+        """
+        if not self.enabled:
+            return Permit(user_id, tokens, requests=requests)
+        start = time.monotonic()
+        give_up = start + (self.max_wait if timeout is None else timeout)
+        with self._cond:
+            entry = self._waiting.push(user_id, None, cost=tokens)
+            while True:
+                now = time.monotonic()
+                wait = self._try_grant(entry, tokens, now, requests)
+                if wait == 0:
+                    return self._granted_permit(user_id, tokens, now - start, requests)
+                if now >= give_up:
+                    return self._give_up(entry, user_id)
+                self._cond.wait(min(wait, give_up - now))
+
+    async def acquire_async(self, user_id: Any, tokens: int, timeout: float = None) -> Optional[Permit]:
+        """acquire() for the event loop: polls instead of blocking the loop thread."""
+        if not self.enabled:
+            return Permit(user_id, tokens)
+        start = time.monotonic()
+        give_up = start + (self.max_wait if timeout is None else timeout)
+        with self._cond:
+            entry = self._waiting.push(user_id, None, cost=tokens)
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                wait = self._try_grant(entry, tokens, now)
+                if wait == 0:
+                    return self._granted_permit(user_id, tokens, now - start)
+                if now >= give_up:
+                    return self._give_up(entry, user_id)
+            await asyncio.sleep(min(wait, give_up - now, _POLL_SECONDS))
+
+    def try_acquire(self, user_id: Any, tokens: int) -> Optional[Permit]:
+        """A permit only if the call fits right now and nobody is waiting; never blocks. For optional calls."""
+        if not self.enabled:
+            return Permit(user_id, tokens)
+        with self._cond:
+            now = time.monotonic()
+            if len(self._waiting):
+                return None
+            if (self._requests and self._requests.wait_time(1, now) > 0) or \
+                    (self._tokens and self._tokens.wait_time(tokens, now) > 0):
+                return None
+            if self._requests:
+                self._requests.take(1)
+            if self._tokens:
+                self._tokens.take(tokens)
+            return self._granted_permit(user_id, tokens, 0.0)
+
+    def _try_grant(self, entry: list, tokens: int, now: float, requests: int = 1) -> float:
+        """Grant entry if it is next in fair order and fits; returns 0 when granted, else seconds to wait."""
+        if self._waiting.peek() is not entry:
+            return _POLL_SECONDS
+        wait = max(
+            self._requests.wait_time(requests, now) if self._requests else 0.0,
+            self._tokens.wait_time(tokens, now) if self._tokens else 0.0
+        )
+        if wait > 0:
+            return wait
+        self._waiting.pop()
+        if self._requests:
+            self._requests.take(requests)
+        if self._tokens:
+            self._tokens.take(tokens)
+        # The next waiter may fit straight away
+        self._cond.notify_all()
+        return 0
+
+    def _granted_permit(self, user_id: Any, tokens: int, wait: float, requests: int = 1) -> Permit:
+        self._granted += 1
+        self._waits.append(wait)
+        return Permit(user_id, tokens, wait, requests)
+
+    def _give_up(self, entry: list, user_id: Any) -> Optional[Permit]:
+        self._waiting.remove(entry)
+        self._timed_out += 1
+        self._cond.notify_all()
+        logger.warning(f"OpenAI rate budget exhausted, user {user_id} gave up waiting")
+        return None
+
+    def reconcile(self, permit: Permit, actual_tokens: Optional[int]) -> None:
+        """Settle a permit against the tokens the call really used (None keeps the estimate)."""
+        if not self.enabled or actual_tokens is None:
+            return
+        with self._cond:
+            self._estimated_tokens += permit.tokens
+            self._actual_tokens += actual_tokens
+            if self._tokens:
+                self._tokens.adjust(actual_tokens - permit.tokens)
+            self._cond.notify_all()
+
+    def release(self, permit: Permit) -> None:
+        """Return an unused permit, e.g. when the call was skipped after all."""
+        if not self.enabled:
+            return
+        with self._cond:
+            if self._requests:
+                self._requests.adjust(-permit.requests)
+            if self._tokens:
+                self._tokens.adjust(-permit.tokens)
+            self._cond.notify_all()
+
+    def headroom(self) -> Optional[float]:
+        """Fraction of the tighter of the RPM/TPM budgets still available, or None without limits."""
+        with self._cond:
+            now = time.monotonic()
+            levels = [1.0 - bucket.utilization(now) for bucket in (self._requests, self._tokens) if bucket]
+        return min(levels) if levels else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            waits = sorted(self._waits)
+            stats = {
+                "enabled": self.enabled,
+                "rpm_limit": self.rpm_limit,
+                "tpm_limit": self.tpm_limit,
+                "rpm_utilization": round(self._requests.utilization(now), 4) if self._requests else None,
+                "tpm_utilization": round(self._tokens.utilization(now), 4) if self._tokens else None,
+                "waiting": len(self._waiting),
+                "waiting_by_user": self._waiting.counts(),
+                "granted": self._granted,
+                "timed_out": self._timed_out,
+                "wait_p50": round(waits[len(waits) // 2], 3) if waits else 0.0,
+                "wait_p95": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 3) if waits else 0.0,
+                "wait_max": round(waits[-1], 3) if waits else 0.0,
+            }
+            if self._actual_tokens:
+                stats["estimate_ratio"] = round(self._estimated_tokens / self._actual_tokens, 3)
+            return stats
@@ -0,0 +1,136 @@
+import json
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, func, or_, select
+
+from ..models import db, PartnershipScenario, AnalysisJob, AnalysisResult
+
+SCENARIO_FIELDS = (
+    "id", "user_id", "brand_a", "brand_b", "partnership_type", "target_audience",
+    "budget_range", "status", "created_at", "updated_at"
+)
+LATEST_ANALYSIS_FIELD = "latest_analysis"
+FIELDS = SCENARIO_FIELDS + (LATEST_ANALYSIS_FIELD,)
+# Without ?fields= the listing keeps its original shape
+DEFAULT_FIELDS = SCENARIO_FIELDS
+
+
+class InvalidListingParams(ValueError):
+    """Malformed cursor or unknown field in a listing request."""
+
+
+def parse_fields(raw: Optional[str]) -> Sequence[str]:
+    if not raw:
+        return DEFAULT_FIELDS
+    fields = [field.strip() for field in raw.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise InvalidListingParams(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def encode_cursor(created_at: datetime, scenario_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), scenario_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, scenario_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(scenario_id)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidListingParams("Invalid cursor") from e
+
+
+def list_scenarios(user_id, limit: Optional[int] = None, cursor: Optional[str] = None,
+                   fields: Sequence[str] = DEFAULT_FIELDS,
+                   scenario_ids: Optional[Sequence[int]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One page of a user's scenarios, newest first, as (items, next_cursor).
+
+    Pages are keyset-paginated on (created_at, id), which the
+    ix_partnership_scenario_user_created index serves directly, so deep pages
+    cost the same as the first. Only the requested columns are loaded, and
+    latest_analysis (status and scores of the scenario's most recent job) is
+    joined into the same query rather than looked up per row. scenario_ids
+    restricts the listing to those scenarios.
+    """
+    scenario = PartnershipScenario
+    # The cursor needs id and created_at even when they are not returned
+    columns = {name: getattr(scenario, name) for name in ("id", "created_at")}
+    columns.update({name: getattr(scenario, name) for name in fields if name in SCENARIO_FIELDS})
+
+    page = select(*columns.values()).where(scenario.user_id == user_id)
+    if scenario_ids is not None:
+        page = page.where(scenario.id.in_(scenario_ids))
+    if cursor:
+        created_at, scenario_id = decode_cursor(cursor)
+        page = page.where(or_(
+            scenario.created_at < created_at,
+            and_(scenario.created_at == created_at, scenario.id < scenario_id)
+        ))
+    page = page.order_by(scenario.created_at.desc(), scenario.id.desc())
+    if limit:
+        # One extra row tells us whether there is a next page
+        page = page.limit(limit + 1)
+    page = page.subquery("page")
+
+    query = select(page)
+    with_latest = LATEST_ANALYSIS_FIELD in fields
+    if with_latest:
+        latest = (
+            select(AnalysisJob.scenario_id, func.max(AnalysisJob.id).label("job_pk"))
+            .where(AnalysisJob.scenario_id.in_(select(page.c.id)))
+            .group_by(AnalysisJob.scenario_id)
+            .subquery("latest")
+        )
+        query = (
+            select(
+                page,
+                AnalysisJob.job_id.label("latest_job_id"),
+                AnalysisJob.status.label("latest_status"),
+                AnalysisJob.completed_at.label("latest_completed_at"),
+                AnalysisResult.brand_alignment_score.label("latest_brand_alignment_score"),
+                AnalysisResult.roi_projection.label("latest_roi_projection"),
+                AnalysisResult.risk_level.label("latest_risk_level"),
+            )
+            .select_from(page)
+            .outerjoin(latest, latest.c.scenario_id == page.c.id)
+            .outerjoin(AnalysisJob, AnalysisJob.id == latest.c.job_pk)
+            .outerjoin(AnalysisResult, AnalysisResult.job_id == AnalysisJob.job_id)
+        )
+    query = query.order_by(page.c.created_at.desc(), page.c.id.desc())
+
+    rows = db.session.execute(query).mappings().all()
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+
+    return [_serialize(row, fields, with_latest) for row in rows], next_cursor
+
+
+def _serialize(row, fields: Sequence[str], with_latest: bool) -> Dict[str, Any]:
+    item = {}
+    for name in fields:
+        if name == LATEST_ANALYSIS_FIELD:
+            continue
+        value = row[name]
+        item[name] = value.isoformat() if isinstance(value, datetime) else value
+    if with_latest:
+        item[LATEST_ANALYSIS_FIELD] = None
+        if row["latest_job_id"]:
+            completed_at = row["latest_completed_at"]
+            item[LATEST_ANALYSIS_FIELD] = {
+                "job_id": row["latest_job_id"],
+                "status": row["latest_status"],
+                "completed_at": completed_at.isoformat() if completed_at else None,
+                "brand_alignment_score": row["latest_brand_alignment_score"],
+                "roi_projection": row["latest_roi_projection"],
+                "risk_level": row["latest_risk_level"],
+            }
+    return item
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import zlib
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from ..models import db, AnalysisResult, PartnershipScenario
+
+logger = logging.getLogger(__name__)
+
+# (field, feature prefix, weight); brands are order-insensitive and dominate
+FIELD_WEIGHTS = (
+    ("brands", "b", 1.0),
+    ("partnership_type", "t", 0.7),
+    ("target_audience", "a", 0.5),
+    ("budget_range", "r", 0.3),
+)
+
+
+def _features(text: str, prefix: str) -> List[str]:
+    """Character trigrams of each word plus the whole words, so "Louis Vuitton" ~ "Vuitton"."""
+    features = []
+    for word in text.lower().split():
+        features.append(f"{prefix}:{word}")
+        padded = f" {word} "
+        features.extend(f"{prefix}#{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+
+def embed(scenario: Dict[str, Any], dim: int) -> np.ndarray:
+    """
+    Hashed character n-gram embedding of a scenario: each field's features
+    are hashed (crc32, so vectors are stable across processes) into dim
+    signed buckets, normalized per field, weighted and L2-normalized.
+    """
+    fields = dict(scenario)
+    fields["brands"] = " ".join(sorted(filter(None, (scenario.get("brand_a"), scenario.get("brand_b")))))
+    vector = np.zeros(dim, dtype=np.float32)
+    for field, prefix, weight in FIELD_WEIGHTS:
+        features = _features(fields.get(field) or "", prefix)
+        if not features:
+            continue
+        scale = weight / np.sqrt(len(features))
+        for feature in features:
+            hashed = zlib.crc32(feature.encode())
+            vector[hashed % dim] += scale if hashed & 0x80000000 else -scale
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SimilarityIndex:
+    """
+    Brute-force cosine index over analyzed scenarios, held as one contiguous
+    float32 matrix with parallel scenario and user id arrays. Rows are
+    appended as new results appear (catch_up reads analysis_result past the
+    last indexed id, so results written by other processes show up too).
+    Ids are assigned at insert but become visible at commit, so with several
+    workers id N can commit after N+1 was indexed; so at most every
+    SIMILARITY_RESCAN_SECONDS a catch_up re-reads the last
+    SIMILARITY_RESCAN_IDS ids below the watermark too, and rows already
+    indexed are skipped. In between, a catch_up with nothing past the
+    watermark costs one max(id) query.
+
+    With SIMILARITY_INDEX_DIR set the arrays are saved as .npy files and
+    memory-mapped on the next start instead of being rebuilt.
+    """
+
+    def __init__(self, path: Optional[str] = None, dim: Optional[int] = None, save_every: Optional[int] = None):
+        self.path = path if path is not None else os.getenv("SIMILARITY_INDEX_DIR") or None
+        self.dim = dim or int(os.getenv("SIMILARITY_DIM", "256"))
+        self.save_every = save_every or int(os.getenv("SIMILARITY_SAVE_EVERY", "1000"))
+        self.rescan_ids = int(os.getenv("SIMILARITY_RESCAN_IDS", "500"))
+        self.rescan_seconds = float(os.getenv("SIMILARITY_RESCAN_SECONDS", "30"))
+        self._rescanned_at = None
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._scenario_ids = np.zeros(0, dtype=np.int64)
+        self._user_ids = np.zeros(0, dtype=np.int64)
+        self._count = 0
+        self._positions = {}
+        self.last_result_id = 0
+        self._unsaved = 0
+
+    def __len__(self):
+        return self._count
+
+    def _ensure_capacity(self, extra: int) -> None:
+        needed = self._count + extra
+        if needed <= len(self._vectors):
+            return
+        capacity = max(needed, 2 * len(self._vectors), 1024)
+        # Copying also moves a memory-mapped matrix into writable memory
+        for name, shape in (("_vectors", (capacity, self.dim)), ("_scenario_ids", (capacity,)), ("_user_ids", (capacity,))):
+            current = getattr(self, name)
+            grown = np.zeros(shape, dtype=current.dtype)
+            grown[:self._count] = current[:self._count]
+            setattr(self, name, grown)
+
+    def _append(self, rows: Iterable[Tuple[int, Dict[str, Any]]]) -> int:
+        """Add (result id, scenario dict) rows; scenarios already indexed are skipped."""
+        added = 0
+        for result_id, scenario in rows:
+            self.last_result_id = max(self.last_result_id, result_id)
+            if scenario["id"] in self._positions:
+                continue
+            self._ensure_capacity(1)
+            position = self._count
+            self._vectors[position] = embed(scenario, self.dim)
+            self._scenario_ids[position] = scenario["id"]
+            self._user_ids[position] = scenario["user_id"]
+            self._positions[scenario["id"]] = position
+            self._count += 1
+            added += 1
+        return added
+
+    def _new_rows(self, session: Session, after_id: int, chunk_size: int = 5000):
+        query = (
+            select(
+                AnalysisResult.id, PartnershipScenario.id, PartnershipScenario.user_id, PartnershipScenario.brand_a,
+                PartnershipScenario.brand_b, PartnershipScenario.partnership_type,
+                PartnershipScenario.target_audience, PartnershipScenario.budget_range,
+            )
+            .join(PartnershipScenario, PartnershipScenario.id == AnalysisResult.scenario_id)
+            .where(AnalysisResult.id > after_id)
+            .order_by(AnalysisResult.id)
+            .execution_options(yield_per=chunk_size)
+        )
+        keys = ("id", "user_id", "brand_a", "brand_b", "partnership_type", "target_audience", "budget_range")
+        for row in session.execute(query):
+            yield row[0], dict(zip(keys, row[1:]))
+
+    def catch_up(self) -> int:
+        """Index results committed since the last call. Needs an app context."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+            # A session of its own: callers such as the model router run mid-job and shouldn't
+            # be left holding a transaction
+            now = time.monotonic()
+            rescan = self._rescanned_at is None or now - self._rescanned_at >= self.rescan_seconds
+            with Session(db.engine) as session:
+                if rescan:
+                    added = self._append(self._new_rows(session, max(self.last_result_id - self.rescan_ids, 0)))
+                    self._rescanned_at = now
+                elif (session.scalar(select(func.max(AnalysisResult.id))) or 0) > self.last_result_id:
+                    added = self._append(self._new_rows(session, self.last_result_id))
+                else:
+                    added = 0
+            self._unsaved += added
+            if self.path and self._unsaved >= self.save_every:
+                self._save()
+        if added:
+            logger.info(f"Similarity index: added {added} scenarios, {self._count} total")
+        return added
+
+    def rebuild(self) -> int:
+        with self._lock:
+            self._reset()
+            self._loaded = True
+            with Session(db.engine) as session:
+                self._append(self._new_rows(session, 0))
+            if self.path:
+                self._save()
+        return self._count
+
+    def search(self, scenario: Dict[str, Any], user_id: int, k: int = 10) -> List[Tuple[int, float]]:
+        """Top-k (scenario id, cosine similarity) among the user's other analyzed scenarios."""
+        self.catch_up()
+        with self._lock:
+            count = self._count
+            vectors, scenario_ids, user_ids = self._vectors, self._scenario_ids, self._user_ids
+        if not count:
+            return []
+
+        rows = np.flatnonzero((user_ids[:count] == int(user_id)) & (scenario_ids[:count] != scenario["id"]))
+        if not len(rows):
+            return []
+        query = embed(scenario, self.dim)
+        if len(rows) * 2 < count:
+            # Gathering a user's rows is cheaper than scoring the whole matrix
+            scores = vectors[rows] @ query
+        else:
+            scores = (vectors[:count] @ query)[rows]
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(scenario_ids[rows[i]]), float(scores[i])) for i in top]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"scenarios": self._count, "dim": self.dim, "last_result_id": self.last_result_id,
+                "persisted": bool(self.path)}
+
+    def _files(self):
+        return {name: os.path.join(self.path, f"{name}.npy") for name in ("vectors", "scenario_ids", "user_ids")}
+
+    def _save(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        arrays = {"vectors": self._vectors, "scenario_ids": self._scenario_ids, "user_ids": self._user_ids}
+        for name, filename in self._files().items():
+            # Write and rename so a reader never maps a half-written file; the temp name is per
+            # process since every worker saves into the same directory
+            temp = f"{filename}.{os.getpid()}.tmp"
+            with open(temp, "wb") as output:
+                np.save(output, arrays[name][:self._count])
+            os.replace(temp, filename)
+        meta = os.path.join(self.path, "meta.json")
+        with open(f"{meta}.{os.getpid()}.tmp", "w") as output:
+            json.dump({"dim": self.dim, "count": self._count, "last_result_id": self.last_result_id}, output)
+        os.replace(f"{meta}.{os.getpid()}.tmp", meta)
+        self._unsaved = 0
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(os.path.join(self.path, "meta.json")):
+            return
+        try:
+            with open(os.path.join(self.path, "meta.json")) as meta_file:
+                meta = json.load(meta_file)
+            if meta["dim"] != self.dim:
+                logger.warning(f"Similarity index on disk has dim {meta['dim']}, expected {self.dim}; rebuilding")
+                return
+            arrays = {name: np.load(filename, mmap_mode="r") for name, filename in self._files().items()}
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load similarity index from {self.path}, rebuilding: {str(e)}")
+            return
+        count = min(meta["count"], *(len(array) for array in arrays.values()))
+        self._vectors = arrays["vectors"]
+        self._scenario_ids = arrays["scenario_ids"]
+        self._user_ids = arrays["user_ids"]
+        self._count = count
+        self._positions = {int(scenario_id): i for i, scenario_id in enumerate(self._scenario_ids[:count])}
+        self.last_result_id = meta["last_result_id"]
+        logger.info(f"Memory-mapped similarity index with {count} scenarios from {self.path}")
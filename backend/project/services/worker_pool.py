@@ -0,0 +1,123 @@
+import os
+import logging
+import threading
+from typing import Any, Callable, Dict
+
+from .fair_queue import FairQueue, load_user_weights
+from ..metrics import ANALYSIS_QUEUE_COMPLETED, ANALYSIS_QUEUE_FAILED, ANALYSIS_QUEUE_REJECTED
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the worker pool cannot admit another task."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Analysis queue is full")
+        self.retry_after = retry_after
+
+
+class WorkerPool:
+    """
+    Fixed-size pool of worker threads fed from a bounded in-process queue.
+    Submissions beyond the queue capacity are rejected with QueueFullError
+    so callers can answer 429 instead of piling up threads.
+
+    Tasks submitted with a key (the user id for analysis jobs) are started in
+    weighted fair order across keys rather than arrival order, so one user's
+    backlog doesn't hold up everyone else's jobs.
+    """
+
+    def __init__(self, workers: int = None, queue_size: int = None, retry_after: int = None, name: str = "analysis-worker"):
+        self.workers = workers or int(os.getenv("ANALYSIS_WORKERS", "4"))
+        self.queue_size = queue_size or int(os.getenv("ANALYSIS_QUEUE_SIZE", "100"))
+        self.retry_after = retry_after or int(os.getenv("ANALYSIS_RETRY_AFTER", "5"))
+        self.name = name
+
+        self._queue = FairQueue(load_user_weights())
+        self._not_empty = threading.Condition()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._shutdown = False
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        logger.info(f"Worker pool started with {self.workers} workers and queue size {self.queue_size}")
+
+    def submit(self, fn: Callable, *args, key: Any = None, **kwargs) -> None:
+        if self._shutdown:
+            raise RuntimeError("Worker pool is shut down")
+        with self._not_empty:
+            if len(self._queue) >= self.queue_size:
+                with self._lock:
+                    self._rejected += 1
+                    ANALYSIS_QUEUE_REJECTED.inc()
+                logger.warning(f"Worker pool saturated ({self.queue_size} queued), rejecting task")
+                raise QueueFullError(self.retry_after)
+            self._queue.push(key, (fn, args, kwargs))
+            self._not_empty.notify()
+
+    def queue_depth(self) -> int:
+        with self._not_empty:
+            return len(self._queue)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._not_empty:
+            queue_depth = len(self._queue)
+            queued_keys = len(self._queue.counts())
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "active": self._active,
+                "queue_depth": queue_depth,
+                "queued_users": queued_keys,
+                "queue_size": self.queue_size,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
+
+    def shutdown(self, wait: bool = True, timeout: float = 30.0) -> None:
+        """Stop accepting work, let queued tasks drain and join the workers."""
+        if self._shutdown:
+            return
+        self._shutdown = True
+        logger.info("Shutting down worker pool")
+        with self._not_empty:
+            # Workers drain the remaining tasks, then exit once the queue is empty
+            self._not_empty.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join(timeout)
+
+    def _worker_loop(self):
+        while True:
+            with self._not_empty:
+                while not len(self._queue) and not self._shutdown:
+                    self._not_empty.wait()
+                if not len(self._queue):
+                    return
+                fn, args, kwargs = self._queue.pop()
+
+            with self._lock:
+                self._active += 1
+            try:
+                fn(*args, **kwargs)
+                with self._lock:
+                    self._completed += 1
+                    ANALYSIS_QUEUE_COMPLETED.inc()
+            except Exception as e:
+                logger.error(f"Worker task failed: {str(e)}")
+                with self._lock:
+                    self._failed += 1
+                    ANALYSIS_QUEUE_FAILED.inc()
+            finally:
+                with self._lock:
+                    self._active -= 1
@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    """create_app against a throwaway SQLite file; keyword arguments are set as environment variables."""
+    def make(**env):
+        monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+        monkeypatch.setenv("AUTO_MIGRATE", "true")
+        monkeypatch.setenv("OPENAI_API_KEY", "")
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        from project import create_app
+        app = create_app()
+        # demo-login issues integer identities
+        app.config["JWT_VERIFY_SUB"] = False
+        return app
+    return make
+
+
+def login(app):
+    """(test client, auth headers, user id) for the demo user."""
+    client = app.test_client()
+    body = client.post("/api/auth/demo-login").get_json()
+    return client, {"Authorization": f"Bearer {body['access_token']}"}, body["user"]["id"]
+
+
+def add_job(app, client, headers, user_id, status="processing"):
+    """A scenario plus a job row in the given status that no worker will pick up."""
+    from project.models import db, AnalysisJob
+    scenario_id = client.post("/api/scenarios", headers=headers, json={
+        "brand_a": "Nike", "brand_b": "Supreme", "partnership_type": "Collaboration"
+    }).get_json()["id"]
+    with app.app_context():
+        job = AnalysisJob(job_id=str(uuid.uuid4()), scenario_id=scenario_id, user_id=user_id, status=status)
+        db.session.add(job)
+        db.session.commit()
+        return job.job_id
+
+
+ANALYSIS = {
+    "brand_alignment_score": 80, "audience_overlap_percentage": 60, "roi_projection": 140, "risk_level": "Low",
+    "key_risks": ["r"], "recommendations": ["x"], "market_insights": ["i"],
+}
+
+
+class FakeOpenAI:
+    """Stands in for OpenAIService: sleeps delays[model] seconds and records each call's model."""
+
+    model = "deep"
+    streaming = False
+
+    def __init__(self, delays=None, tokens=100):
+        self.delays = delays or {}
+        self.tokens = tokens
+        self.calls = []
+
+    def estimate_tokens(self, scenario_data):
+        return self.tokens
+
+    def estimate_packed_tokens(self, scenarios):
+        return self.tokens * len(scenarios)
+
+    def analyze_partnership(self, scenario_data, on_partial=None, timeout=None, model=None):
+        model = model or self.model
+        self.calls.append(model)
+        time.sleep(self.delays.get(model, 0))
+        return {"status": "success", "analysis": dict(ANALYSIS), "tokens_used": self.tokens, "analysis_duration": 0.0}
+
+    def analyze_packed(self, scenarios, timeout=None, model=None):
+        self.calls.append(("packed", len(scenarios)))
+        time.sleep(self.delays.get("packed", 0))
+        return {"status": "success", "tokens_used": self.tokens * len(scenarios),
+                "results": [{"status": "success", "analysis": dict(ANALYSIS), "tokens_used": self.tokens,
+                             "analysis_duration": 0.0} for _ in scenarios]}
+
+
+@pytest.fixture
+def make_hybrid(monkeypatch):
+    """HybridOpenAIService over a FakeOpenAI; keyword arguments are set as environment variables."""
+    def make(fake, **env):
+        monkeypatch.setenv("OPENAI_API_KEY", "sk-test-0000000000")
+        monkeypatch.setenv("OPENAI_MODEL", FakeOpenAI.model)
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        from project.services.hybrid_openai_service import HybridOpenAIService
+        service = HybridOpenAIService()
+        service.openai_service = fake
+        return service
+    return make
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from conftest import FakeOpenAI
+from project.services.analysis_packer import AnalysisPacker, PackFailed
+from project.services.openai_service import OpenAIService, _apportion
+
+
+def test_pack_held_back_when_one_members_budget_is_exhausted(make_hybrid):
+    fake = FakeOpenAI(tokens=100)
+    service = make_hybrid(fake, ANALYSIS_PACKING="true", OPENAI_TPM_LIMIT=150)
+    scenarios = [{"id": 1, "user_id": 1}, {"id": 2, "user_id": 2}]
+
+    # User 1's share fits, user 2's would take ~20 s to refill
+    assert service._acquire_pack_permits(scenarios, timeout=0.2) is None
+    # User 1's reservation went back to the bucket
+    assert service.rate_scheduler.try_acquire(3, 140) is not None
+
+    items = [(scenario, time.time() + 0.2, None) for scenario in scenarios]
+    with pytest.raises(PackFailed, match="rate_limited"):
+        service._run_pack(items, fake.model)
+    assert fake.calls == []
+
+
+def test_follower_stops_waiting_at_its_deadline():
+    release = threading.Event()
+    packer = AnalysisPacker(lambda items, model: release.wait(5), max_size=2, window=1)
+    outcome = {}
+
+    def lead():
+        try:
+            outcome["leader"] = packer.analyze({"id": 1}, deadline=time.time() + 10)
+        except PackFailed as e:
+            outcome["leader"] = e
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    with pytest.raises(PackFailed, match="deadline_exceeded"):
+        packer.analyze({"id": 2}, deadline=time.time() + 0.2)
+    assert time.monotonic() - started < 0.5
+    release.set()
+    leader.join()
+    # run_pack left both futures unset, so the leader falls back too
+    assert isinstance(outcome["leader"], PackFailed)
+
+
+def test_apportion_keeps_the_total():
+    assert _apportion(10, [1, 1, 1]) == [4, 3, 3]
+    assert _apportion(997, [120, 80, 301]) == [239, 159, 599]
+    assert _apportion(None, [1, 2]) == [0, 0]
+    assert _apportion(5, [0, 0]) == [3, 2]
+
+
+def test_demultiplex_by_scenario_number_then_position():
+    service = OpenAIService.__new__(OpenAIService)
+    content = '{"analyses": [{"roi_projection": 1}, {"scenario": 3, "roi_projection": 3}, "junk", {"scenario": 9}]}'
+    assert service._demultiplex(content, 3) == [{"roi_projection": 1}, None, {"scenario": 3, "roi_projection": 3}]
+    # A number that is already taken doesn't overwrite it
+    assert service._demultiplex('{"analyses": [{"scenario": 1, "a": 1}, {"scenario": 1, "a": 2}]}', 2) == \
+        [{"scenario": 1, "a": 1}, None]
+    assert service._demultiplex("not json", 2) == [None, None]
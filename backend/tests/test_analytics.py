@@ -0,0 +1,17 @@
+from conftest import login
+
+
+def test_brands_limit_is_validated_and_clamped(make_app, monkeypatch):
+    from project.routes import analytics
+
+    limits = []
+    monkeypatch.setattr(analytics, "portfolio_summary", lambda user_id, brand_limit, **kwargs: limits.append(brand_limit) or {})
+    app = make_app()
+    client, headers, _ = login(app)
+
+    response = client.get("/api/analytics?brands=lots", headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "brands must be an integer"
+    for brands in ("0", "-5", "1000", "7"):
+        assert client.get(f"/api/analytics?brands={brands}", headers=headers).status_code == 200
+    assert limits == [1, 1, 100, 7]
@@ -0,0 +1,69 @@
+import time
+
+from project.services.circuit_breaker import CircuitBreaker
+
+
+def make_breaker(**overrides):
+    settings = dict(window_seconds=60, min_requests=4, error_threshold=0.5, latency_threshold=5,
+                    cooldown=0.05, max_cooldown=0.15)
+    settings.update(overrides)
+    return CircuitBreaker("test", **settings)
+
+
+def test_opens_on_error_rate_once_window_has_enough_calls():
+    breaker = make_breaker()
+    for ok in (False, False, True):
+        breaker.record(ok, 0.1)
+    assert breaker.state == "closed"
+    breaker.record(False, 0.1)
+    assert breaker.state == "open"
+    assert breaker.allow() == (False, "circuit_open")
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_opens_on_p95_latency():
+    breaker = make_breaker()
+    for _ in range(4):
+        breaker.record(True, 6.0)
+    assert breaker.stats()["open_reason"] == "p95 latency 6.0s"
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = make_breaker(min_requests=1)
+    breaker.record(False, 0.1)
+    time.sleep(0.06)
+    assert breaker.allow() == (True, "half_open_trial")
+    assert breaker.allow() == (False, "circuit_half_open")
+
+    # A failed trial doubles the cooldown, up to the cap
+    breaker.record(False, 0.1)
+    assert breaker.stats()["cooldown_seconds"] == 0.1
+    time.sleep(0.11)
+    assert breaker.allow() == (True, "half_open_trial")
+    breaker.record(False, 0.1)
+    assert breaker.stats()["cooldown_seconds"] == 0.15
+
+    time.sleep(0.16)
+    assert breaker.allow()[0]
+    breaker.record(True, 0.1)
+    assert breaker.state == "closed"
+    assert breaker.stats()["window_requests"] == 0
+
+
+def test_released_trial_frees_the_slot():
+    breaker = make_breaker(min_requests=1)
+    breaker.record(False, 0.1)
+    time.sleep(0.06)
+    assert breaker.allow()[0]
+    breaker.release_trial()
+    assert breaker.allow() == (True, "half_open_trial")
+    assert breaker.state == "half_open"
+
+
+def test_latency_percentile_needs_min_samples():
+    breaker = make_breaker(latency_threshold=100)
+    for latency in (1.0, 2.0, 3.0):
+        breaker.record(True, latency)
+    assert breaker.latency_percentile(0.5) is None
+    breaker.record(True, 4.0)
+    assert breaker.latency_percentile(0.5) == 3.0
@@ -0,0 +1,44 @@
+from project.services.fair_queue import FairQueue, load_user_weights
+
+
+def drain(queue):
+    return [queue.pop() for _ in range(len(queue))]
+
+
+def test_backlogged_key_does_not_starve_others():
+    queue = FairQueue()
+    for i in range(4):
+        queue.push("heavy", f"h{i}")
+    queue.push("light", "l0")
+    assert drain(queue) == ["h0", "l0", "h1", "h2", "h3"]
+
+
+def test_weights_and_costs_set_the_share():
+    queue = FairQueue({"2": 2.0})
+    for i in range(4):
+        queue.push(1, f"a{i}")
+        queue.push(2, f"b{i}")
+    assert drain(queue) == ["b0", "a0", "b1", "b2", "a1", "b3", "a2", "a3"]
+
+    queue = FairQueue()
+    queue.push("big", "big", cost=10)
+    queue.push("small", "s0")
+    queue.push("small", "s1")
+    assert drain(queue) == ["s0", "s1", "big"]
+
+
+def test_removed_entries_are_skipped():
+    queue = FairQueue()
+    first = queue.push("a", "a0")
+    queue.push("b", "b0")
+    queue.remove(first)
+    queue.remove(first)
+    assert len(queue) == 1
+    assert queue.counts() == {"b": 1}
+    assert queue.peek()[3] == "b0"
+    assert drain(queue) == ["b0"]
+
+
+def test_load_user_weights(monkeypatch):
+    monkeypatch.setenv("ANALYSIS_USER_WEIGHTS", "12:3, 40:0, bad, 7:x")
+    assert load_user_weights() == {"12": 3.0, "40": 0.01}
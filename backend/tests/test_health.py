@@ -0,0 +1,14 @@
+def test_health_and_metrics_leave_openai_service_unbuilt(make_app):
+    app = make_app()
+    client = app.test_client()
+
+    health = client.get("/api/health").get_json()
+    assert health["status"] == "healthy"
+    assert health["openai_circuit"] is None and health["model_routing"] is None
+    assert client.get("/api/metrics").status_code == 200
+    assert not app.config["openai_service"].built
+
+    app.config["openai_service"].get()
+    health = client.get("/api/health").get_json()
+    assert health["openai_circuit"]["state"] == "closed"
+    assert b"impactlens_openai_circuit_state" in client.get("/api/metrics").data
@@ -0,0 +1,25 @@
+from conftest import FakeOpenAI
+
+SCENARIO = {"id": 1, "user_id": 7, "brand_a": "Nike", "brand_b": "Supreme", "partnership_type": "Collaboration"}
+HEDGE_ENV = {"ANALYSIS_HEDGE_MODE": "model", "OPENAI_HEDGE_MODEL": "hedge", "ANALYSIS_HEDGE_DELAY_SECONDS": "0.1"}
+
+
+def test_model_hedge_is_charged_to_the_rate_budget(make_hybrid):
+    fake = FakeOpenAI(delays={"deep": 0.5})
+    service = make_hybrid(fake, OPENAI_RPM_LIMIT=10, **HEDGE_ENV)
+
+    result = service.analyze_partnership(SCENARIO)
+    assert result["service_reason"] == "hedge_model"
+    assert fake.calls == ["deep", "hedge"]
+    assert service.rate_scheduler.stats()["granted"] == 2
+
+
+def test_model_hedge_skipped_without_budget(make_hybrid):
+    fake = FakeOpenAI(delays={"deep": 0.5})
+    # The primary call takes the only request of the minute
+    service = make_hybrid(fake, OPENAI_RPM_LIMIT=1, **HEDGE_ENV)
+
+    result = service.analyze_partnership(SCENARIO)
+    assert result["service_used"] == "openai"
+    assert result["service_reason"] != "hedge_model"
+    assert fake.calls == ["deep"]
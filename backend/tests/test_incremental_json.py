@@ -0,0 +1,38 @@
+import json
+
+from project.services.incremental_json import IncrementalObjectParser
+
+DOCUMENT = {
+    "brand_alignment_score": 82,
+    "risk_level": "Medium",
+    "key_risks": ["Pricing {clash}", "Quote \" and , comma"],
+    "nested": {"a": [1, {"b": "}"}]},
+    "market_insights": ["Gen Z"],
+}
+
+
+def test_fields_complete_as_they_arrive_whatever_the_chunking():
+    text = "```json\n" + json.dumps(DOCUMENT) + "\n```"
+    for size in (1, 3, 17, len(text)):
+        parser = IncrementalObjectParser()
+        completed = []
+        for start in range(0, len(text), size):
+            completed.extend(parser.feed(text[start:start + size]))
+        assert completed == list(DOCUMENT.items())
+        assert parser.fields == DOCUMENT
+        assert parser.done and not parser.errors
+
+
+def test_field_reported_before_the_object_ends():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"risk_level": "Low", "key_ri') == [("risk_level", "Low")]
+    assert not parser.done
+    assert parser.feed('sks": []}') == [("key_risks", [])]
+
+
+def test_bad_value_is_reported_without_hiding_the_rest():
+    parser = IncrementalObjectParser()
+    parser.feed('{"score": 8O, "risk_level": "High"} trailing')
+    assert parser.fields == {"risk_level": "High"}
+    assert set(parser.errors) == {"score"}
+    assert parser.done
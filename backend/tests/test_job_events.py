@@ -0,0 +1,53 @@
+import json
+import queue
+from types import SimpleNamespace
+
+from project.services.job_events import MAX_NOTIFY_BYTES, JobEventBus, PostgresNotifier
+
+
+def make_notifier():
+    # Without __init__, so no listener or sender thread touches a database
+    notifier = PostgresNotifier.__new__(PostgresNotifier)
+    notifier.bus = JobEventBus()
+    notifier.origin = "here"
+    notifier._outbox = queue.Queue()
+    return notifier
+
+
+def test_bus_delivers_to_job_subscribers_only():
+    bus = JobEventBus()
+    mine, other = bus.subscribe("a"), bus.subscribe("b")
+    bus.publish("a", {"status": "processing", "progress": 30})
+    assert mine.get_nowait() == {"status": "processing", "progress": 30, "job_id": "a"}
+    assert other.empty()
+    bus.unsubscribe("a", mine)
+    bus.unsubscribe("b", other)
+    assert bus.subscriber_count() == 0
+
+
+def test_relayed_events_drop_partial_and_fit_notify_limit():
+    notifier = make_notifier()
+    notifier.publish("a", {"job_id": "a", "status": "processing", "progress": 50, "stage": "streaming",
+                           "partial": {"key_risks": ["x" * 20000]}})
+    relayed = json.loads(notifier._outbox.get_nowait())["event"]
+    assert relayed == {"job_id": "a", "status": "processing", "progress": 50, "stage": "streaming"}
+
+    notifier.publish("a", {"job_id": "a", "status": "failed", "progress": 30, "error": "e" * 20000})
+    payload = notifier._outbox.get_nowait()
+    assert len(payload.encode()) <= MAX_NOTIFY_BYTES
+    assert json.loads(payload)["event"] == {"job_id": "a", "status": "failed", "progress": 30}
+
+
+def test_notifications_from_psycopg3_connection():
+    notifies = [SimpleNamespace(payload="one"), SimpleNamespace(payload="two")]
+    connection = SimpleNamespace(notifies=lambda timeout: iter(notifies))
+    assert list(PostgresNotifier._notifications(connection, 0.1)) == ["one", "two"]
+
+
+def test_handle_skips_own_events():
+    notifier = make_notifier()
+    subscription = notifier.bus.subscribe("a")
+    notifier._handle(json.dumps({"origin": "here", "job_id": "a", "event": {"status": "processing"}}))
+    assert subscription.empty()
+    notifier._handle(json.dumps({"origin": "elsewhere", "job_id": "a", "event": {"status": "completed"}}))
+    assert subscription.get_nowait() == {"status": "completed"}
@@ -0,0 +1,44 @@
+from sqlalchemy import text
+
+from conftest import add_job, login
+
+
+def test_open_stream_holds_no_connection(make_app):
+    from project.models import db
+
+    app = make_app(DB_POOL_SIZE=1, DB_MAX_OVERFLOW=0, DB_POOL_TIMEOUT=1, SSE_KEEPALIVE_SECONDS=0.2)
+    client, headers, user_id = login(app)
+    job_id = add_job(app, client, headers, user_id)
+    with app.app_context():
+        pool = db.engine.pool
+
+    stream = app.test_client().get(f"/api/jobs/{job_id}/events", headers=headers, buffered=False)
+    chunks = iter(stream.response)
+    assert b'"status": "processing"' in next(chunks)
+    assert pool.checkedout() == 0
+    # The keep-alive re-reads the job status from the database
+    assert next(chunks).startswith(b": keep-alive")
+    assert pool.checkedout() == 0
+
+    # The stream is suspended between events; the only connection is free for everyone else
+    with app.app_context():
+        assert db.session.execute(text("SELECT 1")).scalar() == 1
+    stream.close()
+
+
+def test_stream_and_token_are_owner_only(make_app):
+    from flask_jwt_extended import create_access_token
+
+    app = make_app()
+    client, headers, user_id = login(app)
+    job_id = add_job(app, client, headers, user_id, status="completed")
+    with app.app_context():
+        other = {"Authorization": f"Bearer {create_access_token(identity=user_id + 1)}"}
+
+    assert client.post(f"/api/jobs/{job_id}/events/token", headers=other).status_code == 404
+    assert client.get(f"/api/jobs/{job_id}/events", headers=other).status_code == 404
+
+    token = client.post(f"/api/jobs/{job_id}/events/token", headers=headers).get_json()["stream_token"]
+    assert client.get(f"/api/jobs/{job_id}/events?jwt={token}").status_code == 200
+    # A stream token opens that stream only
+    assert client.get("/api/scenarios", headers={"Authorization": f"Bearer {token}"}).status_code == 401
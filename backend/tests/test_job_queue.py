@@ -0,0 +1,83 @@
+import uuid
+from datetime import datetime, timedelta
+
+from conftest import add_job, login
+
+
+def setup(make_app, jobs=2, **job_fields):
+    """An app with `jobs` pending jobs, created a second apart; returns (app, job ids oldest first, user id)."""
+    from project.models import db, AnalysisJob
+    app = make_app()
+    client, headers, user_id = login(app)
+    job_ids = [add_job(app, client, headers, user_id, status="pending") for _ in range(jobs)]
+    with app.app_context():
+        for age, job_id in enumerate(reversed(job_ids)):
+            job = db.session.query(AnalysisJob).filter_by(job_id=job_id).one()
+            job.created_at = datetime.utcnow() - timedelta(seconds=age + 1)
+            for name, value in job_fields.items():
+                setattr(job, name, value)
+        db.session.commit()
+    return app, job_ids, user_id
+
+
+def expire(job_id):
+    from project.models import db, AnalysisJob
+    job = db.session.query(AnalysisJob).filter_by(job_id=job_id).one()
+    job.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_claims_oldest_first_each_job_once(make_app):
+    from project.services.job_queue import DatabaseJobQueue
+
+    app, job_ids, _ = setup(make_app)
+    queue = DatabaseJobQueue(lease_seconds=60, max_attempts=3)
+    with app.app_context():
+        assert queue.claim("w1") == job_ids[0]
+        assert queue.claim("w2") == job_ids[1]
+        assert queue.claim("w3") is None
+        assert queue.heartbeat(job_ids[0], "w1")
+        assert not queue.heartbeat(job_ids[0], "w2")
+        assert queue.stats()["processing"] == 2
+
+
+def test_expired_lease_is_reclaimed_then_given_up(make_app):
+    from project.models import db, AnalysisJob
+    from project.services.job_queue import DatabaseJobQueue
+
+    app, (job_id,), _ = setup(make_app, jobs=1)
+    queue = DatabaseJobQueue(lease_seconds=60, max_attempts=2)
+    with app.app_context():
+        assert queue.claim("w1") == job_id
+        expire(job_id)
+        assert queue.stats()["expired_leases"] == 1
+        assert queue.claim("w2") == job_id
+        # The worker that lost its lease can no longer extend it
+        assert not queue.heartbeat(job_id, "w1")
+
+        expire(job_id)
+        assert queue.claim("w3") is None
+        job = db.session.query(AnalysisJob).filter_by(job_id=job_id).one()
+        assert (job.status, job.attempts) == ("failed", 3)
+        assert job.error_message == "Exceeded maximum delivery attempts"
+
+
+def test_group_concurrency_limits_claims(make_app):
+    from project.models import db, AnalysisJobGroup
+    from project.services.job_queue import DatabaseJobQueue
+
+    group_id = str(uuid.uuid4())
+    app, job_ids, user_id = setup(make_app, jobs=3, group_id=group_id)
+    queue = DatabaseJobQueue(lease_seconds=60, max_attempts=3)
+    with app.app_context():
+        db.session.add(AnalysisJobGroup(group_id=group_id, user_id=user_id, max_concurrency=2))
+        db.session.commit()
+        assert queue.claim("w1") == job_ids[0]
+        assert queue.claim("w2") == job_ids[1]
+        assert queue.claim("w3") is None
+        expire(job_ids[0])
+        # An expired lease no longer counts against the group, and its job is claimable again
+        expire(job_ids[1])
+        assert queue.claim("w3") == job_ids[0]
+        assert queue.claim("w4") == job_ids[1]
+        assert queue.claim("w5") is None
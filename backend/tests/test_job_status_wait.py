@@ -0,0 +1,27 @@
+import threading
+import time
+
+from conftest import add_job, login
+
+
+def test_long_poll_releases_its_connection(make_app):
+    app = make_app(DB_POOL_SIZE=1, DB_MAX_OVERFLOW=0, DB_POOL_TIMEOUT=1)
+    client, headers, user_id = login(app)
+    job_id = add_job(app, client, headers, user_id)
+
+    polled = {}
+    poller = threading.Thread(target=lambda: polled.update(
+        response=app.test_client().get(f"/api/jobs/{job_id}?wait=3", headers=headers)
+    ))
+    poller.start()
+    time.sleep(0.5)
+
+    # With the poller holding the only connection this would time out on the pool
+    started = time.monotonic()
+    response = client.get("/api/scenarios", headers=headers)
+    assert response.status_code == 200
+    assert time.monotonic() - started < 1
+
+    poller.join()
+    assert polled["response"].status_code == 200
+    assert polled["response"].get_json()["status"] == "processing"
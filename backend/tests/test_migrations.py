@@ -0,0 +1,30 @@
+import sqlite3
+
+from sqlalchemy import inspect
+
+
+def test_upgrade_adds_missing_columns_and_indexes(make_app, tmp_path):
+    # analysis_job as it was before leases, coalescing and groups
+    with sqlite3.connect(tmp_path / "test.db") as connection:
+        connection.execute(
+            "CREATE TABLE analysis_job (id INTEGER PRIMARY KEY, job_id VARCHAR(36) NOT NULL UNIQUE, "
+            "scenario_id INTEGER NOT NULL, user_id INTEGER NOT NULL, status VARCHAR(20), created_at DATETIME)"
+        )
+        connection.execute("INSERT INTO analysis_job (job_id, scenario_id, user_id, status) VALUES ('old', 1, 1, 'completed')")
+
+    app = make_app()
+    from project.migrations import upgrade
+    from project.models import db, AnalysisJob
+
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = {column["name"] for column in inspector.get_columns("analysis_job")}
+        assert {column.name for column in AnalysisJob.__table__.columns} <= columns
+        indexes = {index["name"] for index in inspector.get_indexes("analysis_job")}
+        assert {index.name for index in AnalysisJob.__table__.indexes} <= indexes
+        indexes = {index["name"] for index in inspector.get_indexes("partnership_scenario")}
+        assert "ix_partnership_scenario_user_created" in indexes
+
+        # Existing rows survive and a second run is a no-op
+        upgrade()
+        assert db.session.query(AnalysisJob).filter_by(job_id="old").one().status == "completed"
@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from project.services.model_router import ModelRouter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_router(monkeypatch, probe_rate="0"):
+    monkeypatch.setenv("MODEL_ROUTING", "true")
+    monkeypatch.setenv("MODEL_ROUTER_LATENCY_SLO", "5")
+    monkeypatch.setenv("MODEL_ROUTER_MIN_SAMPLES", "3")
+    monkeypatch.setenv("MODEL_ROUTER_LATENCY_WINDOW", "60")
+    monkeypatch.setenv("MODEL_ROUTER_PROBE_RATE", probe_rate)
+    monkeypatch.delenv("MODEL_ROUTER_USER_SLOS", raising=False)
+    router = ModelRouter("deep", fast_model="fast")
+    router.clock = FakeClock()
+    return router
+
+
+# Names both audience and budget, so it goes to the deep model unless a latency rule fires
+DETAILED = {"user_id": 1, "target_audience": "Gen Z", "budget_range": "$10k-$50k"}
+
+
+def test_latency_slo_expires_with_window(monkeypatch):
+    router = make_router(monkeypatch)
+    for _ in range(5):
+        router.observe("deep", 30.0)
+    assert router.route(DETAILED) == ("fast", "latency_slo")
+
+    # No deep calls while the rule holds; once the slow samples age out, routing recovers
+    router.clock.now += 61
+    assert router.latency_percentile("deep", 0.95) is None
+    assert router.route(DETAILED) == ("deep", "detailed_brief")
+
+
+def test_probe_reaches_deep_model_while_slo_active(monkeypatch):
+    router = make_router(monkeypatch, probe_rate="1")
+    for _ in range(5):
+        router.observe("deep", 30.0)
+    assert router.route(DETAILED) == ("deep", "latency_probe")
+
+    # Fast probe results bring the p95 back under the SLO
+    router.probe_rate = 0
+    for _ in range(200):
+        router.observe("deep", 1.0)
+    assert router.route(DETAILED) == ("deep", "detailed_brief")
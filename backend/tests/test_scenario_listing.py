@@ -0,0 +1,62 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import add_job, login
+from project.services.scenario_listing import InvalidListingParams, decode_cursor, encode_cursor, parse_fields
+
+
+def test_cursor_round_trip_and_rejects_garbage():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+    for bad in ("!!!", "bm90IGpzb24", encode_cursor(created_at, 1)[:-4]):
+        with pytest.raises(InvalidListingParams):
+            decode_cursor(bad)
+    with pytest.raises(InvalidListingParams, match="Unknown fields: secret"):
+        parse_fields("id,secret")
+
+
+def test_pages_cover_every_scenario_once_even_with_equal_timestamps(make_app):
+    from project.models import db, PartnershipScenario
+
+    app = make_app()
+    client, headers, _ = login(app)
+    for i in range(7):
+        client.post("/api/scenarios", headers=headers, json={"brand_a": f"A{i}", "brand_b": "B", "partnership_type": "Collaboration"})
+    with app.app_context():
+        # Ties on created_at are broken by id
+        db.session.query(PartnershipScenario).update({"created_at": datetime(2024, 1, 1)})
+        db.session.commit()
+        expected = [row.id for row in db.session.query(PartnershipScenario.id).order_by(PartnershipScenario.id.desc())]
+
+    seen, cursor = [], None
+    while True:
+        response = client.get("/api/scenarios", headers=headers,
+                              query_string={"limit": 3, "fields": "id", **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        page = response.get_json()
+        assert all(set(item) == {"id"} for item in page)
+        seen += [item["id"] for item in page]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == expected
+
+    assert client.get("/api/scenarios?limit=3&cursor=garbage", headers=headers).status_code == 400
+
+
+def test_latest_analysis_is_the_newest_job(make_app):
+    from project.models import db, AnalysisJob
+
+    app = make_app()
+    client, headers, user_id = login(app)
+    first = add_job(app, client, headers, user_id, status="failed")
+    with app.app_context():
+        scenario_id = db.session.query(AnalysisJob.scenario_id).filter_by(job_id=first).scalar()
+        db.session.add(AnalysisJob(job_id="newest", scenario_id=scenario_id, user_id=user_id, status="processing"))
+        db.session.commit()
+
+    listing = client.get("/api/scenarios?fields=id,latest_analysis", headers=headers).get_json()
+    latest = {item["id"]: item["latest_analysis"] for item in listing}
+    assert latest[scenario_id]["job_id"] == "newest"
+    assert latest[scenario_id]["status"] == "processing"
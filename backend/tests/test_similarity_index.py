@@ -0,0 +1,54 @@
+import os
+
+from conftest import add_job, login
+
+
+def add_result(app, client, headers, user_id, result_id=None, brand_b="Supreme"):
+    """A completed job and its analysis_result row; returns the scenario id."""
+    from project.models import db, AnalysisJob, AnalysisResult
+    job_id = add_job(app, client, headers, user_id, status="completed")
+    with app.app_context():
+        job = db.session.query(AnalysisJob).filter_by(job_id=job_id).one()
+        db.session.add(AnalysisResult(id=result_id, scenario_id=job.scenario_id, job_id=job_id, risk_level="Low"))
+        db.session.commit()
+        return job.scenario_id
+
+
+def test_catch_up_rescans_on_interval(make_app, monkeypatch):
+    from project.services.similarity_index import SimilarityIndex
+
+    app = make_app()
+    client, headers, user_id = login(app)
+    monkeypatch.setenv("SIMILARITY_RESCAN_SECONDS", "3600")
+    index = SimilarityIndex(path="")
+    add_result(app, client, headers, user_id, result_id=10)
+    with app.app_context():
+        assert index.catch_up() == 1
+
+        # Committed late below the watermark: left for the next rescan
+        add_result(app, client, headers, user_id, result_id=5)
+        assert index.catch_up() == 0
+        # Past the watermark: picked up right away
+        add_result(app, client, headers, user_id, result_id=11)
+        assert index.catch_up() == 1
+
+        index.rescan_seconds = 0
+        assert index.catch_up() == 1
+        assert len(index) == 3
+
+
+def test_save_and_reload(make_app, tmp_path):
+    from project.services.similarity_index import SimilarityIndex
+
+    app = make_app()
+    client, headers, user_id = login(app)
+    scenario_id = add_result(app, client, headers, user_id)
+    directory = str(tmp_path / "index")
+    with app.app_context():
+        assert SimilarityIndex(path=directory).rebuild() == 1
+        assert not [name for name in os.listdir(directory) if name.endswith(".tmp")]
+
+        reloaded = SimilarityIndex(path=directory)
+        assert reloaded.catch_up() == 0
+        assert len(reloaded) == 1
+        assert reloaded.search({"id": -1, "brand_a": "Nike", "brand_b": "Supreme"}, user_id)[0][0] == scenario_id
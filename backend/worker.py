@@ -0,0 +1,17 @@
+import signal
+from project import create_app
+from project.services.job_queue import QueueWorker
+
+app = create_app()
+
+if __name__ == "__main__":
+    job_service = app.config["job_service"]
+    if not job_service.job_queue:
+        raise SystemExit("worker.py requires JOB_QUEUE_MODE=database")
+
+    worker = QueueWorker(app, job_service)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+
+    print(f"🛠️ Starting ImpactLens analysis worker with {worker.concurrency} threads")
+    worker.run()